@@ -0,0 +1,29 @@
+from models.database import Base, sessionmanager
+from sqlalchemy import select
+import asyncio, sys
+
+# python backfill_simulation_rollups.py [--all]
+# compute rollup for every simulation that don't have one yet (--all => recompute every simulation)
+async def backfill_simulation_rollups(recompute_all: bool):
+    from models.models import Simulation, SimulationRollup
+    from service.simulation_services import TERMINATED_STATES
+    from utils.rollup import build_simulation_rollup_from_store, save_simulation_rollup
+    async with sessionmanager.connect() as conn:
+        # create simulation_rollups table on database that created before it exist
+        await conn.run_sync(Base.metadata.create_all)
+    async with sessionmanager.session() as db_session:
+        query = select(Simulation.id).where(Simulation.state.in_(TERMINATED_STATES))
+        if not recompute_all:
+            query = query.where(Simulation.id.not_in(select(SimulationRollup.simulation_id)))
+        simulation_ids = (await db_session.scalars(query.order_by(Simulation.id))).all()
+        for simulation_id in simulation_ids:
+            simulation = await db_session.get(Simulation, simulation_id)
+            rollup_data = build_simulation_rollup_from_store(simulation.scenario_snapshot, simulation.simulation_data, simulation.sample_store_path)
+            await save_simulation_rollup(db_session, simulation, rollup_data)
+            # release the raw data before moving to next simulation
+            db_session.expunge(simulation)
+            print(f"simulation {simulation_id}: rollup saved")
+        print(f"{len(simulation_ids)} simulations backfilled")
+    await sessionmanager.close()
+
+asyncio.run(backfill_simulation_rollups("--all" in sys.argv[1:]))
@@ -0,0 +1,56 @@
+import os, sys, time, asyncio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import aiohttp
+from aiohttp import web
+from utils.agent_client import AgentClient
+
+# python benchmark/bench_agent_client.py [n_agents] [n_rounds]
+# stub agents on 127.0.0.1, every round poll /simulation/state of every agent at the same time (like simulation_tasks)
+# compare new ClientSession per request (old post_request/get_request) with one shared AgentClient
+
+BASE_PORT = 18000
+
+async def start_stub_agents(n_agents: int):
+    async def state(request):
+        return web.json_response({"state": "running", "new_state_message": ""})
+    app = web.Application()
+    app.router.add_get("/simulation/state", state)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    for i in range(n_agents):
+        await web.TCPSite(runner, "127.0.0.1", BASE_PORT + i).start()
+    return runner
+
+async def get_with_new_session(url: str):
+    async with aiohttp.ClientSession() as session:
+        response = await session.get(url=url)
+        return (await response.json(content_type=None)), str(response.url)
+
+async def run_rounds(get, urls: list, n_rounds: int):
+    begin = time.perf_counter()
+    for _ in range(n_rounds):
+        results = await asyncio.gather(*[get(url) for url in urls], return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise errors[0]
+    return len(urls) * n_rounds / (time.perf_counter() - begin)
+
+async def main(n_agents: int, n_rounds: int):
+    runner = await start_stub_agents(n_agents)
+    urls = [f"http://127.0.0.1:{BASE_PORT + i}/simulation/state" for i in range(n_agents)]
+    try:
+        new_session_rate = await run_rounds(get_with_new_session, urls, n_rounds)
+        client = AgentClient()
+        await client.start()
+        shared_rate = await run_rounds(lambda url: client.get(url), urls, n_rounds)
+        await client.close()
+    finally:
+        await runner.cleanup()
+    print(f"{n_agents} stub agents, {n_rounds} polling rounds")
+    print(f"{'new ClientSession per request':<35} {new_session_rate:10.1f} req/s")
+    print(f"{'shared AgentClient (keep-alive)':<35} {shared_rate:10.1f} req/s")
+
+if __name__ == "__main__":
+    n_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    asyncio.run(main(n_agents, n_rounds))
@@ -0,0 +1,58 @@
+import os, sys, time, random, asyncio
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.fanout import fan_out
+from utils.agent_events import AgentEventHub
+
+# python benchmark/bench_agent_events.py [n_agents] [poll_interval]
+# one "wait until every agent is done" phase (like ap ready_to_use / simulation finish), agents get ready at random time
+# polling only vs agents pushing their state to /agent/events (polling kept as fallback): detection delay and request count
+# time is scaled down (1 unit = 0.1 s) so it finish quickly
+
+SCALE = 0.1
+READY_WITHIN = 10 # agent is done at random time in [0, READY_WITHIN) units
+PUSHED_POLL_INTERVAL = 15
+
+async def run_phase(n_agents: int, poll_interval: float, push: bool):
+    hub = AgentEventHub()
+    targets = {f"10.0.0.{k}": None for k in range(n_agents)}
+    listener = hub.listen(list(targets), lambda control_ip, message, level: None)
+    # wall clock, same as AgentOutcome.finished_at
+    begin = time.time()
+    ready_at = {control_ip: begin + random.uniform(0, READY_WITHIN) * SCALE for control_ip in targets}
+    requests = {"n": 0}
+
+    async def send(control_ip, timeout):
+        requests["n"] += 1
+        await asyncio.sleep(0.001)
+        return ("finish" if time.time() >= ready_at[control_ip] else "running"), "poll"
+
+    async def agent(control_ip):
+        await asyncio.sleep(ready_at[control_ip] - time.time())
+        hub.publish(control_ip, "simulation_state", "finish")
+
+    agents = [asyncio.create_task(agent(control_ip)) for control_ip in targets] if push else []
+    outcomes = await fan_out(
+        targets,
+        send,
+        is_done=lambda result: result[0] == "finish",
+        poll_interval=poll_interval * SCALE,
+        pushed=listener.pushed("simulation_state") if push else None,
+        pushed_poll_interval=PUSHED_POLL_INTERVAL * SCALE,
+    )
+    await asyncio.gather(*agents)
+    listener.close()
+    delays = sorted(outcome.finished_at - ready_at[control_ip] for control_ip, outcome in outcomes.items())
+    phase_delay = max(outcome.finished_at for outcome in outcomes.values()) - max(ready_at.values())
+    return delays[len(delays)//2] / SCALE, phase_delay / SCALE, requests["n"]
+
+async def main(n_agents: int, poll_interval: float):
+    print(f"{n_agents} agents, poll every {poll_interval} units, done within {READY_WITHIN} units")
+    print(f"{'':<10} {'median delay':>14} {'phase delay':>14} {'requests':>10}   (delay in units, after agent is done)")
+    for name, push in [("polling", False), ("push", True)]:
+        median_delay, phase_delay, requests = await run_phase(n_agents, poll_interval, push)
+        print(f"{name:<10} {median_delay:14.3f} {phase_delay:14.3f} {requests:>10}")
+
+if __name__ == "__main__":
+    n_agents = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    poll_interval = float(sys.argv[2]) if len(sys.argv) > 2 else 2
+    asyncio.run(main(n_agents, poll_interval))
@@ -0,0 +1,85 @@
+import os, sys, time, random
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.analysis import udp_samples_to_columns, rate_samples_to_columns, per_second_udp_metrics, rolling_data_rate
+
+# python benchmark/bench_analysis.py [n_samples]
+# compare the old per-sample loops (that get_simulation use to run) with utils.analysis
+
+def legacy_udp_lost_and_latency(samples):
+    until = 0; expected_seq=0; tmp_latency_data = []; tmp_lost_data = []
+    for data in samples:
+        if data[0] >= until:
+            if until > 0:
+                tmp_latency_data.append((data[0], sum_latency/cnt))
+                tmp_lost_data.append((data[0], lost))
+            cnt = 0; lost = 0; sum_latency = 0; until = data[0] + 1
+        sum_latency += data[2][1]
+        lost += data[1] - expected_seq
+        expected_seq = data[1] + 1
+        cnt += 1
+    return {"lost_count": tmp_lost_data, "average_latency": tmp_latency_data}
+
+def legacy_average_data_rates(server_data):
+    tmp_data_rates = []
+    if len(server_data) > 0:
+        start_time = server_data[0][0]
+        data_rate_sum = server_data[0][1]/(server_data[0][0] - server_data[0][2])
+        cnt = 1
+        tmp_data_rates.append((server_data[0][0], data_rate_sum/cnt))
+        now = start_time + 1
+    for data in server_data:
+        if data[0] >= now:
+            tmp_data_rates.append((now, data_rate_sum/cnt))
+            now += 1
+            while data[0] - now >= 1:
+                tmp_data_rates.append((now, data_rate_sum/cnt))
+                now += 1
+        data_rate_sum += data[1]/(data[0] - data[2])
+        cnt += 1
+        if data == server_data[-1]:
+            tmp_data_rates.append((now, data_rate_sum/cnt))
+    return tmp_data_rates
+
+def synthetic_udp_samples(n, interval=0.01, loss_rate=0.01):
+    samples = []; seq = 0; start = time.time()
+    for i in range(n):
+        seq += 2 if random.random() < loss_rate else 1
+        send_timestamp = start + i*interval
+        latency = 0.002 + random.random()*0.003
+        samples.append([send_timestamp + latency, seq, (send_timestamp, latency, 128)])
+    return samples
+
+def synthetic_rate_samples(n, interval=0.05):
+    samples = []; start = time.time()
+    for i in range(n):
+        duration = 0.01 + random.random()*0.04
+        samples.append([start + i*interval + duration, 1048576, start + i*interval])
+    return samples
+
+def timeit(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn(*args)
+        elapsed = time.perf_counter() - begin
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    random.seed(0)
+    udp_samples = synthetic_udp_samples(n)
+    rate_samples = synthetic_rate_samples(n // 10)
+    udp_columns = udp_samples_to_columns(udp_samples)
+    rate_columns = rate_samples_to_columns(rate_samples)
+    results = [
+        ("udp loss/latency legacy loop", timeit(legacy_udp_lost_and_latency, udp_samples)),
+        ("udp loss/latency numpy (incl. list->array)", timeit(lambda s: per_second_udp_metrics(udp_samples_to_columns(s)), udp_samples)),
+        ("udp loss/latency/jitter numpy (columnar)", timeit(per_second_udp_metrics, udp_columns)),
+        ("data rate legacy loop", timeit(legacy_average_data_rates, rate_samples)),
+        ("data rate numpy (incl. list->array)", timeit(lambda s: rolling_data_rate(rate_samples_to_columns(s)), rate_samples)),
+        ("data rate numpy (columnar)", timeit(rolling_data_rate, rate_columns)),
+    ]
+    print(f"{n} udp samples, {len(rate_samples)} transfer samples (best of 3)")
+    for name, elapsed in results:
+        print(f"{name:<45} {elapsed*1000:10.1f} ms")
@@ -0,0 +1,125 @@
+import os, sys, time, random, asyncio, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datetime import datetime, timedelta
+from sqlalchemy import insert, text
+from models import database
+from models.database import Base, DatabaseSessionManager, SQLITE_ENGINE_KWARGS
+from models.models import Scenario, Simulation, NodeConfiguration, NetworkModeEnum
+from service import scenario_services, simulation_services
+from utils.progress import ProgressWriter
+
+# python benchmark/bench_db_load.py [n_scenarios] [n_simulations_per_scenario] [seconds] [n_readers]
+# list endpoints (scenarios, simulations, events) under concurrent readers
+# while one running simulation keep writing progress in the background (like simulation_tasks)
+# compare old setup (rollback journal, default pool, no index) with models.database settings
+
+NEW_INDEXES = ["ix_simulations_scenario_id_created_at", "ix_simulations_state"]
+
+async def seed(manager: DatabaseSessionManager, n_scenarios: int, n_simulations: int):
+    async with manager.connect() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Scenario), [{"scenario_id": i+1, "scenario_name": f"scenario {i}", "scenario_desc": "", "is_using_target_ap": False} for i in range(n_scenarios)])
+        await conn.execute(insert(NodeConfiguration), [
+            {"control_ip_addr": f"192.168.1.{j+10}", "alias_name": f"node{j}", "network_mode": NetworkModeEnum.client, "network_ssid": "N1", "scenario_id": i+1, "simulation_detail": {"simulation_type": "deterministic", "timeout": 300}}
+            for i in range(n_scenarios) for j in range(8)
+        ])
+        begin = datetime.now() - timedelta(days=365)
+        # simulations of every scenario are interleaved in time, like real usage
+        rows = []
+        for k in range(n_scenarios * n_simulations):
+            rows.append({
+                "title": f"simulation {k}",
+                "scenario_snapshot": {"N1": {"aps": {}, "clients": {f"192.168.1.{j+10}": {"alias_name": f"node{j}"} for j in range(8)}}},
+                "state": "finished",
+                "state_message": "",
+                "simulation_data": {},
+                "created_at": begin + timedelta(minutes=k),
+                "scenario_id": random.randint(1, n_scenarios),
+            })
+        for i in range(0, len(rows), 5000):
+            await conn.execute(insert(Simulation), rows[i:i+5000])
+
+async def writer(manager: DatabaseSessionManager, stop: asyncio.Event, stats: dict):
+    # one running simulation logging ~200 lines/s, flushed by ProgressWriter
+    async with manager.session() as db_session:
+        simulation = Simulation(title="running", scenario_snapshot={}, state="running simulation", state_message="", simulation_data={}, created_at=datetime.now(), scenario_id=1)
+        db_session.add(simulation)
+        await db_session.commit()
+        stats["simulation_id"] = simulation.id
+        progress = ProgressWriter(db_session, simulation, asyncio.Lock(), flush_interval=0.25)
+        progress.start()
+        while not stop.is_set():
+            for node in range(8):
+                progress.log(f"node{node}", f"{time.time()}: poll")
+            stats["logged"] += 8
+            await asyncio.sleep(0.04)
+        await progress.close()
+
+async def reader(manager: DatabaseSessionManager, stop: asyncio.Event, n_scenarios: int, latencies: list, errors: list):
+    while not stop.is_set():
+        kind = random.choice(["scenarios", "simulations", "simulations", "events"])
+        begin = time.perf_counter()
+        try:
+            async with manager.session() as db_session:
+                if kind == "scenarios":
+                    await scenario_services.list_scenarios(db_session, 10, random.randint(1, 3), "")
+                elif kind == "simulations":
+                    await simulation_services.list_simulations(db_session, random.randint(1, n_scenarios), 10, random.randint(1, 5), "")
+                else:
+                    await simulation_services.list_simulation_events(db_session, random.randint(1, n_scenarios * 5), None, 100)
+        except Exception as e:
+            # e.g. 404 of events of simulation id that not exist is fine, "database is locked" is not
+            if "not found" not in str(e):
+                errors.append(e)
+        latencies.append(time.perf_counter() - begin)
+
+def percentile(values: list, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values)-1, int(len(values)*q))] if values else float("nan")
+
+async def run(tuned: bool, n_scenarios: int, n_simulations: int, seconds: float, n_readers: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    saved_pragmas = dict(database.SQLITE_PRAGMAS)
+    if not tuned:
+        database.SQLITE_PRAGMAS.clear()
+        database.SQLITE_PRAGMAS.update({"foreign_keys": "ON"})
+    manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{path}", engine_kwargs=SQLITE_ENGINE_KWARGS if tuned else {})
+    try:
+        await seed(manager, n_scenarios, n_simulations)
+        if not tuned:
+            async with manager.connect() as conn:
+                for name in NEW_INDEXES:
+                    await conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        stop = asyncio.Event()
+        latencies, errors = [], []
+        stats = {"logged": 0}
+        tasks = [asyncio.create_task(writer(manager, stop, stats))]
+        tasks += [asyncio.create_task(reader(manager, stop, n_scenarios, latencies, errors)) for _ in range(n_readers)]
+        await asyncio.sleep(seconds)
+        stop.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        if isinstance(results[0], Exception):
+            # the writer itself can hit "database is locked" without busy_timeout
+            errors.append(results[0])
+        async with manager.session() as db_session:
+            written = (await db_session.execute(text("SELECT count(*) FROM simulation_events WHERE simulation_id=:id"), {"id": stats["simulation_id"]})).scalar()
+    finally:
+        await manager.close()
+        database.SQLITE_PRAGMAS.clear()
+        database.SQLITE_PRAGMAS.update(saved_pragmas)
+    name = "WAL + pool + indexes" if tuned else "old (journal=DELETE, no index)"
+    print(f"{name:<32} {len(latencies)/seconds:9.1f} req/s  p50 {percentile(latencies, 0.5)*1000:7.2f} ms  p99 {percentile(latencies, 0.99)*1000:8.2f} ms  errors {len(errors):5d}  lines logged {stats['logged']} written {written}")
+    if errors:
+        print(f"{'':<32} first error: {errors[0]!r}"[:200])
+
+async def main(n_scenarios: int, n_simulations: int, seconds: float, n_readers: int):
+    print(f"{n_scenarios} scenarios x {n_simulations} simulations, {n_readers} readers, 1 writer, {seconds} s")
+    await run(False, n_scenarios, n_simulations, seconds, n_readers)
+    await run(True, n_scenarios, n_simulations, seconds, n_readers)
+
+if __name__ == "__main__":
+    n_scenarios = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_simulations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+    n_readers = int(sys.argv[4]) if len(sys.argv) > 4 else 16
+    asyncio.run(main(n_scenarios, n_simulations, seconds, n_readers))
@@ -0,0 +1,77 @@
+import os, sys, time, random, asyncio, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, and_
+from sqlalchemy.orm import defer
+from models.database import Base, DatabaseSessionManager, SQLITE_ENGINE_KWARGS
+from models.models import Scenario, Simulation
+from service import simulation_services
+
+# python benchmark/bench_list_pagination.py [n_simulations] [page_size]
+# list simulations of one scenario: old regexp_match + offset vs fts search + keyset (after=) cursor
+
+WORDS = ["baseline", "stress", "office", "lab", "night", "roaming", "interference", "load"]
+
+async def seed(manager: DatabaseSessionManager, n_simulations: int):
+    async with manager.connect() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Scenario), [{"scenario_id": 1, "scenario_name": "bench", "scenario_desc": "", "is_using_target_ap": False}])
+        begin = datetime.now() - timedelta(days=365)
+        rows = [{
+            "title": f"{random.choice(WORDS)} {random.choice(WORDS)} run {k}",
+            "scenario_snapshot": {},
+            "state": "finished",
+            "state_message": "",
+            "simulation_data": {},
+            "created_at": begin + timedelta(minutes=k),
+            "scenario_id": 1,
+        } for k in range(n_simulations)]
+        for i in range(0, len(rows), 5000):
+            await conn.execute(insert(Simulation), rows[i:i+5000])
+
+async def legacy_list_simulations(db_session, page_size: int, page: int, search: str):
+    return (
+        await db_session.scalars(
+            select(Simulation)
+            .options(defer(Simulation.scenario_snapshot), defer(Simulation.simulation_data), defer(Simulation.state_message))
+            .where(and_(Simulation.title.regexp_match(search), Simulation.scenario_id==1))
+            .order_by(Simulation.created_at.desc())
+            .limit(page_size)
+            .offset((page-1)*page_size)
+        )
+    ).all()
+
+async def timed(manager: DatabaseSessionManager, call, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        async with manager.session() as db_session:
+            begin = time.perf_counter()
+            await call(db_session)
+            best = min(best, time.perf_counter() - begin)
+    return best * 1000
+
+async def main(n_simulations: int, page_size: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{path}", engine_kwargs=SQLITE_ENGINE_KWARGS)
+    await seed(manager, n_simulations)
+    last_page = n_simulations // page_size
+    # cursor of the row just before the last page, what a client has after paging through
+    async with manager.session() as db_session:
+        _, _, after = await simulation_services.list_simulations(db_session, 1, page_size, last_page - 1, "")
+    print(f"{n_simulations} simulations, page_size {page_size}, best of 5 (ms)")
+    rows = [
+        ("first page", lambda s: legacy_list_simulations(s, page_size, 1, ""), lambda s: simulation_services.list_simulations(s, 1, page_size, 1, "")),
+        (f"page {last_page} (offset vs after=)", lambda s: legacy_list_simulations(s, page_size, last_page, ""), lambda s: simulation_services.list_simulations(s, 1, page_size, 1, "", after)),
+        ("search 'stress'", lambda s: legacy_list_simulations(s, page_size, 1, "stress"), lambda s: simulation_services.list_simulations(s, 1, page_size, 1, "stress")),
+        ("search 'run 12345' (rare)", lambda s: legacy_list_simulations(s, page_size, 1, "run 12345"), lambda s: simulation_services.list_simulations(s, 1, page_size, 1, "run 12345")),
+        ("search 'inter load'", lambda s: legacy_list_simulations(s, page_size, 1, "inter.*load"), lambda s: simulation_services.list_simulations(s, 1, page_size, 1, "inter load")),
+    ]
+    print(f"{'':<32} {'regexp + offset':>16} {'fts + keyset':>16}   (fts + keyset include the count query)")
+    for name, legacy, new in rows:
+        print(f"{name:<32} {await timed(manager, legacy):16.2f} {await timed(manager, new):16.2f}")
+    await manager.close()
+
+if __name__ == "__main__":
+    n_simulations = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(n_simulations, page_size))
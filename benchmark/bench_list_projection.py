@@ -0,0 +1,72 @@
+import os, sys, time, asyncio, tempfile
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from datetime import datetime, timedelta
+from typing import List
+from pydantic import TypeAdapter
+from sqlalchemy import select, insert
+from models.database import Base, DatabaseSessionManager, SQLITE_ENGINE_KWARGS
+from models.models import Scenario, Simulation
+from models.schemas import SimulationList
+from service import simulation_services
+
+# python benchmark/bench_list_projection.py [page_size]
+# one page of GET /scenario/{id}/simulation (query + response model) while simulation_data of every row grows
+# old: full Simulation entity (json columns loaded and parsed) vs column projection
+
+SIMULATION_DATA_SIZES = [0, 10_000, 100_000, 1_000_000] # json bytes per simulation
+
+def make_simulation_data(size: int) -> dict:
+    # roughly `size` bytes of json, shaped like old raw monitor data
+    n = size // 40
+    return {"192.168.1.10": {"udp_deterministic_client_data": [[1700000000.123456 + i, i, [1700000000.1 + i, 0.0123]] for i in range(n)]}} if n else {}
+
+async def seed(manager: DatabaseSessionManager, size: int, n_simulations: int):
+    async with manager.connect() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(Scenario), [{"scenario_id": 1, "scenario_name": "bench", "scenario_desc": "", "is_using_target_ap": False}])
+        simulation_data = make_simulation_data(size)
+        begin = datetime.now() - timedelta(days=30)
+        for k in range(n_simulations):
+            await conn.execute(insert(Simulation), [{
+                "title": f"run {k}", "scenario_snapshot": {}, "state": "finished", "state_message": "",
+                "simulation_data": simulation_data, "created_at": begin + timedelta(minutes=k), "scenario_id": 1,
+            }])
+
+async def legacy_list_simulations(db_session, page_size: int):
+    return (
+        await db_session.scalars(
+            select(Simulation)
+            .where(Simulation.scenario_id==1)
+            .order_by(Simulation.created_at.desc())
+            .limit(page_size)
+        )
+    ).all()
+
+async def projected_list_simulations(db_session, page_size: int):
+    simulations, _, _ = await simulation_services.list_simulations(db_session, 1, page_size, 1, "")
+    return simulations
+
+async def timed(manager: DatabaseSessionManager, list_simulations, page_size: int, repeat: int = 5) -> float:
+    response_model = TypeAdapter(List[SimulationList])
+    best = float("inf")
+    for _ in range(repeat):
+        async with manager.session() as db_session:
+            begin = time.perf_counter()
+            response_model.dump_json(response_model.validate_python(await list_simulations(db_session, page_size), from_attributes=True))
+            best = min(best, time.perf_counter() - begin)
+    return best * 1000
+
+async def main(page_size: int):
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    manager = DatabaseSessionManager(f"sqlite+aiosqlite:///{path}", engine_kwargs=SQLITE_ENGINE_KWARGS)
+    print(f"one page of {page_size} simulations, best of 5 (ms)")
+    print(f"{'simulation_data/row':>20} {'full entity':>14} {'projection':>14}")
+    for size in SIMULATION_DATA_SIZES:
+        await seed(manager, size, page_size)
+        print(f"{size:>20,} {await timed(manager, legacy_list_simulations, page_size):14.2f} {await timed(manager, projected_list_simulations, page_size):14.2f}")
+    await manager.close()
+
+if __name__ == "__main__":
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    asyncio.run(main(page_size))
@@ -0,0 +1,130 @@
+import os, sys, io, json, time, asyncio, tempfile, tracemalloc, multiprocessing, importlib.util
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+from aiohttp import web
+import utils.sample_store as sample_store
+from utils.agent_client import agent_client
+from utils.telemetry import NDJSON_CONTENT_TYPE, TELEMETRY_CONTENT_TYPE, TelemetryDecoder, encode_telemetry
+from utils.rollup import store_samples_and_build_rollup, build_simulation_rollup_from_store
+from utils.sample_store import SampleStoreWriter, to_records
+import utils.tasks as tasks
+from utils.tasks import fetch_monitor_data
+
+# python benchmark/bench_monitor_stream.py [samples per agent]
+# collect monitor data of one client agent at the end of a run, whole json body vs ndjson / binary telemetry stream written to sample store
+# agent run in another process, peak python memory (tracemalloc) and time of the control server side
+# (tracemalloc slow both down a lot, compare the times with each other only)
+# first check that a result file of the local udp server (its own writer, without numpy) decode back the same with TelemetryDecoder
+
+PORT = 18765
+CHUNK = 5000 # samples per ndjson line
+SNAPSHOT = {"N1": {"is_target_ap": False, "aps": {"10.0.0.1": {}}, "clients": {"127.0.0.1": {}}}}
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def make_samples(n: int) -> list:
+    t0 = 1700000000.0
+    return [[t0 + i * 0.01 + 0.002, i, [t0 + i * 0.01, 0.002, 128]] for i in range(n)]
+
+def check_server_round_trip(n: int):
+    # raw + rollup records of two clients written by dump_telemetry of the server script, decoded by utils.telemetry
+    spec = importlib.util.spec_from_file_location("udp_server", os.path.join(ROOT, "simulation", "server", "udp_window_deterministic.py"))
+    server = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(server)
+    samples = make_samples(n)
+    rollup = [[1700000001.0 + i, 100, i % 3, 12800, 0.2, 0.001, 0.004, 0.05, 99, 0.002, 0.0035] for i in range(n // 100 + 1)]
+    monitor_data = {"10.0.0.2": samples, "10.0.0.3": samples[:10]}
+    for control_ip in monitor_data:
+        server.aggregates[control_ip] = server.ClientAggregate(samples[0][0])
+        for record in rollup:
+            server.emit_record(control_ip, record)
+    file = io.BytesIO()
+    server.dump_telemetry(file, monitor_data)
+    decoder = TelemetryDecoder()
+    decoded = {}; fields = {}
+    for item in decoder.feed(file.getvalue()) + decoder.close():
+        if item[0] == "field":
+            fields[item[1]] = item[2]
+        else:
+            decoded.setdefault((item[1], item[2]), []).append(item[3])
+    for control_ip, client_samples in monitor_data.items():
+        raw = np.concatenate(decoded[("udp_deterministic_client_data_monitored_from_server", control_ip)])
+        assert np.array_equal(raw, to_records("udp_deterministic_client_data_monitored_from_server", client_samples)), f"raw samples of {control_ip} differ"
+        records = np.concatenate(decoded[("udp_deterministic_client_rollup_monitored_from_server", control_ip)])
+        assert np.array_equal(records, to_records("udp_deterministic_client_rollup_monitored_from_server", rollup)), f"rollup of {control_ip} differ"
+    assert set(fields["udp_deterministic_latency_histogram"]) == set(monitor_data)
+    print(f"server writer => TelemetryDecoder round trip ok ({len(file.getvalue()):,} bytes)")
+
+def serve(n: int):
+    samples = make_samples(n)
+    node_data = {"Signal": [[1700000000.0, -40]], "udp_deterministic_server_data_monitored_from_client": samples}
+    body = json.dumps(node_data).encode()
+    telemetry = b"".join(encode_telemetry(node_data))
+    print(f"agent response: json {len(body):,} bytes, binary telemetry {len(telemetry):,} bytes")
+
+    async def monitor(request):
+        if TELEMETRY_CONTENT_TYPE in request.headers.get("Accept", ""):
+            response = web.StreamResponse(headers={"Content-Type": TELEMETRY_CONTENT_TYPE})
+            await response.prepare(request)
+            for i in range(0, len(telemetry), 1 << 16):
+                await response.write(telemetry[i:i+(1 << 16)])
+            await response.write_eof()
+            return response
+        if request.query.get("format") != "ndjson":
+            return web.Response(body=body, content_type="application/json")
+        response = web.StreamResponse(headers={"Content-Type": NDJSON_CONTENT_TYPE})
+        await response.prepare(request)
+        await response.write((json.dumps({"field": "Signal", "value": [[1700000000.0, -40]]}) + "\n").encode())
+        for i in range(0, len(samples), CHUNK):
+            await response.write((json.dumps({"series": "udp_deterministic_server_data_monitored_from_client", "samples": samples[i:i+CHUNK]}) + "\n").encode())
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_get("/simulation/monitor", monitor)
+    web.run_app(app, host="127.0.0.1", port=PORT, print=None)
+
+async def whole_json(simulation_id: int):
+    body, _ = await agent_client.get(f"http://127.0.0.1:{PORT}/simulation/monitor", None, 600)
+    return await asyncio.to_thread(store_samples_and_build_rollup, simulation_id, SNAPSHOT, {"127.0.0.1": body})
+
+async def stream(simulation_id: int, stream_types: list):
+    writer = SampleStoreWriter(simulation_id)
+    metadata, _ = await fetch_monitor_data("127.0.0.1", writer.node("127.0.0.1"), 600, stream_types)
+    path = await asyncio.to_thread(writer.close)
+    return await asyncio.to_thread(build_simulation_rollup_from_store, SNAPSHOT, {"127.0.0.1": metadata}, path)
+
+async def measure(name: str, fetch, simulation_id: int):
+    tracemalloc.start()
+    begin = time.perf_counter()
+    await fetch(simulation_id)
+    elapsed = time.perf_counter() - begin
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<14} {elapsed:10.2f} {peak / 2**20:14.1f}")
+
+async def main(n: int):
+    for _ in range(100):
+        try:
+            await agent_client.get(f"http://127.0.0.1:{PORT}/simulation/monitor", {"format": "ndjson"}, 5)
+            break
+        except Exception:
+            await asyncio.sleep(0.2)
+    check_server_round_trip(n)
+    print(f"{n:,} udp samples from one agent")
+    print(f"{'':<14} {'time (s)':>10} {'peak (MiB)':>14}")
+    await measure("whole json", whole_json, 1)
+    await measure("ndjson stream", lambda simulation_id: stream(simulation_id, [NDJSON_CONTENT_TYPE]), 2)
+    await measure("binary stream", lambda simulation_id: stream(simulation_id, [TELEMETRY_CONTENT_TYPE]), 3)
+    await agent_client.close()
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    sample_store.SAMPLE_STORE_DIR = tempfile.mkdtemp()
+    # agent_url is port 8000, the bench agent listen on PORT
+    tasks.agent_url = lambda control_ip, path: f"http://{control_ip}:{PORT}{path}"
+    server = multiprocessing.Process(target=serve, args=(n,), daemon=True)
+    server.start()
+    try:
+        asyncio.run(main(n))
+    finally:
+        server.terminate()
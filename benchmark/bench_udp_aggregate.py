@@ -0,0 +1,63 @@
+import os, sys, time, socket, tempfile, subprocess
+
+# python benchmark/bench_udp_aggregate.py [seconds] [clients]
+# flood the local udp deterministic server (simulation/server/udp_window_deterministic.py, port 8888) from a few clients
+# raw capture vs on-the-fly aggregation: peak memory (VmHWM) of the server process and size of its result file
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PORT = 8888
+PACKET_SIZE = 128
+
+def peak_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+def run(capture: str, seconds: int, n_clients: int):
+    result_file = os.path.join(tempfile.mkdtemp(), "udp_server.wmt")
+    server = subprocess.Popen(
+        [sys.executable, "-u", "./simulation/server/udp_window_deterministic.py", "bench", str(seconds + 3), result_file, capture],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1)
+    clients = []
+    for k in range(n_clients):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.settimeout(2)
+        # server send back one packet per hour only, this measure the receiving side
+        client.sendto(f"average_interval_time:3600000 average_packet_size:{PACKET_SIZE} control_ip:10.0.0.{k}".encode(), ("127.0.0.1", SERVER_PORT))
+        client.recvfrom(1024)
+        client.setblocking(False)
+        clients.append(client)
+    sent = 0; seq = 0; peak = 0
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        for client in clients:
+            try:
+                client.sendto(str(seq).zfill(7).encode() + f"{time.time():.7f}".encode() + b"a" * (PACKET_SIZE - 25), ("127.0.0.1", SERVER_PORT))
+                sent += 1
+            except BlockingIOError:
+                pass
+        seq += 1
+        if seq % 10000 == 0:
+            peak = max(peak, peak_rss(server.pid))
+    peak = max(peak, peak_rss(server.pid))
+    server.wait()
+    size = os.path.getsize(result_file) if os.path.exists(result_file) else 0
+    for client in clients:
+        client.close()
+    return sent, peak, size
+
+def main(seconds: int, n_clients: int):
+    print(f"{n_clients} clients flooding for {seconds} s")
+    print(f"{'capture':<10} {'sent':>10} {'peak rss (MiB)':>16} {'result file (KiB)':>18}")
+    for capture in ("raw", "aggregate"):
+        sent, peak, size = run(capture, seconds, n_clients)
+        print(f"{capture:<10} {sent:>10,} {peak / 2**20:16.1f} {size / 1024:18.1f}")
+
+if __name__ == "__main__":
+    seconds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    n_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    main(seconds, n_clients)
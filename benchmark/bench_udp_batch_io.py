@@ -0,0 +1,111 @@
+import os, sys, time, socket, select, tempfile, subprocess, multiprocessing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulation"))
+import numpy as np
+import utils.sample_store as sample_store
+from utils.sample_store import SampleStoreWriter, load_simulation_samples
+from utils.telemetry import read_telemetry_file_and_delete_file
+from batch_io import BatchSocket
+
+# python benchmark/bench_udp_batch_io.py [seconds]
+# achievable packets per second over loopback (128 bytes packet)
+#   socket   => one sender process blasting, this process receiving, with each io style
+#               select   = select before every recvfrom / sendto (old udp_window_deterministic.py)
+#               loop     = non-blocking recvfrom / sendto until it would block (batch_io fallback)
+#               mmsg     = recvmmsg / sendmmsg, 64 packets per syscall
+#   server   => packets the local udp deterministic server actually take in (its own rollup), asyncio vs batch io
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PORT = 8888
+PACKET_SIZE = 128
+IO_STYLES = ["select", "loop", "mmsg"]
+
+def blast(style: str, addr, seconds: float, counter):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    batch_socket = BatchSocket(sock, 64, use_mmsg=style == "mmsg")
+    packet = b"0" * 7 + f"{time.time():.7f}".encode() + b"a" * (PACKET_SIZE - 25)
+    batch = [(packet, addr)] * 64
+    sent = 0
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        if style == "select":
+            for _ in range(64):
+                _, writable, _ = select.select([], [sock], [], 0)
+                if writable:
+                    try:
+                        sock.sendto(packet, addr)
+                        sent += 1
+                    except BlockingIOError:
+                        pass
+        else:
+            sent += batch_socket.send_batch(batch)
+    counter.value = sent
+
+def socket_pps(style: str, seconds: float):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+    sock.bind(("127.0.0.1", 0))
+    sock.setblocking(False)
+    batch_socket = BatchSocket(sock, 64, use_mmsg=style == "mmsg")
+    counter = multiprocessing.Value("q", 0)
+    sender = multiprocessing.Process(target=blast, args=(style, sock.getsockname(), seconds, counter))
+    sender.start()
+    received = 0
+    end_time = time.time() + seconds + 0.5
+    while time.time() < end_time:
+        if style == "select":
+            readable, _, _ = select.select([sock], [], [], 0)
+            if readable:
+                sock.recvfrom(2048)
+                received += 1
+        else:
+            received += len(batch_socket.recv_batch())
+    sender.join()
+    sock.close()
+    return counter.value / seconds, received / seconds
+
+def server_pps(io_mode: str, seconds: float):
+    result_file = os.path.join(tempfile.mkdtemp(), "udp_server.wmt")
+    server = subprocess.Popen(
+        [sys.executable, "-u", "./simulation/server/udp_window_deterministic.py", "bench", str(int(seconds) + 3), result_file, "aggregate", "catch-up", io_mode],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2)
+    sock.sendto(f"average_interval_time:3600000 average_packet_size:{PACKET_SIZE} control_ip:10.0.0.1".encode(), ("127.0.0.1", SERVER_PORT))
+    sock.recvfrom(1024)
+    sock.setblocking(False)
+    batch_socket = BatchSocket(sock, 64)
+    sent = 0; seq = 0
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        now = f"{time.time():.7f}".encode()
+        batch = []
+        for _ in range(64):
+            batch.append((str(seq % 10**7).zfill(7).encode() + now + b"a" * (PACKET_SIZE - 25), ("127.0.0.1", SERVER_PORT)))
+            seq += 1
+        sent += batch_socket.send_batch(batch)
+    server.wait()
+    sample_store.SAMPLE_STORE_DIR = tempfile.mkdtemp()
+    writer = SampleStoreWriter(1)
+    read_telemetry_file_and_delete_file(result_file, writer.node("this_device"))
+    samples = load_simulation_samples(writer.close()).get("this_device", {})
+    rollup = samples.get("udp_deterministic_client_rollup_monitored_from_server", {}).get("10.0.0.1")
+    received = int(np.sum(rollup["received"])) if rollup is not None else 0
+    return sent / seconds, received / seconds
+
+def main(seconds: float):
+    print(f"loopback, {PACKET_SIZE} bytes packet, {seconds} s each")
+    print(f"{'socket io':<10} {'sent/s':>12} {'received/s':>12}")
+    for style in IO_STYLES:
+        sent, received = socket_pps(style, seconds)
+        print(f"{style:<10} {sent:12,.0f} {received:12,.0f}")
+    print(f"{'server io':<10} {'sent/s':>12} {'taken in/s':>12}")
+    for io_mode in ("asyncio", "batch"):
+        sent, received = server_pps(io_mode, seconds)
+        print(f"{io_mode:<10} {sent:12,.0f} {received:12,.0f}")
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 5)
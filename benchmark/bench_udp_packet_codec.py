@@ -0,0 +1,86 @@
+import os, sys, time, socket, tempfile, subprocess, importlib.util
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulation"))
+import numpy as np
+import utils.sample_store as sample_store
+from utils.sample_store import SampleStoreWriter, load_simulation_samples
+from utils.telemetry import read_telemetry_file_and_delete_file
+from batch_io import BatchSocket
+
+# python benchmark/bench_udp_packet_codec.py [packets] [seconds]
+# cost of the udp simulate packet header, 128 bytes packet
+#   codec  => build + parse one packet: old string code (zfill / join, decode / int / float) vs ascii and binary codec
+#   server => packets the local udp deterministic server take in (batch io, its own rollup) with ascii vs binary packets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PORT = 8888
+PACKET_SIZE = 128
+
+# the codec is in the client script (same as the server one), the script only make an unbound socket when imported
+spec = importlib.util.spec_from_file_location("udp_client", os.path.join(ROOT, "simulation", "client", "udp_window_deterministic.py"))
+codec = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(codec)
+
+def old_string_codec(n: int):
+    message = [b"0000000", f"{time.time():.7f}".encode(), ((PACKET_SIZE-25)*"a").encode()]
+    for seq_number in range(n):
+        message[0] = str(seq_number).zfill(7).encode()
+        message[1] = f"{time.time():.7f}".encode()
+        data = b"".join(message).decode()
+        int(data[:7]); float(data[7:25])
+
+def new_codec(n: int, packet_format: str):
+    packet = codec.new_packet(packet_format, PACKET_SIZE)
+    for seq_number in range(n):
+        codec.write_packet_header(packet, packet_format, seq_number, time.time())
+        codec.parse_packet_header(bytes(packet))
+
+def server_pps(packet_format: str, seconds: float):
+    result_file = os.path.join(tempfile.mkdtemp(), "udp_server.wmt")
+    server = subprocess.Popen(
+        [sys.executable, "-u", "./simulation/server/udp_window_deterministic.py", "bench", str(int(seconds) + 3), result_file, "aggregate", "catch-up", "batch"],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(2)
+    asked_format = " packet_format:binary" if packet_format == "binary" else ""
+    sock.sendto(f"average_interval_time:3600000 average_packet_size:{PACKET_SIZE} control_ip:10.0.0.1{asked_format}".encode(), ("127.0.0.1", SERVER_PORT))
+    sock.recvfrom(1024)
+    sock.setblocking(False)
+    batch_socket = BatchSocket(sock, 64)
+    packet = codec.new_packet(packet_format, PACKET_SIZE)
+    sent = 0; seq_number = 0
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        batch = []
+        for _ in range(64):
+            codec.write_packet_header(packet, packet_format, seq_number, time.time())
+            batch.append((bytes(packet), ("127.0.0.1", SERVER_PORT)))
+            seq_number += 1
+        sent += batch_socket.send_batch(batch)
+    server.wait()
+    sample_store.SAMPLE_STORE_DIR = tempfile.mkdtemp()
+    writer = SampleStoreWriter(1)
+    read_telemetry_file_and_delete_file(result_file, writer.node("this_device"))
+    samples = load_simulation_samples(writer.close()).get("this_device", {})
+    rollup = samples.get("udp_deterministic_client_rollup_monitored_from_server", {}).get("10.0.0.1")
+    received = int(np.sum(rollup["received"])) if rollup is not None else 0
+    return sent / seconds, received / seconds
+
+def main(n: int, seconds: float):
+    print(f"{PACKET_SIZE} bytes packet")
+    print(f"{'codec':<8} {'build + parse (us/packet)':>26}")
+    for name, run in [("string", old_string_codec), ("ascii", lambda n: new_codec(n, "ascii")), ("binary", lambda n: new_codec(n, "binary"))]:
+        begin = time.perf_counter()
+        run(n)
+        print(f"{name:<8} {(time.perf_counter() - begin) / n * 1e6:26.3f}")
+    print(f"{'server':<8} {'sent/s':>12} {'taken in/s':>12}")
+    for packet_format in ("ascii", "binary"):
+        sent, received = server_pps(packet_format, seconds)
+        print(f"{packet_format:<8} {sent:12,.0f} {received:12,.0f}")
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+    main(n, seconds)
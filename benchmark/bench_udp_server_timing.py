@@ -0,0 +1,83 @@
+import os, sys, time, socket, selectors, tempfile, subprocess
+import numpy as np
+
+# python benchmark/bench_udp_server_timing.py [interval ms] [seconds] [server script]
+# local udp deterministic server sending to 1..200 clients (one packet per interval each, port 8888)
+#   cpu     => cpu time of the server process / wall time, idle (no client yet) and while sending
+#   jitter  => inter-arrival time of each client - interval, seen by the clients on loopback
+#   rate    => packets per second per client achieved vs configured
+# server script default to simulation/server/udp_window_deterministic.py, give an older copy to compare
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PORT = 8888
+CLIENT_COUNTS = [1, 10, 50, 200]
+IDLE_SECONDS = 2
+
+def cpu_seconds(pid: int) -> float:
+    with open(f"/proc/{pid}/stat") as stat:
+        fields = stat.read().rsplit(")", 1)[1].split()
+    # utime, stime (field 14, 15)
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+def run(script: str, n_clients: int, interval_ms: int, seconds: int):
+    result_file = os.path.join(tempfile.mkdtemp(), "udp_server.wmt")
+    server = subprocess.Popen(
+        [sys.executable, "-u", script, "bench", str(IDLE_SECONDS + seconds + 3), result_file, "aggregate"],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    idle_begin = cpu_seconds(server.pid)
+    time.sleep(IDLE_SECONDS)
+    idle_cpu = (cpu_seconds(server.pid) - idle_begin) / IDLE_SECONDS
+    selector = selectors.DefaultSelector()
+    arrivals = []
+    for k in range(n_clients):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        client.sendto(f"average_interval_time:{interval_ms} average_packet_size:128 control_ip:10.0.{k // 250}.{k % 250}".encode(), ("127.0.0.1", SERVER_PORT))
+        client.setblocking(False)
+        arrivals.append([])
+        selector.register(client, selectors.EVENT_READ, k)
+    # first second is warm up (handshake, ack)
+    begin = time.monotonic() + 1
+    busy_begin = None
+    end_time = begin + seconds
+    while time.monotonic() < end_time:
+        if busy_begin is None and time.monotonic() >= begin:
+            busy_begin = cpu_seconds(server.pid)
+        for key, _ in selector.select(0.1):
+            while True:
+                try:
+                    data = key.fileobj.recv(2048)
+                except BlockingIOError:
+                    break
+                now = time.monotonic()
+                if now >= begin and data != b"parameters recieved":
+                    arrivals[key.data].append(now)
+    busy_cpu = (cpu_seconds(server.pid) - busy_begin) / seconds
+    server.wait()
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+    gaps = np.concatenate([np.diff(client_arrivals) for client_arrivals in arrivals if len(client_arrivals) > 1] or [np.zeros(0)])
+    deviation = np.abs(gaps - interval_ms / 1000) * 1000
+    rate = np.mean([len(client_arrivals) / seconds for client_arrivals in arrivals])
+    return idle_cpu, busy_cpu, deviation, rate
+
+def main(script: str, interval_ms: int, seconds: int):
+    print(f"{os.path.relpath(script, ROOT)}, interval {interval_ms} ms ({1000 / interval_ms:.0f} packets/s per client), {seconds} s")
+    print(f"{'clients':>8} {'idle cpu':>9} {'busy cpu':>9} {'rate/client':>12} {'jitter p50 (ms)':>16} {'p99 (ms)':>9} {'max (ms)':>9}")
+    for n_clients in CLIENT_COUNTS:
+        idle_cpu, busy_cpu, deviation, rate = run(script, n_clients, interval_ms, seconds)
+        if len(deviation) == 0:
+            print(f"{n_clients:>8} {idle_cpu:9.0%} {busy_cpu:9.0%} {rate:12.1f}")
+            continue
+        print(
+            f"{n_clients:>8} {idle_cpu:9.0%} {busy_cpu:9.0%} {rate:12.1f} {np.percentile(deviation, 50):16.3f}"
+            f" {np.percentile(deviation, 99):9.3f} {deviation.max():9.3f}"
+        )
+
+if __name__ == "__main__":
+    interval_ms = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    script = os.path.abspath(sys.argv[3]) if len(sys.argv) > 3 else os.path.join(ROOT, "simulation", "server", "udp_window_deterministic.py")
+    main(script, interval_ms, seconds)
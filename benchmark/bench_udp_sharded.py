@@ -0,0 +1,80 @@
+import os, sys, time, socket, tempfile, subprocess, multiprocessing, importlib.util
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "simulation"))
+import numpy as np
+import utils.sample_store as sample_store
+from utils.sample_store import SampleStoreWriter, load_simulation_samples
+from utils.telemetry import read_telemetry_file_and_delete_file
+from batch_io import BatchSocket
+
+# python benchmark/bench_udp_sharded.py [seconds] [clients] [sender processes]
+# packets the local udp deterministic server take in (merged rollup of its workers) with 1, 2, 4 .. cpu count workers
+# clients are flooding over loopback from a few sender processes (batch io, binary packets)
+# scaling need free cores for both sides, on a host with few cores senders and workers share them
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_PORT = 8888
+PACKET_SIZE = 128
+
+# packet codec of the client script, the script only make an unbound socket when imported
+spec = importlib.util.spec_from_file_location("udp_client", os.path.join(ROOT, "simulation", "client", "udp_window_deterministic.py"))
+codec = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(codec)
+
+def flood(first_client: int, n_clients: int, seconds: float, counter):
+    clients = []
+    for k in range(first_client, first_client + n_clients):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(5)
+        sock.sendto(f"average_interval_time:3600000 average_packet_size:{PACKET_SIZE} control_ip:10.0.{k // 250}.{k % 250} packet_format:binary".encode(), ("127.0.0.1", SERVER_PORT))
+        sock.recvfrom(1024)
+        sock.setblocking(False)
+        clients.append((BatchSocket(sock, 64), codec.new_packet("binary", PACKET_SIZE)))
+    sent = 0; seq_number = 0
+    end_time = time.time() + seconds
+    while time.time() < end_time:
+        for batch_socket, packet in clients:
+            batch = []
+            for i in range(16):
+                codec.write_packet_header(packet, "binary", seq_number + i, time.time())
+                batch.append((bytes(packet), ("127.0.0.1", SERVER_PORT)))
+            sent += batch_socket.send_batch(batch)
+        seq_number += 16
+    counter.value = sent
+
+def server_pps(n_workers: int, n_clients: int, n_senders: int, seconds: float):
+    result_file = os.path.join(tempfile.mkdtemp(), "udp_server.wmt")
+    server = subprocess.Popen(
+        [sys.executable, "-u", "./simulation/server/udp_window_deterministic.py", "bench", str(int(seconds) + 4), result_file, "aggregate", "catch-up", "batch", str(n_workers)],
+        cwd=ROOT, stdout=subprocess.DEVNULL,
+    )
+    time.sleep(1.5)
+    counters = [multiprocessing.Value("q", 0) for _ in range(n_senders)]
+    per_sender = n_clients // n_senders
+    senders = [multiprocessing.Process(target=flood, args=(k * per_sender, per_sender, seconds, counters[k])) for k in range(n_senders)]
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.join()
+    server.wait()
+    sample_store.SAMPLE_STORE_DIR = tempfile.mkdtemp()
+    writer = SampleStoreWriter(1)
+    read_telemetry_file_and_delete_file(result_file, writer.node("this_device"))
+    rollup = load_simulation_samples(writer.close()).get("this_device", {}).get("udp_deterministic_client_rollup_monitored_from_server", {})
+    received = sum(int(np.sum(records["received"])) for records in rollup.values())
+    return sum(counter.value for counter in counters) / seconds, received / seconds, len(rollup)
+
+def main(seconds: float, n_clients: int, n_senders: int):
+    cpu_count = os.cpu_count() or 1
+    worker_counts = sorted({1, 2, 4, cpu_count} if cpu_count > 1 else {1, 2})
+    print(f"{cpu_count} cpu, {n_clients} clients from {n_senders} sender processes, {seconds} s each")
+    print(f"{'workers':>8} {'sent/s':>12} {'taken in/s':>12} {'clients seen':>13}")
+    for n_workers in worker_counts:
+        sent, received, seen = server_pps(n_workers, n_clients, n_senders, seconds)
+        print(f"{n_workers:>8} {sent:12,.0f} {received:12,.0f} {seen:>13}")
+
+if __name__ == "__main__":
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+    n_clients = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    n_senders = int(sys.argv[3]) if len(sys.argv) > 3 else 2
+    main(seconds, n_clients, n_senders)
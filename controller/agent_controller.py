@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+from models.schemas import AgentEventRequest
+from service import agent_services
+
+router = APIRouter(
+    prefix="/agent",
+    tags=["agents"],
+)
+
+@router.post("/events", status_code=200)
+async def agent_event(request_body: AgentEventRequest):
+    # agent push phase completion / log instead of waiting to be polled (utils.agent_events)
+    return (await agent_services.recv_agent_event(request_body))
@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from typing import Optional, List
 from models.models import Scenario, Simulation, NodeConfiguration
 from models.schemas import NodeConfigRequest, NodeConfigList, KeepAliveRequest
 from service import node_config_services
 from utils.dependency import DBSessionDep
+from utils.search import set_page_headers, SEARCH_DESCRIPTION
 
 router = APIRouter(
     prefix="/scenario/{scenario_id}/node",
@@ -22,9 +23,12 @@ async def keep_alive():
 async def create_new_scenario(db_session: DBSessionDep, scenario_id: int, request_body: NodeConfigRequest):
     return (await node_config_services.create_node_config(db_session, scenario_id, request_body))
 
-@router.get("", status_code=200)
-async def list_node_configs(db_session: DBSessionDep, scenario_id: int, page_size: Optional[int] = 10, page: Optional[int] = 1, search: Optional[str] = ""):
-    return (await node_config_services.list_node_configs(db_session, scenario_id, page_size, page, search))
+@router.get("", response_model=List[NodeConfigList], status_code=200, description=SEARCH_DESCRIPTION)
+async def list_node_configs(db_session: DBSessionDep, response: Response, scenario_id: int, page_size: Optional[int] = 10, page: Optional[int] = 1, search: Optional[str] = "", after: Optional[str] = None):
+    # search => substring of every word (utils.search), after => X-Next-After header of previous page (page is ignored)
+    node_configs, total, next_after = await node_config_services.list_node_configs(db_session, scenario_id, page_size, page, search, after)
+    set_page_headers(response, total, next_after)
+    return node_configs
 
 @router.get("/preview", status_code=200)
 async def list_node_configs(db_session: DBSessionDep, scenario_id: int):
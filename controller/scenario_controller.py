@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from typing import Optional, List
 from models.models import Scenario, Simulation, NodeConfiguration
 from models.schemas import ScenarioRequest, ScenarioListResponse
 from service import scenario_services
 from utils.dependency import DBSessionDep
+from utils.search import set_page_headers, SEARCH_DESCRIPTION
 
 router = APIRouter(
     prefix="/scenario",
@@ -14,9 +15,12 @@ router = APIRouter(
 async def create_new_scenario(db_session: DBSessionDep, request_body: ScenarioRequest):
     return (await scenario_services.create_scenario(db_session, request_body))
 
-@router.get("", response_model=List[ScenarioListResponse], status_code=200)
-async def list_scenarios(db_session: DBSessionDep, page_size: Optional[int] = 10, page: Optional[int] = 1, search: Optional[str] = ""):
-    return (await scenario_services.list_scenarios(db_session, page_size, page, search))
+@router.get("", response_model=List[ScenarioListResponse], status_code=200, description=SEARCH_DESCRIPTION)
+async def list_scenarios(db_session: DBSessionDep, response: Response, page_size: Optional[int] = 10, page: Optional[int] = 1, search: Optional[str] = "", after: Optional[str] = None):
+    # search => substring of every word (utils.search), after => X-Next-After header of previous page (page is ignored)
+    scenarios, total, next_after = await scenario_services.list_scenarios(db_session, page_size, page, search, after)
+    set_page_headers(response, total, next_after)
+    return scenarios
 
 @router.get("/{scenario_id}", status_code=200)
 async def get_scenario(db_session: DBSessionDep, scenario_id: int):
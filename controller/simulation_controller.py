@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi import APIRouter, Request, Response, Depends, HTTPException
 from typing import Optional, List
 from models.models import Scenario, Simulation, NodeConfiguration
-from models.schemas import SimulationList, RunSimulationTitle
+from models.schemas import SimulationList, SimulationEventPage, RunSimulationTitle
 from service import simulation_services
 from utils.dependency import DBSessionDep
+from utils.search import set_page_headers, SEARCH_DESCRIPTION
 
 router = APIRouter(
     prefix="/scenario/{scenario_id}/simulation",
@@ -12,19 +13,33 @@ router = APIRouter(
 
 @router.post("/run", status_code=200)
 async def run_simulation(db_session: DBSessionDep, scenario_id: int, request_body: RunSimulationTitle, request: Request):
-    return (await simulation_services.run_simulation(request.app.lock, db_session, request_body, request, scenario_id))
+    return (await simulation_services.run_simulation(request.app.lock, db_session, request_body, scenario_id))
 
 @router.post("/{simulation_id}/cancel", status_code=200)
 async def cancel_simulation(db_session: DBSessionDep, scenario_id: int, simulation_id: int, request: Request):
-    return (await simulation_services.cancel_simulation(request.app.lock, db_session, request, scenario_id, simulation_id))
+    return (await simulation_services.cancel_simulation(request.app.lock, db_session, scenario_id, simulation_id))
 
-@router.get("", response_model=List[SimulationList], status_code=200)
-async def list_simulation(db_session: DBSessionDep, scenario_id: int, page_size: Optional[int] = 10, page: Optional[int] = 1, search: Optional[str] = ""):
-    return (await simulation_services.list_simulations(db_session, scenario_id, page_size, page, search))
+@router.get("", response_model=List[SimulationList], status_code=200, description=SEARCH_DESCRIPTION)
+async def list_simulation(db_session: DBSessionDep, response: Response, scenario_id: int, page_size: Optional[int] = 10, page: Optional[int] = 1, search: Optional[str] = "", after: Optional[str] = None):
+    # search => substring of every word (utils.search), after => X-Next-After header of previous page "<created_at>,<id>" (page is ignored)
+    simulations, total, next_after = await simulation_services.list_simulations(db_session, scenario_id, page_size, page, search, after)
+    set_page_headers(response, total, next_after)
+    return simulations
 
 @router.get("/{simulation_id}", status_code=200)
-async def get_simulation(db_session: DBSessionDep, scenario_id: int, simulation_id: int):
-    return (await simulation_services.get_simulation(db_session, simulation_id))
+async def get_simulation(db_session: DBSessionDep, scenario_id: int, simulation_id: int, node: Optional[str] = None, metric: Optional[str] = None, start: Optional[float] = None, end: Optional[float] = None, points: Optional[int] = None):
+    # node, metric => comma separated, start/end => unix timestamp, points => max points per series (LTTB downsampling)
+    return (await simulation_services.get_simulation(db_session, simulation_id, node, metric, start, end, points))
+
+@router.get("/{simulation_id}/events", response_model=SimulationEventPage, status_code=200)
+async def list_simulation_events(db_session: DBSessionDep, scenario_id: int, simulation_id: int, after_id: Optional[int] = None, limit: Optional[int] = 500, node: Optional[str] = None, level: Optional[str] = None):
+    # without after_id => last `limit` events, with after_id => events after it (oldest first), node/level => comma separated
+    return (await simulation_services.list_simulation_events(db_session, simulation_id, after_id, limit, node, level))
+
+@router.get("/{simulation_id}/stream", status_code=200)
+async def stream_simulation(db_session: DBSessionDep, scenario_id: int, simulation_id: int, request: Request):
+    # Server-Sent Events: state, log and metrics of running simulation
+    return (await simulation_services.stream_simulation(db_session, simulation_id, request))
 
 @router.delete("/{simulation_id}", status_code=200)
 async def delete_node_config(db_session: DBSessionDep, scenario_id: int, simulation_id: int):
@@ -3,7 +3,7 @@ import asyncio
 
 async def create_empty_db():
     async with sessionmanager.connect() as conn:
-        from models.models import Scenario, Simulation, NodeConfiguration
+        from models.models import Scenario, Simulation, NodeConfiguration, SimulationRollup, SimulationEvent, SimulationCheckpoint
         await conn.run_sync(Base.metadata.drop_all)
         await conn.run_sync(Base.metadata.create_all)
     
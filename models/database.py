@@ -15,12 +15,33 @@ from sqlalchemy import event
 Base = declarative_base()
 
 
+# WAL => api can read (list, get, events) while simulation_tasks is writing progress
+# synchronous=NORMAL is durable in WAL mode except the last transactions on power loss
+SQLITE_PRAGMAS = {
+    "foreign_keys": "ON",
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000, # ms, wait for the writer instead of "database is locked"
+    "mmap_size": 268435456, # 256 MB
+    "cache_size": -16000, # 16 MB per connection
+    "temp_store": "MEMORY",
+}
+
 @event.listens_for(Engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
-    cursor.execute("PRAGMA foreign_keys=ON")
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
     cursor.close()
 
+# one writer (simulation_tasks) + concurrent readers (api requests), sqlite serialize writers anyway
+SQLITE_ENGINE_KWARGS = {
+    "pool_size": 8,
+    "max_overflow": 8,
+    "pool_timeout": 30,
+    "pool_recycle": 3600,
+}
+
 # Heavily inspired by https://praciano.com.br/fastapi-and-async-sqlalchemy-20-with-pytest-done-right.html
 
 
@@ -66,7 +87,7 @@ class DatabaseSessionManager:
 
 
 # sessionmanager = DatabaseSessionManager(settings.database_url)
-sessionmanager = DatabaseSessionManager(host = "sqlite+aiosqlite:///wifi_monitor.db")
+sessionmanager = DatabaseSessionManager(host = "sqlite+aiosqlite:///wifi_monitor.db", engine_kwargs = SQLITE_ENGINE_KWARGS)
 
 
 async def get_db_session():
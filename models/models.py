@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import UniqueConstraint, Column, Integer, String, Boolean, DateTime, JSON, Enum, ForeignKey
+from sqlalchemy import DDL, event, UniqueConstraint, Index, Column, Integer, String, Boolean, DateTime, Float, JSON, Enum, ForeignKey
 from sqlalchemy.orm import relationship
 from models.database import Base
 
@@ -32,15 +32,55 @@ class Simulation(Base):
     # required
     title = Column(String, nullable=False) # default=id
     scenario_snapshot = Column(JSON, nullable=False) # ป้องกันการเปลี่ยนแปลง scenario ในอนาคตแล้วงง
-    state = Column(String, nullable=False, default="running")
+    state = Column(String, nullable=False, default="running", index=True)
+    # only for simulation created before simulation_events exist, new progress is written to SimulationEvent
     state_message = Column(String, nullable=False, default="")
+    # only small per-node monitor data, raw samples are kept in utils.sample_store at sample_store_path
     simulation_data = Column(JSON, nullable=False, default={})
+    sample_store_path = Column(String, nullable=True)
     created_at = Column(DateTime, nullable=False)
+    # every network start running at the same time instead of as soon as it is configured (utils.pipeline)
+    synchronized_start = Column(Boolean, nullable=False, default=False)
     
     scenario_id = Column(Integer, ForeignKey("scenarios.scenario_id", ondelete="CASCADE"))
     
     scenario = relationship("Scenario", back_populates="simulations")
 
+    __table_args__ = (
+        # list simulations of scenario, newest first
+        Index("ix_simulations_scenario_id_created_at", "scenario_id", "created_at"),
+    )
+
+class SimulationRollup(Base):
+    __tablename__ = "simulation_rollups"
+    # per-second aggregated result of simulation_data, computed once when simulation is done
+    simulation_id = Column(Integer, ForeignKey("simulations.id", ondelete="CASCADE"), primary_key=True)
+    rollup_data = Column(JSON, nullable=False, default={})
+    created_at = Column(DateTime, nullable=False)
+
+class SimulationCheckpoint(Base):
+    __tablename__ = "simulation_checkpoints"
+    # what simulation_tasks need to resume a run after control server restart (see utils.recovery)
+    # exist only while simulation is running simulation/cancelling/terminating, phase => simulations.state
+    simulation_id = Column(Integer, ForeignKey("simulations.id", ondelete="CASCADE"), primary_key=True)
+    run_context = Column(JSON, nullable=False, default={}) # running_request_data, map_ip_to_alias_name, run_deadline, ...
+    agent_progress = Column(JSON, nullable=False, default={}) # {control_ip: "running" | "finish"}
+    updated_at = Column(DateTime, nullable=False)
+
+class SimulationEvent(Base):
+    __tablename__ = "simulation_events"
+    # append-only progress log of simulation (one row per line), read by id => ?after_id=
+    id = Column(Integer, primary_key=True)
+    simulation_id = Column(Integer, ForeignKey("simulations.id", ondelete="CASCADE"), nullable=False)
+    ts = Column(Float, nullable=False)
+    node = Column(String, nullable=True) # alias_name, "this_device" or null (server itself)
+    level = Column(String, nullable=False, default="info") # info, error, state
+    message = Column(String, nullable=False, default="")
+
+    __table_args__ = (
+        Index("ix_simulation_events_simulation_id_id", "simulation_id", "id"),
+    )
+
 
 class NodeConfiguration(Base):
     __tablename__ = "node_configs"
@@ -64,6 +104,7 @@ class NodeConfiguration(Base):
     scenario = relationship("Scenario", back_populates="node_configs")
 
     __table_args__ = (
+        # also the index of node_configs.scenario_id (leftmost column)
         UniqueConstraint('scenario_id', 'control_ip_addr', name='unique_control_ip_constraint'),
     )
 
@@ -78,4 +119,28 @@ class NodeConfiguration(Base):
                         [timeout and type of server will not presence in db, but it will be parse at runtime] 
         which mean timeout and type of AP will alway be null
     """
-    # NOTE 2: is_active wont be use now
\ No newline at end of file
+    # NOTE 2: is_active wont be use now
+
+# full text search (fts5, external content, trigram => substring match in any language) over names that list endpoints search by
+# kept in sync by trigger, query through utils.search.fts_rowids
+FTS_TABLES = {
+    # fts table: (content table, rowid column, searchable column)
+    "scenarios_fts": ("scenarios", "scenario_id", "scenario_name"),
+    "node_configs_fts": ("node_configs", "id", "alias_name"),
+    "simulations_fts": ("simulations", "id", "title"),
+}
+
+for fts_table, (content_table, rowid, column) in FTS_TABLES.items():
+    for statement in [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5({column}, content='{content_table}', content_rowid='{rowid}', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.{rowid}, new.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.{rowid}, old.{column}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF {column} ON {content_table} BEGIN "
+        f"INSERT INTO {fts_table}({fts_table}, rowid, {column}) VALUES ('delete', old.{rowid}, old.{column}); "
+        f"INSERT INTO {fts_table}(rowid, {column}) VALUES (new.{rowid}, new.{column}); END",
+    ]:
+        event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+    # trigger is dropped together with content table
+    event.listen(Base.metadata, "before_drop", DDL(f"DROP TABLE IF EXISTS {fts_table}").execute_if(dialect="sqlite"))
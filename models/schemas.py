@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from fastapi import HTTPException
-from typing import List, Optional
+from typing import Any, List, Optional
 from models.models import Scenario, Simulation, NodeConfiguration, RadioModeEnum, NetworkModeEnum
 import datetime
 
@@ -95,11 +95,19 @@ class NodeConfigList(BaseModel):
     alias_name: str
     network_mode: NetworkModeEnum # ap, client
     network_ssid: str
+    radio: Optional[RadioModeEnum] = None
+    tx_power: Optional[int] = None
+    simulation_detail: Optional[dict] = None
+    is_active: bool
+    scenario_id: int
+    status: str # active, inactive
     class Config():
         from_attributes = True 
         
 class RunSimulationTitle(BaseModel):
     title: Optional[str] = ""
+    # wait until every network is configured, then start them together
+    synchronized_start: Optional[bool] = False
     
 class SimulationList(BaseModel):
     id: int
@@ -109,5 +117,25 @@ class SimulationList(BaseModel):
     class Config():
         from_attributes = True 
         
+class SimulationEventResponse(BaseModel):
+    id: int
+    ts: float
+    node: Optional[str] = None
+    level: str
+    message: str
+    class Config():
+        from_attributes = True
+
+class SimulationEventPage(BaseModel):
+    events: List[SimulationEventResponse]
+    # pass as after_id of next request to get only new events
+    last_id: int
+
 class KeepAliveRequest(BaseModel):
-    control_ip: str
\ No newline at end of file
+    control_ip: str
+
+class AgentEventRequest(BaseModel):
+    control_ip: str
+    # utils.agent_events.AGENT_EVENTS
+    event: str
+    data: Any = None
@@ -5,7 +5,11 @@ from fastapi.middleware.cors import CORSMiddleware
 import uvicorn, asyncio
 import sqlalchemy, time, socket, threading
 from utils.utils import _get_control_ip_address
-from controller import scenario_controller, node_config_controller, simulation_controller
+from utils.agent_client import agent_client
+from utils.scheduler import scheduler
+from utils.recovery import recover_simulations
+from models.database import sessionmanager
+from controller import scenario_controller, node_config_controller, simulation_controller, agent_controller
 
 def send_time_sync_task(event):
     udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -23,17 +27,24 @@ async def lifespan(app: FastAPI):
     # my_event = threading.Event()
     # loop = asyncio.get_running_loop()
     # udp_socket_thread = loop.run_in_executor(None, send_time_sync_task, my_event)
+    await agent_client.start()
+    app.agent_client = agent_client
+    async with sessionmanager.session() as db_session:
+        await recover_simulations(app.lock, db_session)
+    app.scheduler = scheduler
     web_simulation_process = await asyncio.create_subprocess_shell("python -u ./simulation/server/web_application.py")
     file_simulation_process = await asyncio.create_subprocess_shell("python -u ./simulation/server/file_transfer.py")
     yield
     # my_event.set()
+    # running simulations are detached (agents keep running), resumed at next startup
+    await scheduler.shutdown()
     web_simulation_process.terminate()
     file_simulation_process.terminate()
+    await agent_client.close()
 
 app = FastAPI(lifespan=lifespan)
 
 app.lock = asyncio.Lock()
-app.running_task = None
 
 # CORS configuration
 origins = [
@@ -48,13 +59,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # pagination header of list endpoints
+    expose_headers=["X-Total-Count", "X-Next-After"],
 )
 
 
-print(app.running_task)
 app.include_router(scenario_controller.router)
 app.include_router(node_config_controller.router)
 app.include_router(simulation_controller.router)
+app.include_router(agent_controller.router)
 
 @app.exception_handler(sqlalchemy.exc.IntegrityError)
 async def unicorn_exception_handler(request: Request, exc: sqlalchemy.exc.IntegrityError):
@@ -0,0 +1,11 @@
+from models.schemas import AgentEventRequest
+from utils.agent_events import agent_events, AGENT_EVENTS
+from fastapi import HTTPException
+
+async def recv_agent_event(request_body: AgentEventRequest):
+    if request_body.event not in AGENT_EVENTS:
+        raise HTTPException(400, f"event must be one of {', '.join(AGENT_EVENTS)}")
+    if not agent_events.publish(request_body.control_ip, request_body.event, request_body.data):
+        # node isn't in a running simulation (e.g. late event after finish), agent doesn't need to retry
+        return {"message": "ignored"}
+    return {"message": "done"}
@@ -3,7 +3,8 @@ from models.schemas import NodeConfigRequest, KeepAliveRequest
 from utils.utils import parse_network_from_node_config
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_
+from sqlalchemy import select, update, func
+from utils.search import fts_rowids, parse_after_id, validate_page_size
 import time
 
 active_last_seen = {}
@@ -43,7 +44,9 @@ async def create_node_config(db_session: AsyncSession, scenario_id: int, request
     # return new response
     return new_node
 
-async def list_node_configs(db_session: AsyncSession, scenario_id: int, page_size: int, page: int, search: str):
+async def list_node_configs(db_session: AsyncSession, scenario_id: int, page_size: int, page: int, search: str, after: str = None):
+    # => (node_configs, total, next_after)
+    validate_page_size(page_size)
     scenario = (
         await db_session.scalars(
             select(Scenario)
@@ -53,27 +56,40 @@ async def list_node_configs(db_session: AsyncSession, scenario_id: int, page_siz
     ).first()
     if not scenario:
         raise HTTPException(404, "scenario not found")
-    node_configs = (
-        await db_session.scalars(
-            select(NodeConfiguration)
-            .where(
-                and_(
-                    NodeConfiguration.alias_name.regexp_match(search),
-                    NodeConfiguration.scenario==scenario
-                )
-            )
-            .limit(page_size)
-            .offset((page-1)*page_size)
+    conditions = [NodeConfiguration.scenario_id==scenario.scenario_id]
+    matched_ids = fts_rowids("node_configs_fts", search)
+    if matched_ids is not None:
+        conditions.append(NodeConfiguration.id.in_(matched_ids))
+    total = await db_session.scalar(select(func.count()).select_from(NodeConfiguration).where(*conditions))
+    query = (
+        select(
+            NodeConfiguration.id,
+            NodeConfiguration.control_ip_addr,
+            NodeConfiguration.alias_name,
+            NodeConfiguration.network_mode,
+            NodeConfiguration.network_ssid,
+            NodeConfiguration.radio,
+            NodeConfiguration.tx_power,
+            NodeConfiguration.simulation_detail,
+            NodeConfiguration.is_active,
+            NodeConfiguration.scenario_id,
         )
-    ).all()
+        .where(*conditions)
+        .order_by(NodeConfiguration.id)
+    )
+    if after is not None:
+        query = query.where(NodeConfiguration.id > parse_after_id(after))
+    else:
+        query = query.offset((page-1)*page_size)
+    node_configs = (await db_session.execute(query.limit(page_size))).all()
+    next_after = str(node_configs[-1].id) if len(node_configs) == page_size else None
     
-    node_configs_list = [{k: v for k, v in node_config.__dict__.items() if k != '_sa_instance_state'} for node_config in node_configs]
-    for node_config in node_configs_list:
-        if node_config["control_ip_addr"] in active_last_seen and time.time() < active_last_seen[node_config["control_ip_addr"]] + 180:
-            node_config["status"] = "active"
-        else:
-            node_config["status"] = "inactive"
-    return node_configs_list
+    now = time.time()
+    node_configs_list = []
+    for node_config in node_configs:
+        last_seen = active_last_seen.get(node_config.control_ip_addr)
+        node_configs_list.append({**node_config._mapping, "status": "active" if last_seen is not None and now < last_seen + 180 else "inactive"})
+    return node_configs_list, total, next_after
 
 async def update_node_config(db_session: AsyncSession, node_config_id: int, request_body: NodeConfigRequest):
     # validate request
@@ -2,7 +2,9 @@ from models.models import Scenario, Simulation, NodeConfiguration
 from models.schemas import ScenarioRequest
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete
+from sqlalchemy import select, update, delete, func
+from utils.search import fts_rowids, parse_after_id, validate_page_size
+from utils.sample_store import delete_simulation_samples
 
 async def create_scenario(db_session: AsyncSession, request_body: ScenarioRequest):
     # validate request
@@ -17,17 +19,27 @@ async def create_scenario(db_session: AsyncSession, request_body: ScenarioReques
     # return new response
     return new_scenario
 
-async def list_scenarios(db_session: AsyncSession, page_size: int, page: int, search: str):
-    scenarios = (
-        await db_session.scalars(
-            select(Scenario)
-            .where(Scenario.scenario_name.regexp_match(search))
-            .limit(page_size)
-            .offset((page-1)*page_size)
-        )
-    ).all()
-    
-    return scenarios
+async def list_scenarios(db_session: AsyncSession, page_size: int, page: int, search: str, after: str = None):
+    # => (scenarios, total, next_after)
+    validate_page_size(page_size)
+    conditions = []
+    matched_ids = fts_rowids("scenarios_fts", search)
+    if matched_ids is not None:
+        conditions.append(Scenario.scenario_id.in_(matched_ids))
+    total = await db_session.scalar(select(func.count()).select_from(Scenario).where(*conditions))
+    # only what ScenarioListResponse need, row => response directly
+    query = (
+        select(Scenario.scenario_id, Scenario.scenario_name, Scenario.is_using_target_ap)
+        .where(*conditions)
+        .order_by(Scenario.scenario_id)
+    )
+    if after is not None:
+        query = query.where(Scenario.scenario_id > parse_after_id(after))
+    else:
+        query = query.offset((page-1)*page_size)
+    scenarios = (await db_session.execute(query.limit(page_size))).all()
+    next_after = str(scenarios[-1].scenario_id) if len(scenarios) == page_size else None
+    return scenarios, total, next_after
 
 async def get_scenario(db_session: AsyncSession, scenario_id: int):
     # query scenario
@@ -76,6 +88,12 @@ async def delete_scenario(db_session: AsyncSession, scenario_id: int):
     if not scenario:
         raise HTTPException(404, "scenario not found")
     # delete scenario
+    sample_store_paths = (
+        await db_session.scalars(
+            select(Simulation.sample_store_path)
+            .where(Simulation.scenario==scenario)
+        )
+    ).all()
     await db_session.execute(
         delete(NodeConfiguration)
         .where(NodeConfiguration.scenario==scenario)
@@ -86,6 +104,8 @@ async def delete_scenario(db_session: AsyncSession, scenario_id: int):
     )
     await db_session.delete(scenario)
     await db_session.commit()
+    for sample_store_path in sample_store_paths:
+        delete_simulation_samples(sample_store_path)
     return {"message": "done"}
     
     
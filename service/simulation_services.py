@@ -1,15 +1,21 @@
-import asyncio
+import asyncio, time
 from datetime import datetime
-from models.models import Scenario, Simulation, NodeConfiguration
+from models.models import Scenario, Simulation, SimulationEvent, NodeConfiguration
 from models.schemas import RunSimulationTitle
 from utils.utils import parse_network_from_node_config
-from utils.tasks import simulation_tasks
+from utils.tasks import run_scheduled_simulation
+from utils.rollup import build_simulation_rollup, build_simulation_rollup_from_store, filter_simulation_rollup, get_simulation_rollup, save_simulation_rollup
+from utils.sample_store import delete_simulation_samples
+from utils.live import simulation_broker, format_sse
+from utils.scheduler import scheduler, network_resources, TERMINATED_STATES, QUEUED_STATE
 from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, and_
+from sqlalchemy import select, insert, update, and_, func, tuple_
+from utils.search import fts_rowids, parse_after_created_at_id, format_after_created_at_id, validate_page_size
+from sqlalchemy.orm import defer
 
-
-async def run_simulation(lock: asyncio.Lock, db_session: AsyncSession, request_body: RunSimulationTitle, request: Request, scenario_id: int):
+async def run_simulation(lock: asyncio.Lock, db_session: AsyncSession, request_body: RunSimulationTitle, scenario_id: int):
     scenario = (
         await db_session.scalars(
             select(Scenario)
@@ -32,57 +38,50 @@ async def run_simulation(lock: asyncio.Lock, db_session: AsyncSession, request_b
     if not network_preview["enable_to_run"]:
         raise HTTPException(400, network_preview)
     
-    terminated_state = ["cancelled [terminate with success]", "cancelled [terminate with error]", "failed", "finished"]
-    async with lock:
-        lastest_simulation = (
-            await db_session.scalars(
-                select(Simulation)
-                .order_by(Simulation.created_at.desc())
-            )
-        ).first()
-        if lastest_simulation and lastest_simulation.state not in terminated_state:
-            raise HTTPException(400, "there are simulation running now")
-        # create new simulation record
-        new_simulation = Simulation(
-            title=request_body.title,
-            scenario_snapshot=network_preview["network_info"],
-            state="starting",
-            created_at=datetime.now(),
-            scenario=scenario
-        )
-        db_session.add(new_simulation)
-        await db_session.commit()
-        await db_session.refresh(new_simulation)
-        # schedule the task
-        request.app.running_task = asyncio.create_task(
-            simulation_tasks(
-                lock, 
-                db_session, 
-                request, 
-                new_simulation, 
-                network_preview["network_info"], 
-                scenario.target_ap_password, 
-                scenario.target_ap_radio
-            )
+    # create new simulation record, it wait in scheduler queue until no running simulation use the same node/ssid
+    new_simulation = Simulation(
+        title=request_body.title,
+        scenario_snapshot=network_preview["network_info"],
+        state=QUEUED_STATE,
+        created_at=datetime.now(),
+        synchronized_start=bool(request_body.synchronized_start),
+        scenario=scenario
+    )
+    db_session.add(new_simulation)
+    await db_session.commit()
+    await db_session.refresh(new_simulation)
+    resources = network_resources(network_preview["network_info"])
+    conflicts = scheduler.conflicts(resources)
+    # schedule the task
+    started = scheduler.submit(
+        new_simulation.id,
+        resources,
+        lambda: run_scheduled_simulation(
+            lock, 
+            new_simulation.id, 
+            network_preview["network_info"], 
+            scenario.target_ap_password, 
+            scenario.target_ap_radio
         )
+    )
+    if started:
         return {"detail": "task has been scheduled", "simulation": new_simulation}
+    return {"detail": "task has been queued", "simulation": new_simulation, "waiting_for": conflicts}
 
-async def cancel_simulation(lock: asyncio.Lock, db_session: AsyncSession, request: Request, scenario_id: int, simulation_id: int):
-    can_cancel_states = ["starting", "configuring access point", "configuring client wifi", "running simulation"]
-    async with lock:
-        simulation = (
-            await db_session.scalars(
-                select(Simulation)
-                .where(Simulation.id==simulation_id)
-                .limit(1)
-            )
-        ).first()
-        if simulation.state in can_cancel_states and request.app.running_task is not None:
-            request.app.running_task.cancel()
-            return {"detail": "Cancel Signal has been sent"}
-        return {"detail": "Cancel Signal has been sent"}
+async def cancel_simulation(lock: asyncio.Lock, db_session: AsyncSession, scenario_id: int, simulation_id: int):
+    # queued => removed from queue, running (and not already cancelling/terminating) => task is cancelled
+    if scheduler.cancel(simulation_id) == "dequeued":
+        state = "cancelled [terminate with success]"
+        async with lock:
+            await db_session.execute(insert(SimulationEvent), [{"simulation_id": simulation_id, "ts": time.time(), "node": None, "level": "state", "message": state}])
+            await db_session.execute(update(Simulation).where(Simulation.id==simulation_id).values(state=state))
+            await db_session.commit()
+        simulation_broker.publish(simulation_id, "state", {"state": state})
+    return {"detail": "Cancel Signal has been sent"}
 
-async def list_simulations(db_session: AsyncSession, scenario_id: int, page_size: int, page: int, search: str):
+async def list_simulations(db_session: AsyncSession, scenario_id: int, page_size: int, page: int, search: str, after: str = None):
+    # => (simulations, total, next_after), newest first
+    validate_page_size(page_size)
     scenario = (
         await db_session.scalars(
             select(Scenario)
@@ -92,174 +91,140 @@ async def list_simulations(db_session: AsyncSession, scenario_id: int, page_size
     ).first()
     if not scenario:
         raise HTTPException(404, "scenario not found")
-    simulations = (
-        await db_session.scalars(
-            select(
-                Simulation
-            )
-            .where(
-                and_(
-                    Simulation.title.regexp_match(search),
-                    Simulation.scenario==scenario
-                )
-            )
-            .order_by(Simulation.created_at.desc())
-            .limit(page_size)
-            .offset((page-1)*page_size)
-        )
-    ).all()
-    print(simulations)
-    return simulations
+    conditions = [Simulation.scenario_id==scenario.scenario_id]
+    matched_ids = fts_rowids("simulations_fts", search)
+    if matched_ids is not None:
+        conditions.append(Simulation.id.in_(matched_ids))
+    total = await db_session.scalar(select(func.count()).select_from(Simulation).where(*conditions))
+    # (scenario_id, created_at) index, id break the tie of same created_at
+    # only what SimulationList need, row => response directly (json columns are never loaded)
+    query = (
+        select(Simulation.id, Simulation.title, Simulation.created_at, Simulation.state)
+        .where(*conditions)
+        .order_by(Simulation.created_at.desc(), Simulation.id.desc())
+    )
+    if after is not None:
+        query = query.where(tuple_(Simulation.created_at, Simulation.id) < tuple_(*parse_after_created_at_id(after)))
+    else:
+        query = query.offset((page-1)*page_size)
+    simulations = (await db_session.execute(query.limit(page_size))).all()
+    next_after = format_after_created_at_id(simulations[-1].created_at, simulations[-1].id) if len(simulations) == page_size else None
+    return simulations, total, next_after
 
-async def get_simulation(db_session: AsyncSession, simulation_id: int):
+async def get_simulation(db_session: AsyncSession, simulation_id: int, node: str = None, metric: str = None, start: float = None, end: float = None, points: int = None):
     simulation = (
         await db_session.scalars(
             select(Simulation)
+            .options(defer(Simulation.simulation_data), defer(Simulation.state_message))
             .where(Simulation.id==simulation_id)
             .limit(1)
         )
     ).first()
     if not simulation:
         raise HTTPException(404, "simulation not found")
-    map_client_to_ap = {}
-    for ssid in simulation.scenario_snapshot:
-        if len((simulation.scenario_snapshot[ssid]["aps"])) > 0:
-            ap_control_ip = next(iter(simulation.scenario_snapshot[ssid]["aps"]))
-        else:
-            ap_control_ip = "this_device"
-        for client in simulation.scenario_snapshot[ssid]["clients"]:
-            map_client_to_ap[client] = ap_control_ip
-    # print(simulation.simulation_data)
-    simulation_data = {}
-    simulation_udp_deterministic_client_data = {}
-    simulation_udp_deterministic_server_data = {}
-    # print(simulation.simulation_data)
-    for control_ip in simulation.simulation_data:
-        if control_ip != "this_device":
-            simulation_data[control_ip] = {field: simulation.simulation_data[control_ip][field] for field in simulation.simulation_data[control_ip] if field in {"Tx-Power", "Signal", "Noise", "BitRate", "ping_RTT"}}
-        if "udp_deterministic_client_data_monitored_from_server" in simulation.simulation_data[control_ip]:
-            client_data = simulation.simulation_data[control_ip]["udp_deterministic_client_data_monitored_from_server"]
-            simulation_udp_deterministic_client_data[control_ip] = {}
-            for client_ip in client_data:
-                # [read_timestamp, seq_number, (send_timestamp, diff, len(data))]
-                until = 0; expected_seq=0; tmp_latency_data = []; tmp_lost_data = []
-                for data in client_data[client_ip]:
-                    # move to next one sec
-                    if data[0] >= until:
-                        if until > 0:
-                            tmp_latency_data.append((data[0], sum_latency/cnt))
-                            tmp_lost_data.append((data[0], lost))
-                        cnt = 0; lost = 0; sum_latency = 0; until = data[0] + 1
-                    sum_latency += data[2][1]
-                    # ไม่ลองรับ out-of-order
-                    lost += data[1] - expected_seq
-                    expected_seq = data[1] + 1
-                    cnt += 1
-                simulation_udp_deterministic_client_data[control_ip][client_ip] = {"lost_count": tmp_lost_data, "average_latency": tmp_latency_data}
-        if "udp_deterministic_server_data_monitored_from_client" in simulation.simulation_data[control_ip]:
-            server_data = simulation.simulation_data[control_ip]["udp_deterministic_server_data_monitored_from_client"]
-            ap_control_ip = map_client_to_ap[control_ip]
-            if ap_control_ip not in simulation_udp_deterministic_server_data:
-                simulation_udp_deterministic_server_data[ap_control_ip] = {}
-            until = 0; expected_seq=0; tmp_latency_data = []; tmp_lost_data = []
-            print(len(server_data))
-            for data in server_data:
-                # move to next one sec
-                if data[0] >= until:
-                    if until > 0:
-                        tmp_latency_data.append((data[0], sum_latency/cnt))
-                        tmp_lost_data.append((data[0], lost))
-                    cnt = 0; lost = 0; sum_latency = 0; until = data[0] + 1
-                sum_latency += data[2][1]
-                # ไม่ลองรับ out-of-order
-                lost += data[1] - expected_seq
-                expected_seq = data[1] + 1
-                cnt += 1
-            if control_ip not in simulation_udp_deterministic_server_data[ap_control_ip]:
-                simulation_udp_deterministic_server_data[ap_control_ip][control_ip] = {}
-            simulation_udp_deterministic_server_data[ap_control_ip][control_ip].update({"lost_count": tmp_lost_data, "average_latency": tmp_latency_data})
-        if "file_average_data_rates" in simulation.simulation_data[control_ip]:
-            server_data = simulation.simulation_data[control_ip]["file_average_data_rates"]
-            ap_control_ip = map_client_to_ap[control_ip]
-            if ap_control_ip not in simulation_udp_deterministic_server_data:
-                simulation_udp_deterministic_server_data[ap_control_ip] = {}
-            tmp_data_rates = []
-            if len(server_data) > 0:
-                start_time = server_data[0][0]
-                data_rate_sum = server_data[0][1]/(server_data[0][0] - server_data[0][2])
-                cnt = 1
-                tmp_data_rates.append((server_data[0][0], data_rate_sum/cnt))
-                now = start_time + 1
-            print(len(server_data))
-            for data in server_data:
-                if data[0] >= now:
-                    tmp_data_rates.append((now, data_rate_sum/cnt))
-                    now += 1
-                    while data[0] - now >= 1:
-                        tmp_data_rates.append((now, data_rate_sum/cnt))
-                        now += 1
-                data_rate_sum += data[1]/(data[0] - data[2])
-                cnt += 1
-                if data == server_data[-1]:
-                    tmp_data_rates.append((now, data_rate_sum/cnt))            
-            if control_ip not in simulation_udp_deterministic_server_data[ap_control_ip]:
-                simulation_udp_deterministic_server_data[ap_control_ip][control_ip] = {}
-            simulation_udp_deterministic_server_data[ap_control_ip][control_ip].update({"file_average_data_rates": tmp_data_rates})
-        if "web_average_data_rates" in simulation.simulation_data[control_ip]:
-            server_data = simulation.simulation_data[control_ip]["web_average_data_rates"]
-            ap_control_ip = map_client_to_ap[control_ip]
-            if ap_control_ip not in simulation_udp_deterministic_server_data:
-                simulation_udp_deterministic_server_data[ap_control_ip] = {}
-            tmp_data_rates = []
-            if len(server_data) > 0:
-                start_time = server_data[0][0]
-                data_rate_sum = server_data[0][1]/(server_data[0][0] - server_data[0][2])
-                cnt = 1
-                tmp_data_rates.append((server_data[0][0], data_rate_sum/cnt))
-                now = start_time + 1
-            print(len(server_data))
-            for data in server_data:
-                if data[0] >= now:
-                    tmp_data_rates.append((now, data_rate_sum/cnt))
-                    now += 1
-                    while data[0] - now >= 1:
-                        tmp_data_rates.append((now, data_rate_sum/cnt))
-                        now += 1
-                data_rate_sum += data[1]/(data[0] - data[2])
-                cnt += 1
-                if data == server_data[-1]:
-                    tmp_data_rates.append((now, data_rate_sum/cnt)) 
-            if control_ip not in simulation_udp_deterministic_server_data[ap_control_ip]:
-                simulation_udp_deterministic_server_data[ap_control_ip][control_ip] = {}
-            simulation_udp_deterministic_server_data[ap_control_ip][control_ip].update({"web_average_data_rates": tmp_data_rates})
-    # simulation_data.update({
-    #     "udp_deterministic_server_data_monitored_from_client": simulation_udp_deterministic_server_data,
-    #     "udp_deterministic_client_data_monitored_from_server": simulation_udp_deterministic_client_data
-    # })
-    print(simulation.simulation_data)
+    rollup = await get_simulation_rollup(db_session, simulation.id)
+    if rollup is not None:
+        rollup_data = rollup.rollup_data
+    elif simulation.state in TERMINATED_STATES:
+        # simulation that finished before rollup exist, compute it once and keep it
+        simulation_data = await db_session.scalar(select(Simulation.simulation_data).where(Simulation.id==simulation_id))
+        rollup_data = await asyncio.to_thread(build_simulation_rollup_from_store, simulation.scenario_snapshot, simulation_data, simulation.sample_store_path)
+        await save_simulation_rollup(db_session, simulation, rollup_data)
+    else:
+        # still running => monitor data not collected yet
+        rollup_data = build_simulation_rollup(simulation.scenario_snapshot, {}, {})
+    if node or metric or start is not None or end is not None or points:
+        if points is not None and points < 3:
+            raise HTTPException(400, "points must be at least 3")
+        rollup_data = filter_simulation_rollup(
+            rollup_data,
+            nodes=set(node.split(",")) if node else None,
+            metrics=set(metric.split(",")) if metric else None,
+            start=start, end=end, points=points
+        )
     return {
         "id": simulation.id,
         "title": simulation.title,
         "scenario_snapshot": simulation.scenario_snapshot,
         "state": simulation.state,
-        "state_message": simulation.state_message,
-        "simulation_data": simulation_data,
-        "udp_deterministic_server_data_monitored_from_client": simulation_udp_deterministic_server_data,
-        "udp_deterministic_client_data_monitored_from_server": simulation_udp_deterministic_client_data,
+        "simulation_data": rollup_data["simulation_data"],
+        "udp_deterministic_server_data_monitored_from_client": rollup_data["udp_deterministic_server_data_monitored_from_client"],
+        "udp_deterministic_client_data_monitored_from_server": rollup_data["udp_deterministic_client_data_monitored_from_server"],
         "created_at": simulation.created_at,
         "scenario_id": simulation.scenario_id
     }
         
+async def list_simulation_events(db_session: AsyncSession, simulation_id: int, after_id: int = None, limit: int = 500, node: str = None, level: str = None):
+    if limit < 1 or limit > 5000:
+        raise HTTPException(400, "limit must be between 1 and 5000")
+    exists = await db_session.scalar(select(Simulation.id).where(Simulation.id==simulation_id))
+    if exists is None:
+        raise HTTPException(404, "simulation not found")
+    conditions = [SimulationEvent.simulation_id==simulation_id]
+    if node:
+        conditions.append(SimulationEvent.node.in_(node.split(",")))
+    if level:
+        conditions.append(SimulationEvent.level.in_(level.split(",")))
+    if after_id is None:
+        # tail => the last `limit` events
+        events = (
+            await db_session.scalars(
+                select(SimulationEvent)
+                .where(and_(*conditions))
+                .order_by(SimulationEvent.id.desc())
+                .limit(limit)
+            )
+        ).all()[::-1]
+    else:
+        events = (
+            await db_session.scalars(
+                select(SimulationEvent)
+                .where(and_(*conditions, SimulationEvent.id > after_id))
+                .order_by(SimulationEvent.id)
+                .limit(limit)
+            )
+        ).all()
+    last_id = events[-1].id if events else (after_id or 0)
+    return {"events": events, "last_id": last_id}
+
+async def stream_simulation(db_session: AsyncSession, simulation_id: int, request: Request):
+    state = await db_session.scalar(select(Simulation.state).where(Simulation.id==simulation_id))
+    if state is None:
+        raise HTTPException(404, "simulation not found")
+    # subscribe before sending the current state, so nothing happen in between is lost
+    queue = simulation_broker.subscribe(simulation_id)
+    async def event_generator():
+        try:
+            yield format_sse("state", {"timestamp": time.time(), "state": state})
+            if state in TERMINATED_STATES:
+                return
+            while not await request.is_disconnected():
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # keep the connection alive through proxy
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, data)
+                if event == "state" and data["state"] in TERMINATED_STATES:
+                    return
+        finally:
+            simulation_broker.unsubscribe(simulation_id, queue)
+    return StreamingResponse(event_generator(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 async def delete_simulation(db_session: AsyncSession, simulation_id: int):
     simulation = (
         await db_session.scalars(
             select(Simulation)
+            .options(defer(Simulation.scenario_snapshot), defer(Simulation.simulation_data))
             .where(Simulation.id==simulation_id)
             .limit(1)
         )
     ).first()
     if not simulation:
         raise HTTPException(404, "simulation not found")
+    sample_store_path = simulation.sample_store_path
     await db_session.delete(simulation)
     await db_session.commit()
+    delete_simulation_samples(sample_store_path)
     return {"message": "done"}
\ No newline at end of file
@@ -0,0 +1,176 @@
+import ctypes, ctypes.util, errno, os, socket, struct, sys
+
+# batched datagram io for high packet rate (server/client udp_window_deterministic.py "batch" io mode)
+#   linux + ipv4 => recvmmsg / sendmmsg through ctypes, one syscall for a whole batch
+#   otherwise    => non-blocking recvfrom / sendto loop until the batch is full or the socket would block
+# socket must be non-blocking, nothing here ever wait on select
+
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+
+class _iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+class _sockaddr_in(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16), ("sin_addr", ctypes.c_ubyte * 4), ("sin_zero", ctypes.c_ubyte * 8)]
+
+class _msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+class _mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _msghdr), ("msg_len", ctypes.c_uint)]
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "recvmmsg") or not hasattr(libc, "sendmmsg"):
+        return None
+    libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_mmsghdr), ctypes.c_uint, ctypes.c_int]
+    return libc
+
+_libc = _load_libc()
+
+# field offsets for struct.pack_into / unpack_from on the arrays (ctypes attribute access per packet is slower than the syscall saved)
+_IOV_LEN = _iovec.iov_len.offset
+_MSG_NAME = _mmsghdr.msg_hdr.offset + _msghdr.msg_name.offset
+_MSG_NAMELEN = _mmsghdr.msg_hdr.offset + _msghdr.msg_namelen.offset
+_MSG_LEN = _mmsghdr.msg_len.offset
+_ADDRESS = _sockaddr_in.sin_port.offset
+
+class BatchSocket:
+    def __init__(self, sock: socket.socket, batch_size: int = 64, buffer_size: int = 2048, use_mmsg: bool = True):
+        self.sock = sock
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.use_mmsg = use_mmsg and _libc is not None and sock.family == socket.AF_INET
+        if self.use_mmsg:
+            self._recv = self._make_messages()
+            self._send = self._make_messages()
+            # recv_batch reset every msg_namelen (value-result) by copying this
+            self._recv_template = bytes(self._recv[3])
+            self._recv_lengths = self._recv[3].cast("I")
+            self._recv_ports = self._recv[1].cast("H")
+            self._recv_ips = self._recv[1].cast("I")
+            # (port, ip) as in sockaddr_in => (ip, port) / (ip, port) => address of its sockaddr_in, clients are few
+            self._addresses = {}
+            self._sockaddrs = {}
+            # what each send slot hold now, only changed length / address is written
+            self._send_lengths = [self.buffer_size] * self.batch_size
+            self._send_addresses = [None] * self.batch_size
+
+    def _make_messages(self):
+        # => (data view, names view, iovecs view, messages view, messages array), every iovec point to its own buffer
+        buffers = (ctypes.c_char * (self.buffer_size * self.batch_size))()
+        names = (_sockaddr_in * self.batch_size)()
+        iovecs = (_iovec * self.batch_size)()
+        messages = (_mmsghdr * self.batch_size)()
+        for i in range(self.batch_size):
+            iovecs[i].iov_base = ctypes.addressof(buffers) + i * self.buffer_size
+            iovecs[i].iov_len = self.buffer_size
+            messages[i].msg_hdr.msg_name = ctypes.addressof(names[i])
+            messages[i].msg_hdr.msg_namelen = ctypes.sizeof(_sockaddr_in)
+            messages[i].msg_hdr.msg_iov = ctypes.pointer(iovecs[i])
+            messages[i].msg_hdr.msg_iovlen = 1
+        self._keep_alive = getattr(self, "_keep_alive", []) + [buffers, names, iovecs]
+        return memoryview(buffers).cast("B"), memoryview(names).cast("B"), memoryview(iovecs).cast("B"), memoryview(messages).cast("B"), messages
+
+    def _sockaddr(self, addr) -> int:
+        if addr not in self._sockaddrs:
+            sockaddr = _sockaddr_in()
+            sockaddr.sin_family = socket.AF_INET
+            sockaddr.sin_port = socket.htons(addr[1])
+            sockaddr.sin_addr[:] = socket.inet_aton(addr[0])
+            self._keep_alive.append(sockaddr)
+            self._sockaddrs[addr] = ctypes.addressof(sockaddr)
+        return self._sockaddrs[addr]
+
+    def recv_batch(self) -> list:
+        # => [(data, addr)], empty when nothing is waiting
+        if not self.use_mmsg:
+            packets = []
+            for _ in range(self.batch_size):
+                try:
+                    packets.append(self.sock.recvfrom(self.buffer_size))
+                except BlockingIOError:
+                    break
+            return packets
+        data, names, _, messages_view, messages = self._recv
+        messages_view[:] = self._recv_template
+        count = _libc.recvmmsg(self.sock.fileno(), messages, self.batch_size, MSG_DONTWAIT, None)
+        if count < 0:
+            error = ctypes.get_errno()
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return []
+            raise OSError(error, f"recvmmsg failed: {os.strerror(error)}")
+        packets = []
+        lengths, ports, ips, addresses, buffer_size = self._recv_lengths, self._recv_ports, self._recv_ips, self._addresses, self.buffer_size
+        message_step = ctypes.sizeof(_mmsghdr) // 4; name_step = ctypes.sizeof(_sockaddr_in)
+        for i in range(count):
+            key = (ports[(i*name_step+_ADDRESS)//2], ips[(i*name_step+_ADDRESS+2)//4])
+            addr = addresses.get(key)
+            if addr is None:
+                sockaddr = names[i*name_step+_ADDRESS:i*name_step+_ADDRESS+6].tobytes()
+                addr = addresses[key] = (socket.inet_ntoa(sockaddr[2:]), int.from_bytes(sockaddr[:2], "big"))
+            start = i * buffer_size
+            packets.append((data[start:start+lengths[i*message_step+_MSG_LEN//4]].tobytes(), addr))
+        return packets
+
+    def send_batch(self, packets: list) -> int:
+        # packets => [(data, addr)], => number of packets sent from the start (the rest would block)
+        if not self.use_mmsg:
+            sent = 0
+            for data, addr in packets:
+                try:
+                    self.sock.sendto(data, addr)
+                except BlockingIOError:
+                    break
+                sent += 1
+            return sent
+        buffers, _, iovecs, messages_view, messages = self._send
+        message_size = ctypes.sizeof(_mmsghdr); iovec_size = ctypes.sizeof(_iovec); buffer_size = self.buffer_size
+        lengths, addresses = self._send_lengths, self._send_addresses
+        sent = 0
+        while sent < len(packets):
+            count = 0
+            for data, addr in packets[sent:sent+self.batch_size]:
+                length = len(data)
+                if length > buffer_size:
+                    break
+                buffers[count*buffer_size:count*buffer_size+length] = data
+                if lengths[count] != length:
+                    struct.pack_into("N", iovecs, count*iovec_size+_IOV_LEN, length)
+                    lengths[count] = length
+                if addresses[count] != addr:
+                    struct.pack_into("P", messages_view, count*message_size+_MSG_NAME, self._sockaddr(addr))
+                    addresses[count] = addr
+                count += 1
+            if count == 0:
+                # bigger than a buffer, sent alone
+                try:
+                    self.sock.sendto(*packets[sent])
+                except BlockingIOError:
+                    break
+                sent += 1
+                continue
+            result = _libc.sendmmsg(self.sock.fileno(), messages, count, MSG_DONTWAIT)
+            if result < 0:
+                error = ctypes.get_errno()
+                if error in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise OSError(error, f"sendmmsg failed: {os.strerror(error)}")
+            sent += result
+            if result < count:
+                break
+        return sent
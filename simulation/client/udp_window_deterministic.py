@@ -1,5 +1,10 @@
-import select, sys, json
+import select, sys, os, json, struct
 import socket, asyncio, time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from batch_io import BatchSocket
+except ImportError:
+    BatchSocket = None
 
 timeout = 60
 average_packet_size = 128
@@ -23,20 +28,65 @@ error_log = {}
 recv_bytes = {}
 send_bytes = {}
 monitor_data = []
+# socket io (8th argument)
+#   select => select before every recvfrom / sendto (one packet per syscall)
+#   batch  => drain every waiting packet with recvmmsg, send without select (simulation/batch_io.py)
+io_mode = "select"
+IO_BATCH = 64
+# simulate packet format (9th argument), same codec as simulation/server/udp_window_deterministic.py
+#   binary => asked in the initial message, used only if the ack confirm it (older server => ascii)
+#   ascii  => "{seq:07d}{send_timestamp:.7f}" + padding, seq wrap at ASCII_SEQ_WRAP and is unwrapped on receive
+packet_format = "binary"
+PACKET_HEADER = struct.Struct("<BQd")
+BINARY_PACKET_VERSION = 0x81
+ASCII_SEQ_WRAP = 10**7
+# last received ascii seq of the server (unwrapped)
+last_seq_number = 0
+BINARY_ACK = b"parameters recieved packet_format:binary"
+
+def parse_packet_header(data):
+    # => seq_number, send_timestamp, padding is never touched
+    if data[0] == BINARY_PACKET_VERSION:
+        _, seq_number, send_timestamp = PACKET_HEADER.unpack_from(data)
+        return seq_number, send_timestamp
+    return int(data[:7]), float(data[7:25])
+
+def new_packet(packet_format, size):
+    # reused for every packet, only the header is written again
+    if packet_format == "binary":
+        return bytearray(PACKET_HEADER.size) + bytearray(b"a" * max(size - PACKET_HEADER.size, 0))
+    return bytearray(b"0" * 25) + bytearray(b"a" * max(size - 25, 0))
+
+def write_packet_header(packet, packet_format, seq_number, send_timestamp):
+    if packet_format == "binary":
+        PACKET_HEADER.pack_into(packet, 0, BINARY_PACKET_VERSION, seq_number, send_timestamp)
+    else:
+        # always 25 bytes, the packet is reused (8 digits seq would make it grow by one byte every send)
+        packet[0:25] = (b"%07d%18.7f" % (seq_number % ASCII_SEQ_WRAP, send_timestamp))[:25]
+
+def unwrap_seq_number(seq_number, last_seq_number):
+    # ascii seq (mod ASCII_SEQ_WRAP) => full seq, the one nearest to the last seq of the same sender
+    seq_number += last_seq_number - last_seq_number % ASCII_SEQ_WRAP
+    if seq_number < last_seq_number - ASCII_SEQ_WRAP // 2:
+        seq_number += ASCII_SEQ_WRAP
+    elif seq_number > last_seq_number + ASCII_SEQ_WRAP // 2 and seq_number >= ASCII_SEQ_WRAP:
+        seq_number -= ASCII_SEQ_WRAP
+    return seq_number
 
 def parsing_header_information(data, addr, read_timestamp):
     # [str(0).zfill(7).encode(), f"{time.time():.7f}".encode(), ((average_packet_size-25)*"a").encode()]
-    global monitor_data; global parameters
+    global monitor_data; global parameters; global last_seq_number
     try:
         if data is None or addr is None:
             return
-        seq_number = int(data[:7])
-        send_timestamp = float(data[7:25])
+        seq_number, send_timestamp = parse_packet_header(data)
+        if data[0] != BINARY_PACKET_VERSION:
+            seq_number = last_seq_number = unwrap_seq_number(seq_number, last_seq_number)
         read_timestamp = time.time()
         diff = read_timestamp - send_timestamp
         # print(diff, send_timestamp, read_timestamp, data[:30])
         monitor_data.append([read_timestamp, seq_number, (send_timestamp, diff, len(data))])
-    except ValueError:
+    except (ValueError, IndexError, struct.error):
         pass
 
 # ไปทำที่ control แล้วโยนเข้ามาดีกว่า
@@ -56,7 +106,6 @@ def recv_from(buf_size):
     try:
         data, addr = client_socket.recvfrom(buf_size)
         # print("data", data)
-        data = data.decode()
         if addr not in recv_bytes:
             recv_bytes[addr] = 0
         recv_bytes[addr] += len(data)
@@ -102,6 +151,28 @@ def send_to(data, addr):
             print(template_log.format(alias_name, time.time(), err_message))
         return 1
 
+def send_without_select(data, addr, batch_socket):
+    # same return code as send_to, a full buffer is only known after trying
+    try:
+        if batch_socket.send_batch([(data, addr)]) == 0:
+            err_message = f"write buffer is full, can't writer data to socket"
+            if err_message in error_log:
+                error_log[err_message].append(time.time())
+            else:
+                error_log[err_message] = [time.time()]
+                print(template_log.format(alias_name, time.time(), err_message))
+            return -1
+        send_bytes[addr] = send_bytes.get(addr, 0) + len(data)
+        return 0
+    except socket.error as e:
+        err_message = f"from {addr} when trying to write socket \"{str(e)}\" has occured"
+        if err_message in error_log:
+            error_log[err_message].append(time.time())
+        else:
+            error_log[err_message] = [time.time()]
+            print(template_log.format(alias_name, time.time(), err_message))
+        return 1
+
 def main():
     global parameters; global timeout; global alias_name; global template_log; global states; server_addr; control_ip; global absolute_path
     global error_log; global recv_bytes; global send_bytes; global average_interval_time; global average_packet_size
@@ -112,9 +183,11 @@ def main():
         end_time = start_time + timeout
         state = "handshaking"
         seq_number = 0
-        need_to_send_parameter = (f"average_interval_time:{str(average_interval_time).zfill(5)} average_packet_size:{str(average_packet_size).zfill(7)} control_ip:{control_ip}\n").encode()
-        # message => 0000001 1706027203.7130814 dump"a" (7+18=25 dump_a = avergae-25)
-        message = [str(seq_number).zfill(7).encode, f"{time.time():.7f}".encode(), ((average_packet_size-25)*"a").encode()]
+        asked_format = " packet_format:binary" if packet_format == "binary" else ""
+        need_to_send_parameter = (f"average_interval_time:{str(average_interval_time).zfill(5)} average_packet_size:{str(average_packet_size).zfill(7)} control_ip:{control_ip}{asked_format}\n").encode()
+        # ascii packet => 0000001 1706027203.7130814 dump"a" (7+18=25 dump_a = avergae-25), binary => PACKET_HEADER + dump"a"
+        sending_format = "ascii"
+        packet = new_packet(sending_format, average_packet_size)
         interval_time_sec = average_interval_time/1000
         # sending parameters
         send_to(need_to_send_parameter, server_addr)
@@ -123,8 +196,10 @@ def main():
             try:
                 client_socket.connect(server_addr)
                 client_socket.setblocking(0)
+                break
             except:
                 pass
+        batch_socket = BatchSocket(client_socket, IO_BATCH) if io_mode == "batch" and BatchSocket is not None else None
         while time.time() < end_time:
             while state != "handshaked":
                 try:
@@ -139,26 +214,36 @@ def main():
                     readable, _, _ = select.select([client_socket], [], [], 0)
                     if readable:
                         data, _ = recv_from(1024)
-                        if data and data == "parameters recieved":
-                            log_message = f"ack packet recieved, start sending simulate packet"
+                        if data and data.startswith(b"parameters recieved"):
+                            sending_format = "binary" if data == BINARY_ACK else "ascii"
+                            packet = new_packet(sending_format, average_packet_size)
+                            log_message = f"ack packet recieved, start sending simulate packet ({sending_format})"
                             print(template_log.format(alias_name, time.time(), log_message))
                             state = "handshaked"
                             break
                 except socket.error as e:
                     print(template_log.format(alias_name, time.time(), str(e)))
-            # read socket until no data available to read
-            readable, _, _ = select.select([client_socket], [], [], 0)
-            # print(readable)
-            if readable:
+            if batch_socket is not None:
                 read_timestamp = time.time()
-                data, addr = recv_from(1024)
-                parsing_header_information(data, addr, read_timestamp)
+                for data, addr in batch_socket.recv_batch():
+                    recv_bytes[addr] = recv_bytes.get(addr, 0) + len(data)
+                    parsing_header_information(data, addr, read_timestamp)
+            else:
+                # read socket until no data available to read
+                readable, _, _ = select.select([client_socket], [], [], 0)
+                # print(readable)
+                if readable:
+                    read_timestamp = time.time()
+                    data, addr = recv_from(1024)
+                    parsing_header_information(data, addr, read_timestamp)
                 
             now = time.time()
             if now >= next_time:
-                message[0] = str(seq_number).zfill(7).encode()
-                message[1] = f"{time.time():.7f}".encode()
-                return_code = send_to(b"".join(message), server_addr)
+                write_packet_header(packet, sending_format, seq_number, time.time())
+                if batch_socket is not None:
+                    return_code = send_without_select(packet, server_addr, batch_socket)
+                else:
+                    return_code = send_to(packet, server_addr)
                 if return_code != -1:
                     next_time = now + interval_time_sec
                     seq_number += 1
@@ -191,9 +276,13 @@ def main():
 if __name__ == "__main__":
     try:
         alias_name, timeout, average_packet_size, average_interval_time, absolute_path, control_ip = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), sys.argv[5], sys.argv[6]
-        if len(sys.argv) == 8:
+        if len(sys.argv) >= 8:
             server_ip = sys.argv[7]
             server_addr = (server_ip, 8888)
+        if len(sys.argv) >= 9:
+            io_mode = sys.argv[8]
+        if len(sys.argv) >= 10:
+            packet_format = sys.argv[9]
     except:
         pass
     # client_socket.connect(server_addr)
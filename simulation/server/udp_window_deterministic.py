@@ -1,11 +1,24 @@
-import select, sys
-import socket, asyncio, time, json
+import sys, os, heapq, subprocess, select, signal
+import socket, asyncio, time, json, struct, zlib, math
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    from batch_io import BatchSocket
+except ImportError:
+    BatchSocket = None
+from telemetry_format import TELEMETRY_MAGIC, TELEMETRY_HEADER, SECTION_HEADER, CODEC_ZLIB, SECTION_SAMPLES, SECTION_FIELD, UDP_RECORD, UDP_ROLLUP, telemetry_header, section_header
 
 client_sockets = {}
-server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-server_socket.bind(("0.0.0.0", 8888))
-server_socket.setblocking(0)
+# opened in main (worker of sharded mode need SO_REUSEPORT before bind)
+server_socket = None
+
+def open_server_socket(reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(("0.0.0.0", 8888))
+    sock.setblocking(0)
+    return sock
 
 timeout = 60
 alias_name = "testets"
@@ -21,12 +34,195 @@ error_log = {}
 recv_bytes = {}
 send_bytes = {}
 absolute_path = ""
+# capture mode (4th argument)
+#   raw       => keep every received packet in monitor_data (as before) + the aggregation below
+#   aggregate => only the aggregation, memory doesn't grow with rate (for long / high-rate run)
+capture = "raw"
+# what to do with send slots that were missed (loop was late, write buffer was full) (5th argument)
+#   catch-up => send them late back to back, at most MAX_CATCH_UP seconds worth, older slots are skipped
+#   skip     => send one packet now and continue from the next slot
+late_policy = "catch-up"
+MAX_CATCH_UP = 0.1
+# smallest send interval (seconds), a client asking less (0 = as fast as possible) is sent at this interval
+MIN_INTERVAL_TIME = 0.0001
+# packets sent per wake up at most, then received packets are handled before sending the rest
+SEND_BATCH = 1024
+# socket io (6th argument)
+#   asyncio => datagram transport of asyncio, one recvfrom / sendto syscall per packet
+#   batch   => BatchedDatagramTransport, recvmmsg / sendmmsg of a whole batch per wake up (simulation/batch_io.py)
+#              linux => recvmmsg / sendmmsg, macos / bsd => recvfrom / sendto loop per wake up,
+#              windows (proactor loop, no add_reader) => fall back to asyncio io
+io_mode = "asyncio"
+IO_BATCH = 64
+# sharded mode (7th argument, number of worker processes, linux only)
+#   every worker bind port 8888 with SO_REUSEPORT, the kernel spread clients over them by address hash (a client always
+#   go to the same worker, handshake included), each worker write its own result file, this process only start them
+#   and merge their files into absolute_path (merge_result_files)
+#   workers are in their own process group, SIGTERM / SIGINT of this process is forwarded to it
+workers = 1
+# 8th argument, given to the workers
+reuse_port = False
+# 9th argument, given to the workers: write end of the pipe each worker write one byte to once its socket is bound,
+# "ready" is printed only after every worker did (a client handshaking before that could be re-hashed to a new worker)
+ready_fd = None
+WORKER_READY_TIMEOUT = 10
 # data map from ip_addr 
 monitor_data = {}
+# fixed-size running state map from control_ip to ClientAggregate
+aggregates = {}
+# closed per-second record map from control_ip to packed UDP_ROLLUP records (88 bytes per second per client)
+rollup_data = {}
+# closed records not printed as metrics line yet, map from control_ip to list of record
+live_records = {}
+
+# latency histogram (HDR style), value in HISTOGRAM_UNIT
+#   below 2**HISTOGRAM_SUB_BITS => one bucket per unit, then 2**(HISTOGRAM_SUB_BITS-1) buckets per power of two (error < 1/16)
+#   negative latency (clock of client and server are not in sync) go to the first bucket, too big one to the last bucket
+HISTOGRAM_UNIT = 1e-6
+HISTOGRAM_SUB_BITS = 5
+HISTOGRAM_MAX_EXPONENT = 23
+HISTOGRAM_SIZE = 2**HISTOGRAM_SUB_BITS + HISTOGRAM_MAX_EXPONENT * 2**(HISTOGRAM_SUB_BITS-1)
+
+def histogram_index(latency):
+    value = int(latency / HISTOGRAM_UNIT)
+    if value < 2**HISTOGRAM_SUB_BITS:
+        return max(value, 0)
+    half = 2**(HISTOGRAM_SUB_BITS-1)
+    exponent = value.bit_length() - HISTOGRAM_SUB_BITS
+    return min(2**HISTOGRAM_SUB_BITS + (exponent-1)*half + (value >> exponent) - half, HISTOGRAM_SIZE - 1)
+
+def histogram_value(index):
+    # middle of the bucket
+    if index < 2**HISTOGRAM_SUB_BITS:
+        return (index + 0.5) * HISTOGRAM_UNIT
+    half = 2**(HISTOGRAM_SUB_BITS-1)
+    exponent = (index - 2**HISTOGRAM_SUB_BITS) // half + 1
+    lower = ((index - 2**HISTOGRAM_SUB_BITS) % half + half) << exponent
+    return (lower + 2**(exponent-1)) * HISTOGRAM_UNIT
+
+def histogram_percentile(histogram, total, q, lowest, highest):
+    rank = max(math.ceil(q * total), 1)
+    count = 0
+    for index, bucket_count in enumerate(histogram):
+        count += bucket_count
+        if count >= rank:
+            return min(max(histogram_value(index), lowest), highest)
+    return highest
+
+class ClientAggregate:
+    # running state of one client, same size whatever the rate and duration
+    # second i is [start + i, start + i + 1) from the first packet, same as utils/analysis.py per_second_udp_metrics
+    __slots__ = ("start", "second", "expected_seq", "previous_latency", "received", "lost", "size", "latency_sum",
+                 "latency_min", "latency_max", "jitter_sum", "jitter_count", "histogram", "run_histogram")
+
+    def __init__(self, read_timestamp):
+        self.start = read_timestamp
+        self.second = 0
+        self.expected_seq = 0
+        self.previous_latency = None
+        self.histogram = [0] * HISTOGRAM_SIZE
+        # whole run, written out at exit
+        self.run_histogram = [0] * HISTOGRAM_SIZE
+        self.reset()
+
+    def reset(self):
+        self.received = 0; self.lost = 0; self.size = 0
+        self.latency_sum = 0.0; self.latency_min = math.inf; self.latency_max = -math.inf
+        self.jitter_sum = 0.0; self.jitter_count = 0
+        for index in range(HISTOGRAM_SIZE):
+            self.histogram[index] = 0
+
+    def add(self, read_timestamp, seq_number, latency, size):
+        # => record of the second that was closed by this packet or None
+        record = None
+        second = max(math.floor(read_timestamp - self.start), self.second)
+        if second > self.second:
+            record = self.close()
+            self.second = second
+        self.received += 1
+        # ไม่รองรับ out-of-order: lost = gap between seq_number and the expected one
+        self.lost += seq_number - self.expected_seq
+        self.expected_seq = seq_number + 1
+        self.size += size
+        self.latency_sum += latency
+        self.latency_min = min(self.latency_min, latency)
+        self.latency_max = max(self.latency_max, latency)
+        if self.previous_latency is not None:
+            self.jitter_sum += abs(latency - self.previous_latency)
+            self.jitter_count += 1
+        self.previous_latency = latency
+        index = histogram_index(latency)
+        self.histogram[index] += 1
+        self.run_histogram[index] += 1
+        return record
+
+    def close(self):
+        if self.received == 0:
+            return None
+        record = (
+            self.start + self.second + 1, self.received, self.lost, self.size, self.latency_sum, self.latency_min, self.latency_max,
+            self.jitter_sum, self.jitter_count,
+            histogram_percentile(self.histogram, self.received, 0.5, self.latency_min, self.latency_max),
+            histogram_percentile(self.histogram, self.received, 0.99, self.latency_min, self.latency_max),
+        )
+        self.reset()
+        return record
+
+    def close_if_over(self, now):
+        # second is over even without packet after it
+        if now >= self.start + self.second + 1:
+            return self.close()
+        return None
+
+def emit_record(control_ip, record):
+    if record is None:
+        return
+    rollup_data.setdefault(control_ip, bytearray()).extend(UDP_ROLLUP.pack(*record))
+    live_records.setdefault(control_ip, []).append(record)
+
+# simulate packet, the format is chosen per client at handshake
+#   ascii  => "{seq:07d}{send_timestamp:.7f}" + padding (older agents), seq wrap at ASCII_SEQ_WRAP and is unwrapped on receive
+#   binary => PACKET_HEADER (version byte, seq u64, send timestamp f64) + padding, asked by the client with
+#             " packet_format:binary" in its initial message and confirmed in the ack
+# first byte tell them apart on receive, an ascii packet always start with a digit
+PACKET_HEADER = struct.Struct("<BQd")
+BINARY_PACKET_VERSION = 0x81
+ASCII_SEQ_WRAP = 10**7
+ACK = b"parameters recieved"
+BINARY_ACK = b"parameters recieved packet_format:binary"
+
+def parse_packet_header(data):
+    # => seq_number, send_timestamp, padding is never touched (int / float parse ascii bytes as they are)
+    if data[0] == BINARY_PACKET_VERSION:
+        _, seq_number, send_timestamp = PACKET_HEADER.unpack_from(data)
+        return seq_number, send_timestamp
+    return int(data[:7]), float(data[7:25])
+
+def new_packet(packet_format, size):
+    # reused for every packet of the client, only the header is written again
+    if packet_format == "binary":
+        return bytearray(PACKET_HEADER.size) + bytearray(b"a" * max(size - PACKET_HEADER.size, 0))
+    return bytearray(b"0" * 25) + bytearray(b"a" * max(size - 25, 0))
+
+def write_packet_header(packet, packet_format, seq_number, send_timestamp):
+    if packet_format == "binary":
+        PACKET_HEADER.pack_into(packet, 0, BINARY_PACKET_VERSION, seq_number, send_timestamp)
+    else:
+        # always 25 bytes, the packet is reused (8 digits seq would make it grow by one byte every send)
+        packet[0:25] = (b"%07d%18.7f" % (seq_number % ASCII_SEQ_WRAP, send_timestamp))[:25]
+
+def unwrap_seq_number(seq_number, last_seq_number):
+    # ascii seq (mod ASCII_SEQ_WRAP) => full seq, the one nearest to the last seq of the same sender
+    seq_number += last_seq_number - last_seq_number % ASCII_SEQ_WRAP
+    if seq_number < last_seq_number - ASCII_SEQ_WRAP // 2:
+        seq_number += ASCII_SEQ_WRAP
+    elif seq_number > last_seq_number + ASCII_SEQ_WRAP // 2 and seq_number >= ASCII_SEQ_WRAP:
+        seq_number -= ASCII_SEQ_WRAP
+    return seq_number
 
 def _is_initial_message(data):
     # print(len(data))
-    if data and data.find("average_interval_time:")!=-1 and data.find("average_packet_size:")!=-1 and data.find("control_ip:")!=-1:
+    if data and data.find(b"average_interval_time:")!=-1 and data.find(b"average_packet_size:")!=-1 and data.find(b"control_ip:")!=-1:
         # print("True")
         return True
     else:
@@ -37,176 +233,529 @@ def parsing_header_information(data, addr, read_timestamp):
     global monitor_data; global parameters
     try:
         # print(data, addr)
-        seq_number = int(data[:7])
-        send_timestamp = float(data[7:25])
+        seq_number, send_timestamp = parse_packet_header(data)
+        if data[0] != BINARY_PACKET_VERSION:
+            seq_number = parameters[addr]["last_seq_number"] = unwrap_seq_number(seq_number, parameters[addr]["last_seq_number"])
         diff = read_timestamp - send_timestamp
         # print(diff, send_timestamp, read_timestamp, data[:30])
         control_ip = parameters[addr]["control_ip"]
-        if control_ip not in monitor_data:
+        if capture == "raw" and control_ip not in monitor_data:
             monitor_data[control_ip] = []
             # print(control_ip)
-        monitor_data[control_ip].append([read_timestamp, seq_number, (send_timestamp, diff, len(data))])
+        if capture == "raw":
+            monitor_data[control_ip].append([read_timestamp, seq_number, (send_timestamp, diff, len(data))])
+        if control_ip not in aggregates:
+            aggregates[control_ip] = ClientAggregate(read_timestamp)
+        emit_record(control_ip, aggregates[control_ip].add(read_timestamp, seq_number, diff, len(data)))
         # print(monitor_data)
-    except ValueError as e:
+    except (ValueError, IndexError, struct.error) as e:
         print(e.args)
         pass
 
-def recv_from(buf_size):
-    global parameters; global timeout; global alias_name; global template_log; global states
-    global error_log; global recv_bytes; global send_bytes
-    # print("try to recv")
-    try:
-        data, addr = server_socket.recvfrom(buf_size)
-        # print("data", data)
-        data = data.decode()
-        if addr not in recv_bytes:
-            recv_bytes[addr] = 0
-        recv_bytes[addr] += len(data)
-        return data, addr
-    except socket.error as e:
-        # print("exc")
-        # err_message = f"from {addr} when trying to read socket \"{str(e)}\" has occured"
-        err_message = f"when trying to read socket \"{str(e)}\" has occured"
-        # print(e.errno, e.args)
-        if err_message in error_log:
-            error_log[err_message].append(time.time())
-        else:
-            error_log[err_message] = [time.time()]
-            print(template_log.format(alias_name, time.time(), err_message))
-        return None, None
-        # if e.errno == 10054:
-        #     states[addr] = "stop writing"
-        
-def send_to(data, addr):
-    global parameters; global timeout; global alias_name; global template_log; global states; global absolute_path
-    global error_log; global recv_bytes; global send_bytes
-    _, writable, _ = select.select([], [server_socket], [], 0)
-    if not writable:
-        err_message = f"write buffer is full, can't writer data to socket"
-        if err_message in error_log:
-            error_log[err_message].append(time.time())
+def log_error(err_message):
+    # same error is printed once, then counted and printed every 30 seconds
+    if err_message in error_log:
+        error_log[err_message].append(time.time())
+    else:
+        error_log[err_message] = [time.time()]
+        print(template_log.format(alias_name, time.time(), err_message))
+
+def handle_datagram(data, addr, read_timestamp, scheduler):
+    global parameters; global states
+    if addr not in states:
+        if _is_initial_message(data):
+            # parse the params
+            local_parameters = data.decode(errors="replace").strip().split()
+            average_interval_time = float(local_parameters[0][22:])/1000
+            average_packet_size = int(local_parameters[1][20:])
+            control_ip = local_parameters[2][11:]
+            if not math.isfinite(average_interval_time):
+                log_error(f"from {addr} invalid average_interval_time {local_parameters[0][22:]}, client is ignored")
+                return
+            if average_interval_time < MIN_INTERVAL_TIME:
+                log_error(f"from {addr} average_interval_time {local_parameters[0][22:]} ms is too small, sending every {MIN_INTERVAL_TIME*1000} ms")
+                average_interval_time = MIN_INTERVAL_TIME
+            # modify global state
+            parameters[addr] = {}
+            parameters[addr]["interval_time"] = average_interval_time
+            parameters[addr]["control_ip"] = control_ip
+            parameters[addr]["seq_number"] = 0
+            parameters[addr]["last_seq_number"] = 0
+            parameters[addr]["packet_format"] = "binary" if "packet_format:binary" in local_parameters[3:] else "ascii"
+            parameters[addr]["ack"] = BINARY_ACK if parameters[addr]["packet_format"] == "binary" else ACK
+            parameters[addr]["packet"] = new_packet(parameters[addr]["packet_format"], average_packet_size)
+            states[addr] = "handshaking"
+            # send ack packet out
+            log_message = f"from {addr} parameters recieved (control_ip {control_ip}, interval {average_interval_time} s, packet {average_packet_size} bytes, {parameters[addr]['packet_format']}), sending ack packet"
+            print(template_log.format(alias_name, time.time(), log_message))
+            scheduler.send(parameters[addr]["ack"], addr)
+            scheduler.add_client(addr, average_interval_time)
+    elif states[addr] == "handshaking":
+        # if client keep sending initial message => it mean it doesn't recieve ack packet
+        if _is_initial_message(data):
+            # send it again
+            scheduler.send(parameters[addr]["ack"], addr)
         else:
-            error_log[err_message] = [time.time()]
-            print(template_log.format(alias_name, time.time(), err_message))
-        return -1
-    try:
-        server_socket.sendto(data, addr)
-        if addr not in send_bytes:
-            send_bytes[addr] = 0
-        send_bytes[addr] += len(data)
-        return 0
-    except socket.error as e:
-        err_message = f"from {addr} when trying to write socket \"{str(e)}\" has occured"
-        if err_message in error_log:
-            error_log[err_message].append(time.time())
+            # แปลว่าอีกฝั่งหนึ่งเริ่มส่ง simulate data แล้ว => แปลว่าได้รับ ack แล้ว
+            states[addr] = "handshaked"
+            log_message = f"from {addr} simulate packet recieved, start sending simulate packet"
+            print(template_log.format(alias_name, time.time(), log_message))
+            parsing_header_information(data, addr, read_timestamp)
+    else:
+        # states[addr] == "handshaked"
+        parsing_header_information(data, addr, read_timestamp)
+
+class DeterministicServerProtocol(asyncio.DatagramProtocol):
+    # event driven, nothing run between packets and send deadlines (no busy loop)
+    #   receive => datagram_received is called by the event loop with the packet
+    #   send    => min-heap of (next send time, addr), one timer armed at the earliest deadline
+    # send time of a client is start + slot * interval (no drift), late client doesn't delay the others since the
+    # heap always give the earliest deadline, each packet sent move its client behind the others that are due
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.transport = None
+        self.deadlines = []
+        self.timer = None
+        self.timer_deadline = None
+        # kernel buffer is full => transport buffer the packet and call pause_writing, periodic send stop until resume_writing
+        self.paused = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        # time stamp as soon as the event loop give the packet
+        read_timestamp = time.time()
+        recv_bytes[addr] = recv_bytes.get(addr, 0) + len(data)
+        handle_datagram(data, addr, read_timestamp, self)
+
+    def error_received(self, exc):
+        log_error(f"when trying to read socket \"{str(exc)}\" has occured")
+
+    def pause_writing(self):
+        self.paused = True
+        log_error("write buffer is full, can't writer data to socket")
+
+    def resume_writing(self):
+        self.paused = False
+        self.arm_timer()
+
+    def send(self, data, addr):
+        try:
+            self.transport.sendto(data, addr)
+            send_bytes[addr] = send_bytes.get(addr, 0) + len(data)
+        except OSError as e:
+            log_error(f"from {addr} when trying to write socket \"{str(e)}\" has occured")
+
+    def add_client(self, addr, interval_time):
+        parameters[addr]["start"] = self.loop.time()
+        parameters[addr]["slot"] = 1
+        parameters[addr]["skipped"] = 0
+        heapq.heappush(self.deadlines, (parameters[addr]["start"] + interval_time, addr))
+        self.arm_timer()
+
+    def next_slot(self, addr, now):
+        client = parameters[addr]
+        client["slot"] += 1
+        # slot that should be sent now
+        current_slot = int((now - client["start"]) / client["interval_time"])
+        if late_policy == "skip":
+            oldest_slot = current_slot + 1
         else:
-            error_log[err_message] = [time.time()]
-            print(template_log.format(alias_name, time.time(), err_message))
-        return 1
+            oldest_slot = current_slot - int(MAX_CATCH_UP / client["interval_time"])
+        if client["slot"] < oldest_slot:
+            client["skipped"] += oldest_slot - client["slot"]
+            client["slot"] = oldest_slot
+        return client["start"] + client["slot"] * client["interval_time"]
 
-def main():
-    global parameters; global timeout; global alias_name; global template_log; global states; global absolute_path
-    global error_log; global recv_bytes; global send_bytes
+    def arm_timer(self):
+        if self.paused or not self.deadlines:
+            return
+        deadline = self.deadlines[0][0]
+        if self.timer is not None:
+            if self.timer_deadline <= deadline:
+                return
+            self.timer.cancel()
+        self.timer_deadline = deadline
+        self.timer = self.loop.call_at(deadline, self.send_due)
+
+    def send_due(self):
+        self.timer = None
+        now = self.loop.time()
+        sent = 0
+        try:
+            while self.deadlines and self.deadlines[0][0] <= now and not self.paused and sent < SEND_BATCH:
+                _, addr = heapq.heappop(self.deadlines)
+                try:
+                    client = parameters[addr]
+                    write_packet_header(client["packet"], client["packet_format"], client["seq_number"], time.time())
+                    self.send(client["packet"], addr)
+                    parameters[addr]["seq_number"] += 1
+                    sent += 1
+                    heapq.heappush(self.deadlines, (self.next_slot(addr, now), addr))
+                except Exception as e:
+                    # one broken client stop being sent to, the others keep their slots
+                    log_error(f"from {addr} when trying to schedule packet \"{str(e)}\" has occured, stop sending to it")
+        finally:
+            # still due (batch is full) => timer fire on the next loop iteration, after pending receive
+            self.arm_timer()
+
+    def close(self):
+        if self.timer is not None:
+            self.timer.cancel()
+        self.transport.close()
+
+def print_live_metrics():
+    # one line per second for the controller to stream, "{alias_name} {time} deterministic: metrics {json}"
+    now = time.time()
+    for control_ip, aggregate in aggregates.items():
+        emit_record(control_ip, aggregate.close_if_over(now))
+    metrics = {}
+    for control_ip, records in live_records.items():
+        received = sum(record[1] for record in records)
+        metrics[control_ip] = {
+            "received": received,
+            "lost_count": sum(record[2] for record in records),
+            "average_latency": sum(record[4] for record in records) / received,
+        }
+    live_records.clear()
+    if metrics:
+        print(template_log.format(alias_name, time.time(), f"metrics {json.dumps(metrics)}"))
+
+# binary telemetry dump (simulation/telemetry_format.py, zlib), read by utils/telemetry.py
+DUMP_CHUNK_RECORDS = 65536
+
+def latency_histograms():
+    # sparse whole-run histogram of every client, {control_ip: {"unit", "sub_bucket_bits", "counts": {index: count}}}
+    return {
+        control_ip: {
+            "unit": HISTOGRAM_UNIT,
+            "sub_bucket_bits": HISTOGRAM_SUB_BITS,
+            "counts": {str(index): count for index, count in enumerate(aggregate.run_histogram) if count},
+        }
+        for control_ip, aggregate in aggregates.items()
+    }
+
+def dump_json(file):
+    data = {
+        "udp_deterministic_client_rollup_monitored_from_server": {
+            control_ip: [list(record) for record in UDP_ROLLUP.iter_unpack(records)] for control_ip, records in rollup_data.items()
+        },
+        "udp_deterministic_latency_histogram": latency_histograms(),
+    }
+    if capture == "raw":
+        data["udp_deterministic_client_data_monitored_from_server"] = monitor_data
+    json.dump(data, file)
+
+def dump_telemetry(file, monitor_data):
+    compressor = zlib.compressobj(1)
+    file.write(telemetry_header(CODEC_ZLIB))
+    payload = json.dumps(latency_histograms()).encode()
+    file.write(compressor.compress(section_header(SECTION_FIELD, b"udp_deterministic_latency_histogram", b"", 0, len(payload)) + payload))
+    series = b"udp_deterministic_client_rollup_monitored_from_server"
+    for control_ip, records in rollup_data.items():
+        header = section_header(SECTION_SAMPLES, series, control_ip.encode(), UDP_ROLLUP.size, len(records) // UDP_ROLLUP.size)
+        file.write(compressor.compress(header + bytes(records)))
+    series = b"udp_deterministic_client_data_monitored_from_server"
+    for control_ip, samples in monitor_data.items():
+        peer = control_ip.encode()
+        for i in range(0, max(len(samples), 1), DUMP_CHUNK_RECORDS):
+            chunk = samples[i:i+DUMP_CHUNK_RECORDS]
+            header = section_header(SECTION_SAMPLES, series, peer, UDP_RECORD.size, len(chunk))
+            records = bytearray(len(header) + UDP_RECORD.size * len(chunk))
+            records[:len(header)] = header
+            offset = len(header)
+            for data in chunk:
+                UDP_RECORD.pack_into(records, offset, data[0], data[1], data[2][0], data[2][1], data[2][2])
+                offset += UDP_RECORD.size
+            file.write(compressor.compress(records))
+    file.write(compressor.flush())
+
+class BatchedDatagramTransport:
+    # the part of asyncio datagram transport that DeterministicServerProtocol use, for high packet rate
+    #   read  => every wake up drain up to IO_BATCH packets with one syscall (level triggered, wake again if more)
+    #   write => packets of the same loop iteration (send_due, ack) go out together at the end of it
+    def __init__(self, loop, sock, protocol):
+        self._loop = loop
+        self._sock = sock
+        self._protocol = protocol
+        self._batch_socket = BatchSocket(sock, IO_BATCH)
+        self._pending = []
+        self._flush_scheduled = False
+        self._writing_paused = False
+        loop.add_reader(sock, self._read_ready)
+        protocol.connection_made(self)
+
+    def _read_ready(self):
+        try:
+            packets = self._batch_socket.recv_batch()
+        except OSError as e:
+            self._protocol.error_received(e)
+            return
+        for data, addr in packets:
+            self._protocol.datagram_received(data, addr)
+
+    def sendto(self, data, addr):
+        # packet buffer of the client is reused for its next packet, keep a copy until the batch is sent
+        self._pending.append((bytes(data), addr))
+        if not self._flush_scheduled and not self._writing_paused:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+
+    def _flush(self):
+        self._flush_scheduled = False
+        try:
+            sent = self._batch_socket.send_batch(self._pending)
+        except OSError as e:
+            # drop the batch like a failed sendto
+            log_error(f"when trying to write socket \"{str(e)}\" has occured")
+            self._pending = []
+            return
+        del self._pending[:sent]
+        if self._pending and not self._writing_paused:
+            # kernel buffer is full, the rest wait until the socket is writable
+            self._writing_paused = True
+            self._protocol.pause_writing()
+            self._loop.add_writer(self._sock, self._write_ready)
+
+    def _write_ready(self):
+        self._writing_paused = False
+        self._loop.remove_writer(self._sock)
+        self._flush()
+        if not self._writing_paused:
+            self._protocol.resume_writing()
+
+    def close(self):
+        if self._pending and not self._writing_paused:
+            self._flush()
+        self._loop.remove_reader(self._sock)
+        if self._writing_paused:
+            self._loop.remove_writer(self._sock)
+
+def print_byte_counters():
+    for addr in recv_bytes:
+        print(template_log.format(alias_name, time.time(), f"{recv_bytes[addr]} bytes recv from {addr}"))
+    for addr in send_bytes:
+        print(template_log.format(alias_name, time.time(), f"{send_bytes[addr]} bytes send to {addr}"))
+
+async def serve():
+    loop = asyncio.get_running_loop()
+    protocol = None
+    if io_mode == "batch" and BatchSocket is not None:
+        protocol = DeterministicServerProtocol()
+        try:
+            BatchedDatagramTransport(loop, server_socket, protocol)
+        except NotImplementedError:
+            # proactor loop (windows default) has no add_reader
+            print(template_log.format(alias_name, time.time(), "event loop doesn't support batch io, using asyncio io"))
+            protocol = None
+    elif io_mode == "batch":
+        print(template_log.format(alias_name, time.time(), "simulation/batch_io.py is not found, using asyncio io"))
+    if protocol is None:
+        _, protocol = await loop.create_datagram_endpoint(DeterministicServerProtocol, sock=server_socket)
+    # SIGTERM (cancelled simulation, forwarded by run_workers) => stop early, results are still written
+    stopping = asyncio.Event()
     try:
-        start_time = time.time()
-        check_point = start_time + 30
+        loop.add_signal_handler(signal.SIGTERM, stopping.set)
+    except NotImplementedError:
+        pass
+    try:
+        start_time = loop.time()
         end_time = start_time + timeout
-        while time.time() < end_time:
-            # read socket until no data available to read
-            readable, _, _ = select.select([server_socket], [], [], 0)
-            # print(readable)
-            while readable:
-                # NOTE QUESTION: ใช้ขนาด buffer เท่าไหร่ดี แต่ play save ก็ 65535 ไม่เกินแต่มันจะพังมั้ยไม่มั่นใจ
-                #               (ไม่มั่นใจว่าถ้า buffer ที่ใส่ให้เล็กกว่า message จริงอ่านรอบหน้าจะเป็นยังไง คิดว่าน่าจะยังจะอ่าน message เดิม)
-                # time stamp after select return that there are packet in buffer
-                read_timestamp = time.time()
-                data, addr = recv_from(1024)
-                if addr not in states:
-                    if _is_initial_message(data):
-                        # parse the params
-                        local_parameters = data.strip().split()
-                        average_interval_time = float(local_parameters[0][22:])/1000
-                        average_packet_size = int(local_parameters[1][20:])
-                        control_ip = local_parameters[2][11:]
-                        print(average_interval_time, " ", average_packet_size, " ", control_ip)
-                        # modify global state
-                        parameters[addr] = {}
-                        parameters[addr]["interval_time"] = average_interval_time
-                        parameters[addr]["next_time"] = time.time() + average_interval_time
-                        parameters[addr]["control_ip"] = control_ip
-                        parameters[addr]["seq_number"] = 0
-                        parameters[addr]["message"] = [str(0).zfill(7).encode(), f"{time.time():.7f}".encode(), ((average_packet_size-25)*"a").encode()]
-                        print(len(b"".join(parameters[addr]["message"])))
-                        states[addr] = "handshaking"
-                        # send ack packet out
-                        log_message = f"from {addr} parameters recieved, sending ack packet"
-                        print(template_log.format(alias_name, time.time(), log_message))
-                        send_to(b"parameters recieved", addr)
-                elif states[addr] == "handshaking":
-                    # if client keep sending initial message => it mean it doesn't recieve ack packet
-                    if _is_initial_message(data):
-                        # send it again
-                        send_to(b"parameters recieved", addr)
-                    else:
-                        # แปลว่าอีกฝั่งหนึ่งเริ่มส่ง simulate data แล้ว => แปลว่าได้รับ ack แล้ว
-                        states[addr] = "handshaked"
-                        log_message = f"from {addr} simulate packet recieved, start sending simulate packet"
-                        print(template_log.format(alias_name, time.time(), log_message))
-                        # recieve packet ที่เหลือ [ในกรณีที่ params มีขนาดแพ็คเก็ตที่ใหญ่กว่า 1024]
-                        parsing_header_information(data, addr, read_timestamp)
-                else:
-                    # print(states[addr] == "handshaked")
-                    # states[addr] == "handshaked" /////or states[addr] == "stop sending"
-                    # ถ้า handshaked แล้ว recieve packet ที่เหลือ [ในกรณีที่ params มีขนาดแพ็คเก็ตที่ใหญ่กว่า 1024]
-                    parsing_header_information(data, addr, read_timestamp)
-                # update readable
-                readable, _, _ = select.select([server_socket], [], [], 0)
-                
-            for addr in parameters:
-                now = time.time()
-                if now >= parameters[addr]["next_time"]:
-                    parameters[addr]["message"][0] = str(parameters[addr]["seq_number"]).zfill(7).encode()
-                    parameters[addr]["message"][1] = f"{time.time():.7f}".encode()
-                    # print(parameters[addr]["message"][1])
-                    return_code = send_to(b"".join(parameters[addr]["message"]), addr)
-                    if return_code == -1:
-                    #     # -1 mean buffer is full, so no need to keep sending other out since it shared buffer
-                        break
-                    #     # break before update seq_number because they not sending out from beginning, this can cause by latency/datarate
-                    #     # not counting as packet lost
-                    # print(time.time())
-                    parameters[addr]["next_time"] = now + parameters[addr]["interval_time"]
-                    parameters[addr]["seq_number"] += 1
-            
+        check_point = start_time + 30
+        metrics_check_point = start_time + 1
+        while True:
+            # sleep until the next periodic job (metrics every second, log every 30 seconds) or the end
+            try:
+                await asyncio.wait_for(stopping.wait(), max(min(metrics_check_point, end_time) - loop.time(), 0))
+            except asyncio.TimeoutError:
+                pass
+            if stopping.is_set():
+                print(template_log.format(alias_name, time.time(), "terminated, writing results"))
+                break
+            now = loop.time()
+            if now >= end_time:
+                break
+            if now >= metrics_check_point:
+                print_live_metrics()
+                metrics_check_point += 1
             # แสดง log ที่เก็บไว้ทุกๆ 30 วินาที
-            now = time.time()
             if now >= check_point:
-                for addr in recv_bytes:
-                    print(template_log.format(alias_name, time.time(), f"{recv_bytes[addr]} bytes recv from {addr}"))
-                for addr in send_bytes:
-                    print(template_log.format(alias_name, time.time(), f"{send_bytes[addr]} bytes send to {addr}"))
+                print_byte_counters()
+                for addr in parameters:
+                    if parameters[addr]["skipped"]:
+                        print(template_log.format(alias_name, time.time(), f"{parameters[addr]['skipped']} send slots skipped for {addr} ({late_policy})"))
                 for error in error_log:
-                    # print(template_log.format(alias_name, time.time(), f"\"{error}\" occured more {len(error_log[error])} times at {error_log[error]}"))
                     print(template_log.format(alias_name, time.time(), f"\"{error}\" occured more {len(error_log[error])} times"))
                     error_log[error] = []
                 check_point += 30
+    finally:
+        protocol.close()
+
+def sharding_supported():
+    # other platform either don't have SO_REUSEPORT or don't spread udp packets over the sockets
+    return sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+
+def read_sections(path):
+    # binary result file => iterator of (kind, name, section bytes as written), see dump_telemetry
+    with open(path, "rb") as f:
+        magic, version, codec, _ = TELEMETRY_HEADER.unpack(f.read(TELEMETRY_HEADER.size))
+        if magic != TELEMETRY_MAGIC or codec != CODEC_ZLIB:
+            raise ValueError(f"{path} is not a telemetry file written by this server")
+        decompressor = zlib.decompressobj()
+        buffer = bytearray()
+        while True:
+            chunk = f.read(1 << 20)
+            buffer += decompressor.decompress(chunk) if chunk else decompressor.flush()
+            offset = 0
+            while len(buffer) - offset >= SECTION_HEADER.size:
+                kind, name_length, peer_length, record_size, count = SECTION_HEADER.unpack_from(buffer, offset)
+                size = SECTION_HEADER.size + name_length + peer_length + (count if kind == SECTION_FIELD else record_size * count)
+                if len(buffer) - offset < size:
+                    break
+                name_start = offset + SECTION_HEADER.size
+                yield kind, bytes(buffer[name_start:name_start+name_length]), bytes(buffer[offset:offset+size])
+                offset += size
+            del buffer[:offset]
+            if not chunk:
+                break
+
+def merge_result_files(worker_paths, path):
+    # clients of the workers don't overlap => samples sections are copied as they are, per-client dict are joined
+    worker_paths = [worker_path for worker_path in worker_paths if os.path.exists(worker_path)]
+    if path.endswith(".json"):
+        merged = {}
+        for worker_path in worker_paths:
+            with open(worker_path) as f:
+                for field, value in json.load(f).items():
+                    merged.setdefault(field, {}).update(value)
+        with open(path, "w") as f:
+            json.dump(merged, f)
+    else:
+        fields = {}
+        compressor = zlib.compressobj(1)
+        with open(path, "wb") as f:
+            f.write(telemetry_header(CODEC_ZLIB))
+            for worker_path in worker_paths:
+                for kind, name, section in read_sections(worker_path):
+                    if kind == SECTION_FIELD:
+                        payload = json.loads(section[SECTION_HEADER.size+len(name):])
+                        fields.setdefault(name, {}).update(payload)
+                    else:
+                        f.write(compressor.compress(section))
+            for name, value in fields.items():
+                payload = json.dumps(value).encode()
+                f.write(compressor.compress(section_header(SECTION_FIELD, name, b"", 0, len(payload)) + payload))
+            f.write(compressor.flush())
+    for worker_path in worker_paths:
+        os.remove(worker_path)
+
+def wait_workers_ready(ready_read):
+    # => number of workers that bound the port, stop early when every worker exited (eof)
+    bound = 0
+    deadline = time.time() + WORKER_READY_TIMEOUT
+    while bound < workers:
+        remaining = deadline - time.time()
+        if remaining <= 0 or not select.select([ready_read], [], [], remaining)[0]:
+            break
+        data = os.read(ready_read, workers)
+        if not data:
+            break
+        bound += len(data)
+    os.close(ready_read)
+    return bound
+
+def run_workers():
+    root, extension = os.path.splitext(absolute_path)
+    worker_paths = [f"{root}.worker{k}{extension}" for k in range(workers)]
+    print(template_log.format(alias_name, time.time(), f"starting {workers} workers on port 8888 (SO_REUSEPORT)"))
+    processes = []
+    def forward_signal(signum, frame):
+        if processes:
+            try:
+                os.killpg(processes[0].pid, signum)
+            except ProcessLookupError:
+                pass
+    signal.signal(signal.SIGTERM, forward_signal)
+    signal.signal(signal.SIGINT, forward_signal)
+    ready_read, ready_write = os.pipe()
+    # workers write to the same stdout, their log / metrics lines go to the controller as usual
+    # process group of the first worker hold all of them
+    for worker_path in worker_paths:
+        processes.append(subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__), alias_name, str(timeout), worker_path, capture, late_policy, io_mode, "1", "reuse_port", str(ready_write)],
+            pass_fds=(ready_write,), process_group=processes[0].pid if processes else 0,
+        ))
+    os.close(ready_write)
+    bound = wait_workers_ready(ready_read)
+    if bound == workers:
+        print(template_log.format(alias_name, time.time(), f"ready on port 8888 ({workers} workers)"))
+    else:
+        print(template_log.format(alias_name, time.time(), f"only {bound} of {workers} workers bound port 8888 in {WORKER_READY_TIMEOUT} seconds"))
+    for process in processes:
+        process.wait()
+    try:
+        merge_result_files(worker_paths, absolute_path)
+        print(template_log.format(alias_name, time.time(), f"results of {workers} workers merged"))
+    except (OSError, ValueError, zlib.error) as e:
+        print(template_log.format(alias_name, time.time(), f"unexpected exception \"{str(e)}\" has occured while merging worker results"))
+
+def main():
+    global server_socket
+    if workers > 1 and not reuse_port:
+        if sharding_supported():
+            run_workers()
+            return
+        print(template_log.format(alias_name, time.time(), "SO_REUSEPORT is not supported here, running as one process"))
+    server_socket = open_server_socket(reuse_port)
+    if ready_fd is not None:
+        # worker of run_workers, it print ready once every worker is bound
+        os.write(ready_fd, b"1")
+        os.close(ready_fd)
+    else:
+        print(template_log.format(alias_name, time.time(), "ready on port 8888"))
+    try:
+        asyncio.run(serve())
     except Exception as e:
         print(template_log.format(alias_name, time.time(), f"unexpected exception \"{str(e)}\" has occured"))
     finally:
-        for addr in recv_bytes:
-            print(template_log.format(alias_name, time.time(), f"{recv_bytes[addr]} bytes recv from {addr}"))
-        for addr in send_bytes:
-            print(template_log.format(alias_name, time.time(), f"{send_bytes[addr]} bytes send to {addr}"))
+        print_byte_counters()
         print(template_log.format(alias_name, time.time(), f"closing the socket"))
         server_socket.close()
-        with open(absolute_path, "w") as f:
-            json.dump({"udp_deterministic_client_data_monitored_from_server": monitor_data}, f)
+        for control_ip, aggregate in aggregates.items():
+            emit_record(control_ip, aggregate.close())
+        # .json => json as before, anything else => binary telemetry
+        if absolute_path.endswith(".json"):
+            with open(absolute_path, "w") as f:
+                dump_json(f)
+        else:
+            with open(absolute_path, "wb") as f:
+                dump_telemetry(f, monitor_data)
         print(template_log.format(alias_name, time.time(), f"socket has been closed, program exited"))
         
 if __name__ == "__main__":
-    "python -u ./simulation/server/udp_window_deterministic.py {alias_name} {scenario.timeout}"
+    "python -u ./simulation/server/udp_window_deterministic.py {alias_name} {scenario.timeout} {absolute_path} [raw|aggregate] [catch-up|skip] [asyncio|batch] [workers]"
+    # workers add "reuse_port" and their ready fd (run_workers)
     try:
         alias_name, timeout, absolute_path = sys.argv[1], int(sys.argv[2]), sys.argv[3]
+        if len(sys.argv) > 4:
+            capture = sys.argv[4]
+        if len(sys.argv) > 5:
+            late_policy = sys.argv[5]
+        if len(sys.argv) > 6:
+            io_mode = sys.argv[6]
+        if len(sys.argv) > 7:
+            # parsed on its own, a bad value must not be ignored together with the other arguments
+            try:
+                workers = int(sys.argv[7])
+            except ValueError:
+                workers = 0
+            if workers < 1:
+                print(template_log.format(alias_name, time.time(), f"invalid workers \"{sys.argv[7]}\", running as one process"))
+                workers = 1
+        reuse_port = len(sys.argv) > 8 and sys.argv[8] == "reuse_port"
+        if len(sys.argv) > 9:
+            ready_fd = int(sys.argv[9])
     except:
         pass
     main()
@@ -0,0 +1,32 @@
+import struct
+
+# binary telemetry format, the one definition of it
+#   utils/telemetry.py                        => encoder / decoder (numpy records of utils.sample_store)
+#   simulation/server/udp_window_deterministic.py => writer of its result file (standalone script, no numpy)
+# every integer is little-endian
+#   header  <4sBBH  magic "WMTL", version, codec (CODEC_*), reserved
+#   body (compressed as a whole by codec) is a list of section:
+#   section <BHHHI  kind (SECTION_*), name length, peer length, record size, record count (field: json length)
+#           name (utf-8), peer (utf-8, empty => no peer), payload
+#   samples payload is record count * record size bytes, record is the packed dtype of the series in utils.sample_store
+
+TELEMETRY_MAGIC = b"WMTL"
+TELEMETRY_VERSION = 1
+TELEMETRY_HEADER = struct.Struct("<4sBBH")
+SECTION_HEADER = struct.Struct("<BHHHI")
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+SECTION_SAMPLES = 1
+SECTION_FIELD = 2
+
+# records of the udp series without numpy, same layout as UDP_SAMPLE_DTYPE / UDP_ROLLUP_DTYPE of utils/sample_store.py
+# [read_timestamp, seq_number, send_timestamp, latency, size]
+UDP_RECORD = struct.Struct("<dqddi")
+# [timestamp (end of the second), received, lost, size, latency_sum, latency_min, latency_max, jitter_sum, jitter_count, latency_p50, latency_p99]
+UDP_ROLLUP = struct.Struct("<dqqqddddqdd")
+
+def telemetry_header(codec: int = CODEC_ZLIB) -> bytes:
+    return TELEMETRY_HEADER.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, codec, 0)
+
+def section_header(kind: int, name: bytes, peer: bytes, record_size: int, count: int) -> bytes:
+    return SECTION_HEADER.pack(kind, len(name), len(peer), record_size, count) + name + peer
@@ -0,0 +1,107 @@
+from models.database import Base, sessionmanager
+from sqlalchemy import select, text
+import asyncio
+
+# python upgrade_db.py
+# bring database that created by older version up to date without dropping any data
+#   1. create missing tables, add missing (nullable) columns and indexes, rebuild full text search index
+#      (fts table of an older tokenizer is dropped first and created again as trigram)
+#   2. move raw samples of finished (terminated) simulations out of simulations.simulation_data into utils.sample_store
+#   3. move simulations.state_message into simulation_events (one row per line)
+
+def _add_missing_columns(sync_conn):
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {row[1] for row in sync_conn.execute(text(f"PRAGMA table_info({table.name})"))}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            print(f"{table.name}.{column.name} added")
+
+def _add_missing_indexes(sync_conn):
+    # create_all only create index together with new table
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if sync_conn.execute(text("SELECT 1 FROM sqlite_master WHERE type='index' AND name=:name"), {"name": index.name}).first() is None:
+                index.create(sync_conn)
+                print(f"index {index.name} created")
+
+def _drop_outdated_search_index(sync_conn):
+    # CREATE VIRTUAL TABLE IF NOT EXISTS keep the old tokenizer, create_all create it again after this
+    from models.models import FTS_TABLES
+    for fts_table in FTS_TABLES:
+        sql = sync_conn.execute(text("SELECT sql FROM sqlite_master WHERE type='table' AND name=:name"), {"name": fts_table}).scalar()
+        if sql is not None and "trigram" not in sql:
+            sync_conn.execute(text(f"DROP TABLE {fts_table}"))
+            print(f"{fts_table} dropped (old tokenizer)")
+
+def _rebuild_search_index(sync_conn):
+    from models.models import FTS_TABLES
+    for fts_table in FTS_TABLES:
+        sync_conn.execute(text(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')"))
+
+async def move_samples_to_sample_store():
+    from models.models import Simulation
+    from utils.scheduler import TERMINATED_STATES
+    from utils.rollup import store_samples_and_build_rollup, save_simulation_rollup
+    async with sessionmanager.session() as db_session:
+        simulation_ids = (
+            await db_session.scalars(
+                select(Simulation.id)
+                .where(Simulation.sample_store_path.is_(None), Simulation.state.in_(TERMINATED_STATES))
+                .order_by(Simulation.id)
+            )
+        ).all()
+        for simulation_id in simulation_ids:
+            simulation = await db_session.get(Simulation, simulation_id)
+            metadata, sample_store_path, rollup_data = store_samples_and_build_rollup(simulation.id, simulation.scenario_snapshot, simulation.simulation_data or {})
+            if sample_store_path is None:
+                # failed / cancelled before monitor data, nothing to move
+                db_session.expunge(simulation)
+                continue
+            simulation.simulation_data = metadata
+            simulation.sample_store_path = sample_store_path
+            db_session.add(simulation)
+            await db_session.commit()
+            await save_simulation_rollup(db_session, simulation, rollup_data)
+            db_session.expunge(simulation)
+            print(f"simulation {simulation_id}: samples moved to {sample_store_path}")
+
+async def move_state_message_to_events():
+    from models.models import Simulation, SimulationEvent
+    from sqlalchemy import insert, update
+    async with sessionmanager.session() as db_session:
+        rows = (
+            await db_session.execute(
+                select(Simulation.id, Simulation.state_message, Simulation.created_at)
+                .where(Simulation.state_message != "")
+                .order_by(Simulation.id)
+            )
+        ).all()
+        for simulation_id, state_message, created_at in rows:
+            # old line => "{alias_name} {time}: {message}", keep it as is, time of line is unknown => created_at
+            events = [
+                {"simulation_id": simulation_id, "ts": created_at.timestamp(), "node": None, "level": "info", "message": line}
+                for line in state_message.splitlines() if line.strip()
+            ]
+            if events:
+                await db_session.execute(insert(SimulationEvent), events)
+            await db_session.execute(update(Simulation).where(Simulation.id==simulation_id).values(state_message=""))
+            await db_session.commit()
+            print(f"simulation {simulation_id}: {len(events)} lines moved to simulation_events")
+
+async def upgrade_db():
+    import models.models
+    async with sessionmanager.connect() as conn:
+        await conn.run_sync(_drop_outdated_search_index)
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_add_missing_indexes)
+        await conn.run_sync(_rebuild_search_index)
+    await move_samples_to_sample_store()
+    await move_state_message_to_events()
+    await sessionmanager.close()
+
+if __name__ == "__main__":
+    asyncio.run(upgrade_db())
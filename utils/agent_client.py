@@ -0,0 +1,67 @@
+import aiohttp
+
+# one long-lived aiohttp session for every request to agents (configure, run, state, cancel, monitor)
+# keep-alive connections are reused across polling loop instead of opening new tcp connection every call
+
+class AgentClient:
+    def __init__(self, limit: int = 200, limit_per_host: int = 4, keepalive_timeout: float = 30, request_timeout: float = 10):
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._request_timeout = request_timeout
+        self._session = None
+
+    async def start(self):
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self._limit,
+            limit_per_host=self._limit_per_host,
+            keepalive_timeout=self._keepalive_timeout,
+            ttl_dns_cache=300,
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self._request_timeout),
+        )
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # started in server lifespan, but scripts/benchmark may use it without the app
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+
+    def _timeout_kwargs(self, timeout: float) -> dict:
+        # without timeout => use session default (request_timeout)
+        return {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout is not None else {}
+
+    async def post(self, url: str, data: dict, timeout: float = None):
+        session = await self._get_session()
+        async with session.post(url=url, json=data, headers={"Content-Type": "application/json"}, **self._timeout_kwargs(timeout)) as response:
+            response.raise_for_status()
+            return (await response.json(content_type=None)), str(response.url)
+
+    async def get(self, url: str, params: dict = None, timeout: float = None):
+        session = await self._get_session()
+        async with session.get(url=url, params=params or {}, **self._timeout_kwargs(timeout)) as response:
+            return (await response.json(content_type=None)), str(response.url)
+
+    async def get_stream(self, url: str, params: dict, timeout: float, stream_types: list, on_chunk):
+        # response in one of stream_types (preferred first) => await on_chunk(content_type, chunk) as data arrive, => (None, url)
+        # any other response (agent that doesn't stream) => same as get()
+        session = await self._get_session()
+        headers = {"Accept": ", ".join(stream_types + ["application/json"])}
+        async with session.get(url=url, params=params or {}, headers=headers, **self._timeout_kwargs(timeout)) as response:
+            response.raise_for_status()
+            if response.content_type not in stream_types:
+                return (await response.json(content_type=None)), str(response.url)
+            async for chunk in response.content.iter_any():
+                await on_chunk(response.content_type, chunk)
+            return None, str(response.url)
+
+agent_client = AgentClient()
@@ -0,0 +1,81 @@
+import asyncio
+
+# agents push what they used to be polled for to POST /agent/events (controller/agent_controller.py)
+#   {"control_ip": ..., "event": "ap_state" | "simulation_state" | "log", "data": ...}
+#   - ap_state / simulation_state data is the same body as GET /configure/ap/state, /simulation/state
+#     => fan_out(pushed=listener.pushed(event)) take it like a poll result, polling stay as fallback
+#   - log data is a message (or {"message": ..., "level": "info" | "error"}), logged to the simulation right away
+# a node is used by one simulation at a time (utils.scheduler) => events are routed by control ip
+
+AGENT_EVENTS = ["ap_state", "simulation_state", "log"]
+AGENT_LOG_LEVELS = ["info", "error"]
+# second item of a pushed result, polled one has the request url there (utils.agent_client)
+PUSHED_RESULT_SOURCE = "agent event"
+
+class AgentListener:
+    def __init__(self, hub, control_ips: list, on_log):
+        self._hub = hub
+        self.control_ips = set(control_ips)
+        # on_log(control_ip, message, level)
+        self._on_log = on_log
+        # (control_ip, event) => future of fan_out waiting for it / data pushed while nobody was waiting
+        self._waiters = {}
+        self._latest = {}
+
+    def push(self, control_ip: str, event: str, data):
+        if event == "log":
+            if isinstance(data, dict):
+                level = data.get("level") if data.get("level") in AGENT_LOG_LEVELS else "info"
+                self._on_log(control_ip, data.get("message", ""), level)
+            else:
+                self._on_log(control_ip, data, "info")
+            return
+        waiter = self._waiters.pop((control_ip, event), None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result((data, PUSHED_RESULT_SOURCE))
+        else:
+            # pushed while fan_out is in a request, taken by its next wait
+            self._latest[(control_ip, event)] = data
+
+    def pushed(self, event: str):
+        # => pushed(control_ip) for utils.fanout.fan_out
+        def wait(control_ip):
+            future = asyncio.get_running_loop().create_future()
+            key = (control_ip, event)
+            if key in self._latest:
+                future.set_result((self._latest.pop(key), PUSHED_RESULT_SOURCE))
+            else:
+                self._waiters[key] = future
+            return future
+        return wait
+
+    def close(self):
+        self._hub.remove(self)
+        for waiter in self._waiters.values():
+            waiter.cancel()
+        self._waiters = {}
+
+class AgentEventHub:
+    def __init__(self):
+        self._listeners = {}
+
+    def listen(self, control_ips: list, on_log) -> AgentListener:
+        listener = AgentListener(self, control_ips, on_log)
+        for control_ip in listener.control_ips:
+            self._listeners[control_ip] = listener
+        return listener
+
+    def remove(self, listener: AgentListener):
+        for control_ip in listener.control_ips:
+            if self._listeners.get(control_ip) is listener:
+                del self._listeners[control_ip]
+
+    def publish(self, control_ip: str, event: str, data) -> bool:
+        # => False if no simulation is using this node now
+        listener = self._listeners.get(control_ip)
+        if listener is None:
+            return False
+        listener.push(control_ip, event, data)
+        return True
+
+agent_events = AgentEventHub()
@@ -0,0 +1,126 @@
+import numpy as np
+
+# vectorized aggregation of raw simulation samples
+# every series is return as list of [timestamp, value] (same shape that frontend already plot)
+
+def udp_samples_to_columns(samples: list) -> dict:
+    # [read_timestamp, seq_number, (send_timestamp, diff, len(data))] => one array per field
+    n = len(samples)
+    return {
+        "read_timestamp": np.fromiter((data[0] for data in samples), dtype=np.float64, count=n),
+        "seq_number": np.fromiter((data[1] for data in samples), dtype=np.int64, count=n),
+        "send_timestamp": np.fromiter((data[2][0] for data in samples), dtype=np.float64, count=n),
+        "latency": np.fromiter((data[2][1] for data in samples), dtype=np.float64, count=n),
+        "size": np.fromiter((data[2][2] for data in samples), dtype=np.int64, count=n),
+    }
+
+def rate_samples_to_columns(samples: list) -> dict:
+    # [finish_timestamp, size, start_timestamp]
+    n = len(samples)
+    return {
+        "finish_timestamp": np.fromiter((data[0] for data in samples), dtype=np.float64, count=n),
+        "size": np.fromiter((data[1] for data in samples), dtype=np.float64, count=n),
+        "start_timestamp": np.fromiter((data[2] for data in samples), dtype=np.float64, count=n),
+    }
+
+def _to_series(timestamps: np.ndarray, values: np.ndarray) -> list:
+    return np.column_stack((timestamps, values)).tolist()
+
+def per_second_udp_metrics(columns: dict) -> dict:
+    # columns can be dict of arrays or record array (from utils.sample_store)
+    read_timestamp = np.asarray(columns["read_timestamp"])
+    if len(read_timestamp) == 0:
+        return {"lost_count": [], "average_latency": [], "jitter": []}
+    seq_number = np.asarray(columns["seq_number"])
+    latency = np.asarray(columns["latency"])
+    # bucket i hold every sample in [start + i, start + i + 1), reported at the end of the bucket
+    start = read_timestamp[0]
+    bucket = np.floor(read_timestamp - start).astype(np.int64)
+    np.maximum(bucket, 0, out=bucket)
+    n_bucket = bucket.max() + 1
+    received = np.bincount(bucket, minlength=n_bucket)
+    latency_sum = np.bincount(bucket, weights=latency, minlength=n_bucket)
+    # ไม่รองรับ out-of-order: lost = gap between seq_number and the expected one (first expected seq is 0)
+    expected_seq = np.empty_like(seq_number)
+    expected_seq[0] = 0
+    expected_seq[1:] = seq_number[:-1] + 1
+    lost = np.bincount(bucket, weights=seq_number - expected_seq, minlength=n_bucket)
+    # jitter = mean absolute difference of consecutive latency (RFC 3550 style, without smoothing)
+    jitter_sum = np.bincount(bucket[1:], weights=np.abs(np.diff(latency)), minlength=n_bucket)
+    jitter_cnt = np.bincount(bucket[1:], minlength=n_bucket)
+
+    have_sample = received > 0
+    timestamps = start + np.nonzero(have_sample)[0] + 1
+    jitter = jitter_sum / np.maximum(jitter_cnt, 1)
+    return {
+        "lost_count": _to_series(timestamps, lost[have_sample]),
+        "average_latency": _to_series(timestamps, latency_sum[have_sample] / received[have_sample]),
+        "jitter": _to_series(timestamps, jitter[have_sample]),
+    }
+
+def per_second_udp_rollup_metrics(records) -> dict:
+    # records => UDP_ROLLUP_DTYPE (utils.sample_store), already one per second with at least one packet
+    records = np.asarray(records)
+    if len(records) == 0:
+        return {"lost_count": [], "average_latency": [], "jitter": []}
+    timestamps = records["timestamp"]
+    return {
+        "lost_count": _to_series(timestamps, records["lost"].astype(np.float64)),
+        "average_latency": _to_series(timestamps, records["latency_sum"] / records["received"]),
+        "jitter": _to_series(timestamps, records["jitter_sum"] / np.maximum(records["jitter_count"], 1)),
+        "latency_min": _to_series(timestamps, records["latency_min"]),
+        "latency_max": _to_series(timestamps, records["latency_max"]),
+        "latency_p50": _to_series(timestamps, records["latency_p50"]),
+        "latency_p99": _to_series(timestamps, records["latency_p99"]),
+    }
+
+def rolling_data_rate(columns: dict) -> list:
+    finish_timestamp = np.asarray(columns["finish_timestamp"])
+    if len(finish_timestamp) == 0:
+        return []
+    with np.errstate(invalid="ignore", divide="ignore"):
+        data_rates = np.asarray(columns["size"]) / (finish_timestamp - np.asarray(columns["start_timestamp"]))
+    # average of every transfer that finished before each second (running mean, sample every 1 second)
+    valid = np.isfinite(data_rates)
+    finish_timestamp = finish_timestamp[valid]
+    data_rates = data_rates[valid]
+    if len(finish_timestamp) == 0:
+        return []
+    order = np.argsort(finish_timestamp, kind="stable")
+    finish_timestamp = finish_timestamp[order]
+    running_mean = np.cumsum(data_rates[order]) / np.arange(1, len(data_rates) + 1)
+    start = finish_timestamp[0]
+    n_second = int(np.floor(finish_timestamp[-1] - start)) + 1
+    timestamps = start + np.arange(1, n_second + 1)
+    finished = np.searchsorted(finish_timestamp, timestamps, side="left")
+    return [[float(start), float(running_mean[0])]] + _to_series(timestamps, running_mean[finished - 1])
+
+def slice_series(series: list, start: float = None, end: float = None) -> list:
+    # keep only points with start <= timestamp <= end (series is sorted by timestamp)
+    if start is None and end is None:
+        return series
+    timestamps = np.fromiter((point[0] for point in series), dtype=np.float64, count=len(series))
+    begin = 0 if start is None else int(np.searchsorted(timestamps, start, side="left"))
+    until = len(series) if end is None else int(np.searchsorted(timestamps, end, side="right"))
+    return series[begin:until]
+
+def lttb(series: list, points: int) -> list:
+    # Largest-Triangle-Three-Buckets, keep the visual shape of the series with only `points` points
+    if points is None or points >= len(series) or points < 3:
+        return series
+    data = np.asarray(series, dtype=np.float64)
+    x = data[:, 0]; y = data[:, 1]
+    # first and last point are always kept, the rest are split into points-2 buckets
+    edges = np.linspace(1, len(data) - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0; selected[-1] = len(data) - 1
+    a = 0
+    for i in range(points - 2):
+        begin, until = edges[i], edges[i + 1]
+        # average point of the next bucket (or the last point for the last bucket)
+        next_begin, next_until = until, (edges[i + 2] if i + 2 < len(edges) else len(data))
+        avg_x = x[next_begin:next_until].mean(); avg_y = y[next_begin:next_until].mean()
+        area = np.abs((x[a] - avg_x) * (y[begin:until] - y[a]) - (x[a] - x[begin:until]) * (avg_y - y[a]))
+        a = begin + int(np.argmax(area))
+        selected[i + 1] = a
+    return data[selected].tolist()
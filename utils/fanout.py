@@ -0,0 +1,132 @@
+import asyncio, random, time
+
+# send the same kind of request to many agents at once
+#   - every request has its own timeout, failed request is retried with jittered exponential backoff
+#   - result that is not "done" yet (e.g. still configuring) is polled again every poll_interval
+#   - the whole phase has a deadline, agents that not done before it are reported instead of waiting forever
+#   - at most `concurrency` requests are in flight
+#   - pushed(key) => awaitable of a result the agent pushed (utils.agent_events), taken like a polled result
+#     without a request, so waiting for the next poll end as soon as the agent report; polling stay as fallback
+
+class PHASE_DEADLINE_EXCEPTION(Exception):
+    pass
+
+class AgentOutcome:
+    def __init__(self, key):
+        self.key = key
+        self.ok = False
+        self.result = None
+        self.error = None
+        self.attempts = 0
+        self.pushes = 0
+        self.finished_at = None
+
+    def __repr__(self):
+        return f"AgentOutcome({self.key!r}, ok={self.ok}, attempts={self.attempts}, error={self.error!r})"
+
+def backoff_delay(failures: int, base_delay: float, max_delay: float) -> float:
+    # full range jitter around the exponential delay so every agent doesn't retry at the same moment
+    delay = min(max_delay, base_delay * (2 ** (failures - 1)))
+    return delay * random.uniform(0.5, 1.5)
+
+async def fan_out(
+    targets: dict,
+    send,
+    is_done=lambda result: True,
+    on_result=None,
+    on_error=None,
+    request_timeout: float = 10,
+    phase_deadline: float = None,
+    poll_interval: float = 2,
+    base_delay: float = 1,
+    max_delay: float = 30,
+    max_attempts: int = None,
+    concurrency: int = 32,
+    pushed=None,
+    initial_delay: float = 0,
+    pushed_poll_interval: float = None,
+) -> dict:
+    # targets => {key: anything}, send(key, timeout) => awaitable of the result
+    # on_result(key, result) / on_error(key, exception) are called after every attempt
+    # initial_delay => wait before the first request (cut short by a push)
+    # pushed_poll_interval => poll_interval of agent that already pushed once (it doesn't need frequent polling)
+    outcomes = {key: AgentOutcome(key) for key in targets}
+    semaphore = asyncio.Semaphore(concurrency)
+    deadline = time.monotonic() + phase_deadline if phase_deadline is not None else None
+
+    async def wait_pushed(key, delay):
+        # => result pushed before delay, None otherwise
+        if pushed is None:
+            await asyncio.sleep(delay)
+            return None
+        try:
+            return await asyncio.wait_for(pushed(key), delay)
+        except asyncio.TimeoutError:
+            return None
+
+    def exhausted(outcome) -> bool:
+        if max_attempts is None or outcome.attempts < max_attempts:
+            return False
+        if outcome.error is None:
+            outcome.error = PHASE_DEADLINE_EXCEPTION(f"not done after {outcome.attempts} attempts")
+        return True
+
+    async def run_one(key):
+        outcome = outcomes[key]
+        failures = 0
+        result = await wait_pushed(key, initial_delay) if initial_delay > 0 else None
+        while True:
+            if result is None:
+                outcome.attempts += 1
+                timeout = request_timeout
+                if deadline is not None:
+                    timeout = max(0.1, min(timeout, deadline - time.monotonic()))
+                try:
+                    async with semaphore:
+                        result = await send(key, timeout)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    failures += 1
+                    outcome.error = e
+                    if on_error is not None:
+                        on_error(key, e)
+                    if exhausted(outcome):
+                        return
+                    result = await wait_pushed(key, backoff_delay(failures, base_delay, max_delay))
+                    continue
+            else:
+                outcome.pushes += 1
+            failures = 0
+            outcome.error = None
+            outcome.result = result
+            if on_result is not None:
+                on_result(key, result)
+            if is_done(result):
+                outcome.ok = True
+                outcome.finished_at = time.time()
+                return
+            if exhausted(outcome):
+                return
+            result = await wait_pushed(key, pushed_poll_interval if outcome.pushes and pushed_poll_interval is not None else poll_interval)
+
+    tasks = [asyncio.create_task(run_one(key)) for key in targets]
+    try:
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=(max(0, deadline - time.monotonic()) if deadline is not None else None))
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for outcome in outcomes.values():
+                if not outcome.ok and outcome.error is None:
+                    outcome.error = PHASE_DEADLINE_EXCEPTION("phase deadline exceeded")
+    finally:
+        # cancelled from outside (e.g. cancel simulation), don't leave request running in background
+        for task in tasks:
+            task.cancel()
+    return outcomes
+
+def raise_if_not_all_ok(outcomes: dict, phase: str):
+    not_ok = [outcome for outcome in outcomes.values() if not outcome.ok]
+    if not_ok:
+        raise PHASE_DEADLINE_EXCEPTION(f"{phase}: {len(not_ok)} of {len(outcomes)} agents not done " + ", ".join(f"{outcome.key} ({outcome.error})" for outcome in not_ok))
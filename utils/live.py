@@ -0,0 +1,55 @@
+import asyncio, json, time
+
+# in-memory pub/sub of what happen during simulation_tasks (state, log, metrics)
+# subscriber is a bounded queue, slow subscriber lose the oldest events instead of blocking the simulation
+
+class SimulationBroker:
+    def __init__(self, queue_size: int = 1000):
+        self._queue_size = queue_size
+        self._subscribers = {}
+
+    def subscribe(self, simulation_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self._queue_size)
+        self._subscribers.setdefault(simulation_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, simulation_id: int, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(simulation_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            self._subscribers.pop(simulation_id, None)
+
+    def publish(self, simulation_id: int, event: str, data: dict):
+        subscribers = self._subscribers.get(simulation_id)
+        if not subscribers:
+            return
+        message = (event, {"timestamp": time.time(), **data})
+        for queue in subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+simulation_broker = SimulationBroker()
+
+# local simulation server print one line per second "{alias_name} {time} deterministic: metrics {json}"
+LIVE_METRICS_TAG = " deterministic: metrics "
+
+def parse_live_metrics_line(line: str):
+    index = line.find(LIVE_METRICS_TAG)
+    if index == -1:
+        return None
+    try:
+        return json.loads(line[index+len(LIVE_METRICS_TAG):])
+    except json.JSONDecodeError:
+        return None
+
+# printed once the port is bound (every worker of sharded mode), "{alias_name} {time} deterministic: ready on port 8888 ..."
+LOCAL_SERVER_READY_TAG = " deterministic: ready "
+
+def is_local_server_ready_line(line: str) -> bool:
+    return LOCAL_SERVER_READY_TAG in line
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
@@ -0,0 +1,43 @@
+import asyncio
+
+# run every network (ssid) of a simulation through its own chain of phases at the same time
+#   - a network go to its next phase as soon as its own previous phase is done, not waiting for the other networks
+#   - simulation state is the phase of the least advanced network, every network log its own phase change
+#   - synchronized_start => networks wait before "running simulation" until all of them are ready, run requests go out together
+#   - the first network that fail cancel the others (the simulation fail anyway)
+
+NETWORK_PHASES = ["configuring access point", "configuring client wifi", "running simulation"]
+
+class NetworkPipeline:
+    def __init__(self, progress, networks: list, synchronized_start: bool = False):
+        # progress => utils.progress.ProgressWriter of the simulation, its state is already NETWORK_PHASES[0]
+        self._progress = progress
+        self._phase = {network: 0 for network in networks}
+        self._state = 0
+        self._synchronized_start = synchronized_start
+        self._all_ready = asyncio.Event()
+
+    async def enter(self, network: str, phase: str):
+        self._phase[network] = NETWORK_PHASES.index(phase)
+        self._progress.log(None, f"{network}: {phase}")
+        state = min(self._phase.values())
+        if state > self._state:
+            self._state = state
+            await self._progress.set_state(NETWORK_PHASES[state])
+        if phase == NETWORK_PHASES[-1] and self._synchronized_start:
+            if state == len(NETWORK_PHASES) - 1:
+                self._all_ready.set()
+            await self._all_ready.wait()
+
+    async def run(self, run_network):
+        # run_network(network) => coroutine of the whole chain of one network
+        tasks = [asyncio.create_task(run_network(network)) for network in self._phase]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
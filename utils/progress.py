@@ -0,0 +1,124 @@
+import asyncio, time
+from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.models import Simulation, SimulationEvent, SimulationCheckpoint
+from utils.live import simulation_broker
+from utils.scheduler import scheduler
+
+# buffer progress of running simulation in memory and append it to simulation_events in batch
+#   - flush every flush_interval second, or sooner when flush_size lines are waiting
+#   - always flush on state change (phase transition, cancel, fail, finish)
+#   - checkpoint of the run (utils.recovery) is written with the same flush
+# live subscriber (utils.live) still get every line immediately
+
+PROGRESS_FLUSH_INTERVAL = 5
+PROGRESS_FLUSH_SIZE = 100
+
+class ProgressWriter:
+    def __init__(self, db_session: AsyncSession, simulation: Simulation, lock: asyncio.Lock, flush_interval: float = PROGRESS_FLUSH_INTERVAL, flush_size: int = PROGRESS_FLUSH_SIZE):
+        self.db_session = db_session
+        self.simulation = simulation
+        self._lock = lock
+        self._flush_interval = flush_interval
+        self._flush_size = flush_size
+        self._buffer = []
+        # every use of db_session go through this lock, flusher run in background of simulation_tasks
+        self._db_lock = asyncio.Lock()
+        self._buffer_full = asyncio.Event()
+        self._flusher = None
+        self._checkpoint = None
+        self._checkpoint_dirty = False
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def close(self):
+        # stop background flusher and write what left, db_session can be used directly after this
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._buffer_full.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._buffer_full.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                # retry at next interval
+                print(f"progress flush of simulation {self.simulation.id} failed: {str(e)}")
+
+    def log(self, node: str, message, level: str = "info"):
+        # node => alias_name, "this_device" or None (server itself), one event per line
+        ts = time.time()
+        for line in str(message).splitlines():
+            if not line.strip():
+                continue
+            self._buffer.append({"simulation_id": self.simulation.id, "ts": ts, "node": node, "level": level, "message": line})
+            simulation_broker.publish(self.simulation.id, "log", {"node": node, "level": level, "message": line})
+        if len(self._buffer) >= self._flush_size:
+            self._buffer_full.set()
+
+    def set_checkpoint(self, run_context: dict, agent_progress: dict):
+        self._checkpoint = {"run_context": run_context, "agent_progress": dict(agent_progress)}
+        self._checkpoint_dirty = True
+
+    def update_agent_progress(self, control_ip: str, agent_state: str):
+        if self._checkpoint is None or self._checkpoint["agent_progress"].get(control_ip) == agent_state:
+            return
+        self._checkpoint["agent_progress"][control_ip] = agent_state
+        self._checkpoint_dirty = True
+
+    def clear_checkpoint(self):
+        self._checkpoint = None
+        self._checkpoint_dirty = True
+
+    async def _write_checkpoint(self):
+        if self._checkpoint is None:
+            checkpoint = await self.db_session.get(SimulationCheckpoint, self.simulation.id)
+            if checkpoint is not None:
+                await self.db_session.delete(checkpoint)
+        else:
+            await self.db_session.merge(SimulationCheckpoint(
+                simulation_id=self.simulation.id,
+                run_context=self._checkpoint["run_context"],
+                agent_progress=dict(self._checkpoint["agent_progress"]),
+                updated_at=datetime.now(),
+            ))
+
+    async def flush(self):
+        async with self._db_lock:
+            buffer, self._buffer = self._buffer, []
+            checkpoint_dirty, self._checkpoint_dirty = self._checkpoint_dirty, False
+            try:
+                if buffer:
+                    await self.db_session.execute(insert(SimulationEvent), buffer)
+                if checkpoint_dirty:
+                    await self._write_checkpoint()
+                self.db_session.add(self.simulation)
+                await self.db_session.commit()
+            except Exception:
+                # keep the events for next flush
+                await self.db_session.rollback()
+                self._buffer = buffer + self._buffer
+                self._checkpoint_dirty = self._checkpoint_dirty or checkpoint_dirty
+                raise
+
+    async def set_state(self, state: str, only_if: str = None):
+        # change state under app lock and write it (together with buffered lines) immediately
+        async with self._lock:
+            if only_if is not None and self.simulation.state != only_if:
+                return False
+            self.simulation.state = state
+            scheduler.set_state(self.simulation.id, state)
+            self._buffer.append({"simulation_id": self.simulation.id, "ts": time.time(), "node": None, "level": "state", "message": state})
+            simulation_broker.publish(self.simulation.id, "state", {"state": state})
+            await self.flush()
+            return True
@@ -0,0 +1,62 @@
+import asyncio, time
+from sqlalchemy import select, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models.models import Scenario, Simulation, SimulationEvent, SimulationCheckpoint
+from utils.scheduler import scheduler, network_resources, TERMINATED_STATES, QUEUED_STATE
+from utils.tasks import run_scheduled_simulation, run_resumed_simulation
+
+# rebuild utils.scheduler from db at startup, simulation left in non-terminated state was interrupted by restart
+#   - agents already running (checkpoint exist) => resumed: polling / cancel / monitor collection continue
+#   - still queued => queued again in the same order
+#   - anything else (stopped while configuring nodes) => failed, nodes state is unknown
+RESUMABLE_STATES = ["running simulation", "cancelling", "terminating"]
+
+async def recover_simulations(lock: asyncio.Lock, db_session: AsyncSession):
+    interrupted = (
+        await db_session.execute(
+            select(Simulation.id, Simulation.state, Simulation.scenario_snapshot, Simulation.scenario_id, SimulationCheckpoint.simulation_id)
+            .outerjoin(SimulationCheckpoint, SimulationCheckpoint.simulation_id==Simulation.id)
+            .where(Simulation.state.not_in(TERMINATED_STATES))
+            .order_by(Simulation.id)
+        )
+    ).all()
+    resumed, queued = [], []
+    for simulation_id, state, scenario_snapshot, scenario_id, checkpoint in interrupted:
+        if state in RESUMABLE_STATES and checkpoint is not None:
+            resumed.append((simulation_id, state, scenario_snapshot))
+        elif state == QUEUED_STATE:
+            queued.append((simulation_id, scenario_snapshot, scenario_id))
+        else:
+            await db_session.execute(insert(SimulationEvent), [
+                {"simulation_id": simulation_id, "ts": time.time(), "node": None, "level": "error", "message": f"server restarted while simulation was {state}"},
+                {"simulation_id": simulation_id, "ts": time.time(), "node": None, "level": "state", "message": "failed"},
+            ])
+            await db_session.execute(update(Simulation).where(Simulation.id==simulation_id).values(state="failed"))
+            print(f"simulation {simulation_id}: interrupted while {state}, marked as failed")
+    await db_session.commit()
+
+    scheduler.shutting_down = False
+    # resumed run hold their nodes already, submit them before the queue
+    for simulation_id, state, scenario_snapshot in resumed:
+        if scheduler.submit(
+            simulation_id,
+            network_resources(scenario_snapshot),
+            lambda simulation_id=simulation_id: run_resumed_simulation(lock, simulation_id)
+        ):
+            # cancel admission check the run state, it is not "starting" anymore
+            scheduler.set_state(simulation_id, state)
+        print(f"simulation {simulation_id}: interrupted while {state}, resumed")
+    for simulation_id, scenario_snapshot, scenario_id in queued:
+        scenario = await db_session.get(Scenario, scenario_id)
+        scheduler.submit(
+            simulation_id,
+            network_resources(scenario_snapshot),
+            lambda simulation_id=simulation_id, scenario_snapshot=scenario_snapshot, password=scenario.target_ap_password, radio=scenario.target_ap_radio: run_scheduled_simulation(
+                lock,
+                simulation_id,
+                scenario_snapshot,
+                password,
+                radio
+            )
+        )
+        print(f"simulation {simulation_id}: queued again")
@@ -0,0 +1,127 @@
+from models.models import Simulation, SimulationRollup
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from utils.analysis import per_second_udp_metrics, per_second_udp_rollup_metrics, rolling_data_rate, slice_series, lttb
+from utils.sample_store import NO_PEER, split_simulation_data, save_simulation_samples, load_simulation_samples
+from datetime import datetime
+
+# fields from agent monitor data that will be return as it is
+MONITOR_FIELDS = {"Tx-Power", "Signal", "Noise", "BitRate", "ping_RTT"}
+
+def _map_client_to_ap(scenario_snapshot: dict) -> dict:
+    map_client_to_ap = {}
+    for ssid in scenario_snapshot:
+        if len((scenario_snapshot[ssid]["aps"])) > 0:
+            ap_control_ip = next(iter(scenario_snapshot[ssid]["aps"]))
+        else:
+            ap_control_ip = "this_device"
+        for client in scenario_snapshot[ssid]["clients"]:
+            map_client_to_ap[client] = ap_control_ip
+    return map_client_to_ap
+
+def build_simulation_rollup(scenario_snapshot: dict, metadata: dict, samples: dict) -> dict:
+    # metadata => small per-node monitor data, samples => {control_ip: {series: {peer: records}}} from utils.sample_store
+    map_client_to_ap = _map_client_to_ap(scenario_snapshot)
+    simulation_data = {}
+    simulation_udp_deterministic_client_data = {}
+    simulation_udp_deterministic_server_data = {}
+    for control_ip in metadata:
+        if control_ip != "this_device" and metadata[control_ip] is not None:
+            simulation_data[control_ip] = {field: metadata[control_ip][field] for field in metadata[control_ip] if field in MONITOR_FIELDS}
+    for control_ip in samples:
+        node_samples = samples[control_ip]
+        # server that aggregate on the fly send per-second rollup, raw samples (if also captured) take over the common fields
+        for series, rollup_fn in (
+            ("udp_deterministic_client_rollup_monitored_from_server", per_second_udp_rollup_metrics),
+            ("udp_deterministic_client_data_monitored_from_server", per_second_udp_metrics),
+        ):
+            if series not in node_samples:
+                continue
+            client_data = node_samples[series]
+            simulation_udp_deterministic_client_data.setdefault(control_ip, {})
+            for client_ip in client_data:
+                simulation_udp_deterministic_client_data[control_ip].setdefault(client_ip, {}).update(rollup_fn(client_data[client_ip]))
+        for series, rollup_fn in (
+            ("udp_deterministic_server_data_monitored_from_client", per_second_udp_metrics),
+            ("file_average_data_rates", lambda records: {"file_average_data_rates": rolling_data_rate(records)}),
+            ("web_average_data_rates", lambda records: {"web_average_data_rates": rolling_data_rate(records)}),
+        ):
+            # only client has server data (ap itself is not in map_client_to_ap)
+            if series not in node_samples or control_ip not in map_client_to_ap:
+                continue
+            ap_control_ip = map_client_to_ap[control_ip]
+            if ap_control_ip not in simulation_udp_deterministic_server_data:
+                simulation_udp_deterministic_server_data[ap_control_ip] = {}
+            if control_ip not in simulation_udp_deterministic_server_data[ap_control_ip]:
+                simulation_udp_deterministic_server_data[ap_control_ip][control_ip] = {}
+            simulation_udp_deterministic_server_data[ap_control_ip][control_ip].update(rollup_fn(node_samples[series][NO_PEER]))
+    return {
+        "simulation_data": simulation_data,
+        "udp_deterministic_server_data_monitored_from_client": simulation_udp_deterministic_server_data,
+        "udp_deterministic_client_data_monitored_from_server": simulation_udp_deterministic_client_data,
+    }
+
+def build_simulation_rollup_from_store(scenario_snapshot: dict, simulation_data: dict, sample_store_path: str) -> dict:
+    if sample_store_path:
+        return build_simulation_rollup(scenario_snapshot, simulation_data, load_simulation_samples(sample_store_path))
+    # simulation that still keep raw samples inside simulation_data column
+    metadata, samples = split_simulation_data(simulation_data)
+    return build_simulation_rollup(scenario_snapshot, metadata, samples)
+
+def store_samples_and_build_rollup(simulation_id: int, scenario_snapshot: dict, raw_simulation_data: dict):
+    # move raw samples into sample store, return (metadata to keep in simulation_data, sample_store_path, rollup_data)
+    # no samples => sample_store_path is None, nothing is written
+    metadata, samples = split_simulation_data(raw_simulation_data)
+    sample_store_path = save_simulation_samples(simulation_id, samples) if samples else None
+    return metadata, sample_store_path, build_simulation_rollup(scenario_snapshot, metadata, samples)
+
+def _is_series(value) -> bool:
+    return isinstance(value, list) and len(value) > 0 and all(isinstance(point, (list, tuple)) and len(point) == 2 for point in value[:1])
+
+def _select_series(value, start: float, end: float, points: int):
+    if not _is_series(value):
+        return value
+    return lttb(slice_series(value, start, end), points)
+
+def filter_simulation_rollup(rollup_data: dict, nodes: set = None, metrics: set = None, start: float = None, end: float = None, points: int = None) -> dict:
+    # nodes => control_ip (match either side of the pair), metrics => field name e.g. average_latency, Signal
+    filtered = {"simulation_data": {}}
+    for control_ip, fields in rollup_data["simulation_data"].items():
+        if nodes is not None and control_ip not in nodes:
+            continue
+        selected_fields = {
+            field: _select_series(value, start, end, points) for field, value in fields.items() if metrics is None or field in metrics
+        }
+        if selected_fields or metrics is None:
+            filtered["simulation_data"][control_ip] = selected_fields
+    for direction in ("udp_deterministic_server_data_monitored_from_client", "udp_deterministic_client_data_monitored_from_server"):
+        filtered[direction] = {}
+        for server_ip, clients in rollup_data[direction].items():
+            for client_ip, fields in clients.items():
+                if nodes is not None and server_ip not in nodes and client_ip not in nodes:
+                    continue
+                selected_fields = {
+                    field: _select_series(value, start, end, points) for field, value in fields.items() if metrics is None or field in metrics
+                }
+                if selected_fields:
+                    filtered[direction].setdefault(server_ip, {})[client_ip] = selected_fields
+    return filtered
+
+async def get_simulation_rollup(db_session: AsyncSession, simulation_id: int):
+    return (
+        await db_session.scalars(
+            select(SimulationRollup)
+            .where(SimulationRollup.simulation_id==simulation_id)
+            .limit(1)
+        )
+    ).first()
+
+async def save_simulation_rollup(db_session: AsyncSession, simulation: Simulation, rollup_data: dict):
+    rollup = await get_simulation_rollup(db_session, simulation.id)
+    if rollup is None:
+        rollup = SimulationRollup(simulation_id=simulation.id)
+    rollup.rollup_data = rollup_data
+    rollup.created_at = datetime.now()
+    db_session.add(rollup)
+    await db_session.commit()
+    return rollup
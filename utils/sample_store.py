@@ -0,0 +1,176 @@
+import numpy as np
+import os, shutil
+
+# raw samples of each simulation are kept outside the database
+# simulation_samples/{simulation_id}/{control_ip}__{series}__{peer}.npy (one fixed-width record array per file)
+SAMPLE_STORE_DIR = "simulation_samples"
+
+UDP_SAMPLE_DTYPE = np.dtype([
+    ("read_timestamp", "<f8"),
+    ("seq_number", "<i8"),
+    ("send_timestamp", "<f8"),
+    ("latency", "<f8"),
+    ("size", "<i4"),
+])
+RATE_SAMPLE_DTYPE = np.dtype([
+    ("finish_timestamp", "<f8"),
+    ("size", "<f8"),
+    ("start_timestamp", "<f8"),
+])
+# per-second rollup from the aggregation of simulation/server/udp_window_deterministic.py (raw capture is optional there)
+UDP_ROLLUP_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("received", "<i8"),
+    ("lost", "<i8"),
+    ("size", "<i8"),
+    ("latency_sum", "<f8"),
+    ("latency_min", "<f8"),
+    ("latency_max", "<f8"),
+    ("jitter_sum", "<f8"),
+    ("jitter_count", "<i8"),
+    ("latency_p50", "<f8"),
+    ("latency_p99", "<f8"),
+])
+# series in agent monitor data that is raw samples, (dtype, is_map_by_peer)
+SAMPLE_SERIES = {
+    "udp_deterministic_server_data_monitored_from_client": (UDP_SAMPLE_DTYPE, False),
+    "udp_deterministic_client_data_monitored_from_server": (UDP_SAMPLE_DTYPE, True),
+    "udp_deterministic_client_rollup_monitored_from_server": (UDP_ROLLUP_DTYPE, True),
+    "file_average_data_rates": (RATE_SAMPLE_DTYPE, False),
+    "web_average_data_rates": (RATE_SAMPLE_DTYPE, False),
+}
+NO_PEER = "-"
+
+def _udp_samples_to_records(samples: list) -> np.ndarray:
+    # [read_timestamp, seq_number, (send_timestamp, diff, len(data))]
+    return np.array([(data[0], data[1], data[2][0], data[2][1], data[2][2]) for data in samples], dtype=UDP_SAMPLE_DTYPE)
+
+def _rate_samples_to_records(samples: list) -> np.ndarray:
+    # [finish_timestamp, size, start_timestamp]
+    return np.array([(data[0], data[1], data[2]) for data in samples], dtype=RATE_SAMPLE_DTYPE)
+
+def _rollup_samples_to_records(samples: list) -> np.ndarray:
+    # one list per second, fields in the order of UDP_ROLLUP_DTYPE
+    return np.array([tuple(data) for data in samples], dtype=UDP_ROLLUP_DTYPE)
+
+def to_records(series: str, samples) -> np.ndarray:
+    dtype, _ = SAMPLE_SERIES[series]
+    if isinstance(samples, np.ndarray):
+        return samples.astype(dtype, copy=False)
+    if dtype == UDP_SAMPLE_DTYPE:
+        return _udp_samples_to_records(samples)
+    if dtype == UDP_ROLLUP_DTYPE:
+        return _rollup_samples_to_records(samples)
+    return _rate_samples_to_records(samples)
+
+def split_simulation_data(raw_simulation_data: dict):
+    # split monitor data into (small per-node metadata, {control_ip: {series: {peer: records}}})
+    metadata = {}; samples = {}
+    for control_ip, node_data in raw_simulation_data.items():
+        if node_data is None:
+            metadata[control_ip] = None
+            continue
+        metadata[control_ip] = {field: value for field, value in node_data.items() if field not in SAMPLE_SERIES}
+        for series, (_, is_map_by_peer) in SAMPLE_SERIES.items():
+            if series not in node_data or node_data[series] is None:
+                continue
+            by_peer = node_data[series] if is_map_by_peer else {NO_PEER: node_data[series]}
+            samples.setdefault(control_ip, {})[series] = {peer: to_records(series, data) for peer, data in by_peer.items()}
+    return metadata, samples
+
+def _file_name(control_ip: str, series: str, peer: str):
+    return f"{control_ip}__{series}__{peer}.npy"
+
+def save_simulation_samples(simulation_id: int, samples: dict) -> str:
+    path = os.path.join(SAMPLE_STORE_DIR, str(simulation_id))
+    os.makedirs(path, exist_ok=True)
+    for control_ip in samples:
+        for series in samples[control_ip]:
+            for peer, records in samples[control_ip][series].items():
+                np.save(os.path.join(path, _file_name(control_ip, series, peer)), records, allow_pickle=False)
+    return path
+
+# streamed monitor data (utils.tasks.fetch_monitor_data) is written chunk by chunk, never held whole in memory
+#   every (series, peer) is appended to a .part file of raw records, turned into the .npy file on close
+
+class NodeSampleWriter:
+    def __init__(self, path: str, control_ip: str):
+        self._path = path
+        self._control_ip = control_ip
+        # (series, peer) => [open .part file, record count]
+        self._parts = {}
+
+    def write(self, series: str, samples, peer: str = NO_PEER):
+        records = to_records(series, samples)
+        key = (series, peer)
+        if key not in self._parts:
+            self._parts[key] = [open(os.path.join(self._path, _file_name(self._control_ip, series, peer) + ".part"), "wb"), 0]
+        records.tofile(self._parts[key][0])
+        self._parts[key][1] += len(records)
+
+    def write_node_data(self, node_data: dict) -> dict:
+        # whole monitor data of the node at once (agent that doesn't stream, local server file) => its metadata
+        metadata = {field: value for field, value in node_data.items() if field not in SAMPLE_SERIES}
+        for series, (_, is_map_by_peer) in SAMPLE_SERIES.items():
+            if series not in node_data or node_data[series] is None:
+                continue
+            by_peer = node_data[series] if is_map_by_peer else {NO_PEER: node_data[series]}
+            for peer, data in by_peer.items():
+                self.write(series, data, peer)
+        return metadata
+
+    def discard(self):
+        # broken stream is fetched again from the start
+        for file, _ in self._parts.values():
+            file.close()
+            os.remove(file.name)
+        self._parts = {}
+
+    def close(self):
+        for (series, peer), (file, count) in self._parts.items():
+            file.close()
+            dtype, _ = SAMPLE_SERIES[series]
+            with open(os.path.join(self._path, _file_name(self._control_ip, series, peer)), "wb") as npy_file, open(file.name, "rb") as part_file:
+                np.lib.format.write_array_header_1_0(npy_file, {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (count,)})
+                shutil.copyfileobj(part_file, npy_file, 1 << 20)
+            os.remove(file.name)
+        self._parts = {}
+
+class SampleStoreWriter:
+    def __init__(self, simulation_id: int):
+        self.path = os.path.join(SAMPLE_STORE_DIR, str(simulation_id))
+        os.makedirs(self.path, exist_ok=True)
+        self._nodes = {}
+
+    def node(self, control_ip: str) -> NodeSampleWriter:
+        if control_ip not in self._nodes:
+            self._nodes[control_ip] = NodeSampleWriter(self.path, control_ip)
+        return self._nodes[control_ip]
+
+    def close(self) -> str:
+        for node in self._nodes.values():
+            node.close()
+        return self.path
+
+def load_simulation_samples(path: str, control_ips: set = None, series_names: set = None) -> dict:
+    samples = {}
+    if not path or not os.path.isdir(path):
+        return samples
+    for file_name in sorted(os.listdir(path)):
+        if not file_name.endswith(".npy"):
+            continue
+        control_ip, series, peer = file_name[:-4].split("__")
+        if series not in SAMPLE_SERIES:
+            continue
+        if control_ips is not None and control_ip not in control_ips:
+            continue
+        if series_names is not None and series not in series_names:
+            continue
+        # memory map, only the pages that actually read will be loaded
+        records = np.load(os.path.join(path, file_name), mmap_mode="r", allow_pickle=False)
+        samples.setdefault(control_ip, {}).setdefault(series, {})[peer] = records
+    return samples
+
+def delete_simulation_samples(path: str):
+    if path and os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,117 @@
+import asyncio
+
+# in-memory scheduler of simulations (queued and running), run/cancel admission read it instead of the simulations table
+#   - every run hold resources parsed from its network snapshot (node control ip, ssid, this_device)
+#   - runs that don't share any resource run at the same time, each in its own task
+#   - conflicting run wait in a FIFO queue, a queued run also block later runs that conflict with it (no starvation)
+# kept in sync by ProgressWriter.set_state, rebuilt from db at startup by utils.recovery.recover_simulations
+
+TERMINATED_STATES = ["cancelled [terminate with success]", "cancelled [terminate with error]", "failed", "finished"]
+CANCELLABLE_STATES = ["starting", "configuring access point", "configuring client wifi", "running simulation"]
+QUEUED_STATE = "queued"
+
+def network_resources(network_info: dict) -> set:
+    # network_info => parse_network_from_node_config(...)["network_info"]
+    resources = set()
+    for ssid in network_info:
+        resources.add(f"ssid:{ssid}")
+        if network_info[ssid]["is_target_ap"]:
+            # this device connect to target ap and run simulation server itself
+            resources.add("this_device")
+        for control_ip in network_info[ssid]["aps"]:
+            resources.add(f"node:{control_ip}")
+        for control_ip in network_info[ssid]["clients"]:
+            resources.add(f"node:{control_ip}")
+    return resources
+
+class ScheduledRun:
+    def __init__(self, simulation_id: int, resources: set, start):
+        self.simulation_id = simulation_id
+        self.resources = resources
+        # start() => coroutine of the whole simulation (utils.tasks.run_scheduled_simulation)
+        self._start = start
+        self.state = QUEUED_STATE
+        self.task = None
+
+class SimulationScheduler:
+    def __init__(self):
+        self._runs = {}
+        self._queue = []
+        # set on shutdown, running task stop without cancelling the agents (resumed at next startup)
+        self.shutting_down = False
+
+    def get(self, simulation_id: int) -> ScheduledRun:
+        return self._runs.get(simulation_id)
+
+    def running(self) -> list:
+        return [run for run in self._runs.values() if run.task is not None]
+
+    def queued(self) -> list:
+        return [self._runs[simulation_id] for simulation_id in self._queue]
+
+    def conflicts(self, resources: set) -> list:
+        # id of queued/running simulations that share any resource
+        return [run.simulation_id for run in self._runs.values() if run.resources & resources]
+
+    def submit(self, simulation_id: int, resources: set, start) -> bool:
+        # => True if the run started now, False if it is queued
+        self._runs[simulation_id] = ScheduledRun(simulation_id, resources, start)
+        self._queue.append(simulation_id)
+        self._schedule()
+        return self._runs[simulation_id].task is not None
+
+    def _schedule(self):
+        # no await inside => start decision and resource claim happen at once
+        if self.shutting_down:
+            return
+        busy = set()
+        for run in self.running():
+            busy |= run.resources
+        for simulation_id in list(self._queue):
+            run = self._runs[simulation_id]
+            if run.resources & busy:
+                busy |= run.resources
+                continue
+            self._queue.remove(simulation_id)
+            run.state = "starting"
+            run.task = asyncio.create_task(run._start())
+            # also cover task that is cancelled before it start running (its finally never run)
+            run.task.add_done_callback(lambda _, simulation_id=simulation_id: self.finish(simulation_id))
+            busy |= run.resources
+
+    def set_state(self, simulation_id: int, state: str):
+        run = self._runs.get(simulation_id)
+        if run is not None:
+            run.state = state
+
+    def finish(self, simulation_id: int):
+        if self._runs.pop(simulation_id, None) is None:
+            return
+        if simulation_id in self._queue:
+            self._queue.remove(simulation_id)
+        self._schedule()
+
+    def cancel(self, simulation_id: int) -> str:
+        # => "dequeued" (caller write the cancelled state), "cancelling" or None (nothing to cancel)
+        run = self._runs.get(simulation_id)
+        if run is None:
+            return None
+        if run.task is None:
+            self.finish(simulation_id)
+            return "dequeued"
+        if run.state not in CANCELLABLE_STATES:
+            return None
+        run.task.cancel()
+        return "cancelling"
+
+    async def shutdown(self, timeout: float = 10):
+        self.shutting_down = True
+        tasks = [run.task for run in self.running()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout)
+        self._runs = {}
+        self._queue = []
+
+scheduler = SimulationScheduler()
@@ -0,0 +1,76 @@
+from datetime import datetime
+from fastapi import HTTPException, Response
+from sqlalchemy import text, column
+from models.models import FTS_TABLES
+
+# search and keyset pagination shared by list endpoints
+#   search => every word (split by space) is a substring, case-insensitive ("lab 2" match "office-lab2", thai too),
+#             through trigram fts table in models.models.FTS_TABLES, word shorter than 3 characters scan it with LIKE
+#   after  => cursor of the last row of previous page, next page start right after it (no offset scan)
+
+# shown in the docs of list endpoints
+SEARCH_DESCRIPTION = (
+    "search: every space separated word must be a substring of the name (case-insensitive, any language), "
+    "it used to be a regular expression. Paging: page or after (X-Next-After header of the previous page), "
+    "X-Total-Count header is the number of matching rows."
+)
+
+# trigram index serve only substring of at least this many characters
+TRIGRAM_MIN_LENGTH = 3
+
+def fts_match_query(words: list):
+    # trigram phrase => substring match, " in a word is doubled
+    long_words = [word for word in words if len(word) >= TRIGRAM_MIN_LENGTH]
+    if not long_words:
+        return None
+    return " AND ".join('"{}"'.format(word.replace('"', '""')) for word in long_words)
+
+def like_pattern(word: str):
+    return "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+def fts_rowids(fts_table: str, search: str):
+    # => select of matching rowid (use with Model.id.in_()), None when search is empty
+    words = (search or "").split()
+    if not words:
+        return None
+    searchable_column = FTS_TABLES[fts_table][2]
+    conditions = []; params = {}
+    query = fts_match_query(words)
+    if query is not None:
+        conditions.append(f"{fts_table} MATCH :query")
+        params["query"] = query
+    for i, word in enumerate(word for word in words if len(word) < TRIGRAM_MIN_LENGTH):
+        conditions.append(f"{searchable_column} LIKE :like_{i} ESCAPE '\\'")
+        params[f"like_{i}"] = like_pattern(word)
+    return text(f"SELECT rowid FROM {fts_table} WHERE {' AND '.join(conditions)}").bindparams(**params).columns(column("rowid"))
+
+def parse_after_id(after: str) -> int:
+    try:
+        return int(after)
+    except ValueError:
+        raise HTTPException(400, "after must be an id")
+
+def parse_after_created_at_id(after: str):
+    # "<created_at iso format>,<id>"
+    try:
+        created_at, id = after.rsplit(",", 1)
+        return datetime.fromisoformat(created_at), int(id)
+    except ValueError:
+        raise HTTPException(400, "after must be <created_at>,<id>")
+
+def format_after_created_at_id(created_at: datetime, id: int) -> str:
+    return f"{created_at.isoformat()},{id}"
+
+# total row count and cursor of next page (absent on last page) are sent as response header,
+# body stay the same list as before
+TOTAL_COUNT_HEADER = "X-Total-Count"
+NEXT_AFTER_HEADER = "X-Next-After"
+
+def set_page_headers(response: Response, total: int, next_after: str):
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    if next_after is not None:
+        response.headers[NEXT_AFTER_HEADER] = next_after
+
+def validate_page_size(page_size: int):
+    if page_size < 1 or page_size > 1000:
+        raise HTTPException(400, "page_size must be between 1 and 1000")
@@ -1,27 +1,229 @@
 import psutil
 import asyncio, socket
-import aiohttp, os, signal, subprocess
-import time
+import os, signal, subprocess
+import sys, time
 from utils.utils import (
     post_request,
+    get_request,
+    get_stream_request,
+    agent_url,
+    describe_request_exception,
     generate_scripts_for_run_simulation, 
     _get_ip_address, 
     _configure_server_connection, 
     keep_sending_post_request_until_all_ok, 
-    send_multiple_get_request,
-    read_json_file_and_delete_file,
     _get_control_ip_address,
     RUN_SUBPROCESS_EXCEPTION
 )
-from fastapi import Request
+from utils.fanout import fan_out, raise_if_not_all_ok
+from utils.live import simulation_broker, parse_live_metrics_line, is_local_server_ready_line
+from utils.rollup import build_simulation_rollup_from_store, save_simulation_rollup
+from utils.sample_store import SampleStoreWriter, NodeSampleWriter
+from utils.telemetry import STREAM_CONTENT_TYPES, telemetry_decoder, write_telemetry, read_telemetry_file_and_delete_file
+from utils.progress import ProgressWriter
+from utils.scheduler import scheduler
+from utils.agent_events import agent_events
+from utils.pipeline import NetworkPipeline
 from sqlalchemy.ext.asyncio import AsyncSession
-from models.models import Scenario, Simulation, RadioModeEnum
-from models.database import get_db_session
-    
-async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request: Request, simulation: Simulation, parsed_node_configs: dict, target_ssid_password: str, target_ssid_radio: RadioModeEnum):
+from models.models import Simulation, SimulationCheckpoint, RadioModeEnum
+from models.database import sessionmanager
+
+async def read_local_process_output(progress: ProgressWriter, running_processes: list, finish_process: list):
+    for process in running_processes:
+        if process in finish_process:
+            continue
+        try:
+            # read every line that already available
+            while True:
+                line = await asyncio.wait_for(process.stdout.readline(), timeout=0.01)
+                if not line:
+                    finish_process.append(process)
+                    # process is finish writing (write eof to buffer)
+                    break
+                line = line.decode()
+                live_metrics = parse_live_metrics_line(line)
+                if live_metrics is not None:
+                    simulation_broker.publish(progress.simulation.id, "metrics", {"node": "this_device", "metrics": live_metrics})
+                else:
+                    progress.log("this_device", line)
+        except asyncio.TimeoutError:
+            pass
+
+MONITOR_REQUEST_TIMEOUT = 300
+# deadline (second) of each phase, agent that not done before this => phase failed instead of waiting forever
+CONFIGURE_AP_DEADLINE = 120
+AP_READY_DEADLINE = 300
+CONFIGURE_CLIENT_DEADLINE = 300
+RUN_DEADLINE = 60
+LOCAL_SERVER_READY_DEADLINE = 30
+# simulation state polling deadline = longest simulation timeout + this
+RUN_STATE_GRACE = 120
+CANCEL_DEADLINE = 30
+MONITOR_DEADLINE = 900
+# resumed run (utils.recovery) whose deadline already passed still get this long to report finish
+RESUME_MIN_DEADLINE = 60
+# wait after configuring ap before its state is trusted (tx_packets count is being cleared), ended early by pushed ap_state
+AP_SETTLE_DELAY = 10
+AP_STATE_POLL_INTERVAL = 5
+SIMULATION_STATE_POLL_INTERVAL = 2
+# agent that push its state (POST /agent/events) is polled only this often, as fallback
+PUSHED_POLL_INTERVAL = 15
+
+async def wait_local_server_ready(progress: ProgressWriter, process):
+    # clients are started only once the local server is bound (every worker of its sharded mode)
+    async def read_until_ready():
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                return False
+            progress.log("this_device", line.decode())
+            if is_local_server_ready_line(line.decode()):
+                return True
+    try:
+        if not await asyncio.wait_for(read_until_ready(), LOCAL_SERVER_READY_DEADLINE):
+            progress.log("this_device", "local server exited before it was ready", level="error")
+    except asyncio.TimeoutError:
+        # older server script never print ready
+        progress.log("this_device", f"local server not ready in {LOCAL_SERVER_READY_DEADLINE} seconds, starting clients anyway", level="error")
+
+def stop_local_process(process):
+    # => output of the kill command
+    if sys.platform == "win32":
+        return subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=subprocess.PIPE).stdout.decode()
+    # own session (start_this_device_server), the server forward SIGTERM to its workers and still write its result
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    return ""
+
+def agent_callbacks(progress: ProgressWriter, map_ip_to_alias_name: dict):
+    def log_agent_error(control_ip, e):
+        progress.log(map_ip_to_alias_name[control_ip], describe_request_exception(e), level="error")
+    def on_agent_state(control_ip, result):
+        progress.log(map_ip_to_alias_name[control_ip], result[0]["new_state_message"])
+        if result[0].get("new_metrics"):
+            simulation_broker.publish(progress.simulation.id, "metrics", {"node": control_ip, "metrics": result[0]["new_metrics"]})
+        if result[0]["state"] == "finish":
+            progress.update_agent_progress(control_ip, "finish")
+    return log_agent_error, on_agent_state
+
+def listen_agent_events(progress: ProgressWriter, map_ip_to_alias_name: dict):
+    # => utils.agent_events.AgentListener of every node of the simulation, close it when the run is done
+    def on_agent_log(control_ip, message, level):
+        progress.log(map_ip_to_alias_name[control_ip], message, level=level)
+    return agent_events.listen(list(map_ip_to_alias_name), on_agent_log)
+
+def poll_agent_states(running_request_data: dict, on_agent_state, log_agent_error, phase_deadline: float, pushed=None):
+    # => awaitable of fan_out outcomes, done when every agent report finish
+    return fan_out(
+        running_request_data,
+        lambda control_ip, timeout: get_request(agent_url(control_ip, "/simulation/state"), None, timeout),
+        is_done=lambda result: result[0]["state"] == "finish",
+        on_result=on_agent_state,
+        on_error=log_agent_error,
+        poll_interval=SIMULATION_STATE_POLL_INTERVAL,
+        pushed=pushed,
+        pushed_poll_interval=PUSHED_POLL_INTERVAL,
+        phase_deadline=phase_deadline,
+    )
+
+async def cancel_agents(progress: ProgressWriter, running_request_data: dict, map_ip_to_alias_name: dict, on_agent_state, log_agent_error, pushed=None) -> bool:
+    # retry 3 time, => True if every agent accepted the cancel
+    cancel_outcomes, _ = await asyncio.gather(
+        fan_out(
+            running_request_data,
+            lambda control_ip, timeout: post_request(agent_url(control_ip, "/simulation/cancel"), {}, timeout),
+            on_result=lambda control_ip, result: progress.log(map_ip_to_alias_name[control_ip], result[0]),
+            on_error=log_agent_error,
+            max_attempts=3,
+            phase_deadline=CANCEL_DEADLINE,
+        ),
+        fan_out(
+            running_request_data,
+            lambda control_ip, timeout: get_request(agent_url(control_ip, "/simulation/state"), None, timeout),
+            is_done=lambda result: result[0]["state"] == "finish",
+            on_result=on_agent_state,
+            on_error=log_agent_error,
+            max_attempts=3,
+            phase_deadline=CANCEL_DEADLINE,
+            pushed=pushed,
+        ),
+    )
+    return all(outcome.ok for outcome in cancel_outcomes.values())
+
+async def fetch_monitor_data(control_ip: str, sample_writer: NodeSampleWriter, timeout: float, stream_types: list = STREAM_CONTENT_TYPES):
+    # GET /simulation/monitor, agent pick the first format it support (utils.telemetry)
+    #   binary telemetry / ndjson => decoded chunk by chunk, samples go to sample store as they arrive
+    #   whole json => agent that doesn't stream, as before
+    # => (metadata of the node, url) like get_request
+    sample_writer.discard()
+    metadata = {}
+    decoder = []
+    def on_chunk(content_type, chunk):
+        if not decoder:
+            decoder.append(telemetry_decoder(content_type))
+        write_telemetry(decoder[0].feed(chunk), sample_writer, metadata)
+    # format=ndjson => agent that only know the query parameter
+    body, url = await get_stream_request(agent_url(control_ip, "/simulation/monitor"), {"format": "ndjson"}, timeout, stream_types, lambda content_type, chunk: asyncio.to_thread(on_chunk, content_type, chunk))
+    if body is not None:
+        metadata = await asyncio.to_thread(sample_writer.write_node_data, body)
+    elif decoder:
+        write_telemetry(decoder[0].close(), sample_writer, metadata)
+    return metadata, url
+
+async def finish_simulation(progress: ProgressWriter, db_session: AsyncSession, simulation: Simulation, have_monitor_data: bool, running_request_data: dict, transfer_file: list, log_agent_error):
+    # collect monitor data of every agent (and this device), then the run is done => checkpoint is not needed anymore
+    await progress.set_state("terminating", only_if="running simulation")
+    if have_monitor_data:
+        simulation_data = {control_ip: {"Tx_power": None, "Signal": None, "Noise": None, "BitRate": None, "ping_RTT": None} for control_ip in running_request_data}
+        # raw samples are written to sample store as they arrive, only small per-node metadata is kept in memory
+        sample_writer = SampleStoreWriter(simulation.id)
+        # monitor data can be large, give it more time than the default request timeout and fetch only few at a time
+        outcomes = await fan_out(
+            running_request_data,
+            lambda control_ip, timeout: fetch_monitor_data(control_ip, sample_writer.node(control_ip), timeout),
+            on_error=log_agent_error,
+            request_timeout=MONITOR_REQUEST_TIMEOUT,
+            max_attempts=3,
+            phase_deadline=MONITOR_DEADLINE,
+            concurrency=4,
+        )
+        for control_ip, outcome in outcomes.items():
+            if outcome.ok:
+                simulation_data[control_ip] = outcome.result[0]
+            else:
+                # no half streamed samples of agent that never finished sending
+                sample_writer.node(control_ip).discard()
+        for file_path in transfer_file:
+            metadata = await asyncio.to_thread(read_telemetry_file_and_delete_file, file_path, sample_writer.node("this_device"))
+            if metadata is not None:
+                simulation_data.setdefault("this_device", {}).update(metadata)
+        sample_store_path = await asyncio.to_thread(sample_writer.close)
+        # aggregate once here so get_simulation doesn't need to walk the raw data every request (sample store is memory mapped)
+        rollup_data = await asyncio.to_thread(build_simulation_rollup_from_store, simulation.scenario_snapshot, simulation_data, sample_store_path)
+        simulation.simulation_data = simulation_data
+        simulation.sample_store_path = sample_store_path
+        await progress.flush()
+        await save_simulation_rollup(db_session, simulation, rollup_data)
+    progress.clear_checkpoint()
+    await progress.flush()
+    await progress.set_state("finished", only_if="terminating")
+
+async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, simulation: Simulation, parsed_node_configs: dict, target_ssid_password: str, target_ssid_radio: RadioModeEnum):
+    progress = ProgressWriter(db_session, simulation, lock)
+    progress.start()
+    have_monitor_data = False
+    running_request_data = {}
+    transfer_file = []
+    log_agent_error = None
+    listener = None
+    # control server shutting down => leave agents running, utils.recovery resume the run at next startup
+    checkpointed = False
+    detached = False
     try:
+        await progress.set_state("starting")
         # initial variable
-        have_monitor_data = False
         print(target_ssid_radio)
         if target_ssid_radio is not None:
             target_ssid_radio = target_ssid_radio.value
@@ -31,6 +233,8 @@ async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request
                 map_ip_to_alias_name[control_ip] = parsed_node_configs[ssid]["aps"][control_ip]["alias_name"]
             for control_ip in parsed_node_configs[ssid]["clients"]:
                 map_ip_to_alias_name[control_ip] = parsed_node_configs[ssid]["clients"][control_ip]["alias_name"]
+        log_agent_error, on_agent_state = agent_callbacks(progress, map_ip_to_alias_name)
+        listener = listen_agent_events(progress, map_ip_to_alias_name)
         # sync clock with every node
         # udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         # udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
@@ -48,67 +252,46 @@ async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request
         #         await post_request(f"http://{control_ip}:8000/sync_clock/{time.time():.7f}", {})
         #         await asyncio.sleep(0.01)
         #         await post_request(f"http://{control_ip}:8000/sync_clock/{time.time():.7f}", {})
-        # configuring all ap_node
-        async with lock:
-            simulation.state = "configuring access point"
-            db_session.add(simulation)
-            await db_session.commit()
-        config_ap_request_data = {}
-        for ssid in parsed_node_configs:
-            if parsed_node_configs[ssid]["is_target_ap"]:
-                continue
+        # every network (ssid) configure its ap, then its clients, then run, without waiting for other networks (utils.pipeline)
+        await progress.set_state("configuring access point")
+        pipeline = NetworkPipeline(progress, list(parsed_node_configs), simulation.synchronized_start)
+        have_temp_profile = False
+        running_processes = []
+        run_outcomes = {}
+
+        async def configure_access_point(ssid):
+            config_ap_request_data = {}
             for control_ip in parsed_node_configs[ssid]["aps"]:
                 config_ap_request_data[control_ip] = {
                     "ssid": ssid,
                     "radio": parsed_node_configs[ssid]["aps"][control_ip]["radio"],
                     "tx_power": parsed_node_configs[ssid]["aps"][control_ip]["tx_power"]
                 }
-        # sending request until all send the ok respond
-        config_data_map_url_data = {f"http://{control_ip}:8000/configure/ap": config_ap_request_data[control_ip] for control_ip in config_ap_request_data}
-        await keep_sending_post_request_until_all_ok(db_session, simulation, config_data_map_url_data, map_ip_to_alias_name)
-        # start to poll the result
-        polling_urls = {f"http://{control_ip}:8000/configure/ap/state": config_ap_request_data[control_ip] for control_ip in config_ap_request_data}    
-        finish_urls = set()
-        # await 10 second make sure that tx_packets count is being cleared (ตัวเก่าจะช้า 30 วินาที)
-        if len(polling_urls) > 0:
-            await asyncio.sleep(10)
-        print("somethiong\n\n\n")
-        while True:
-            # print(polling_urls)
-            if len(polling_urls) == len(finish_urls):
-                break
-            polling_results = await send_multiple_get_request(polling_urls, finish_urls)
-            for result in polling_results:
-                # print(result)
-                if issubclass(type(result), Exception):
-                    if result is asyncio.CancelledError:
-                        raise result
-                    print(result)
-                    if type(result.args[0]) is aiohttp.client_reqrep.ConnectionKey:
-                        simulation.state_message += f"{map_ip_to_alias_name[result.args[0].host]} {time.time()}: {str(result)}\n"
-                    else:
-                        simulation.state_message += str(result)+"\n"
-                else:
-                    if result[0] == "ready_to_use":
-                        finish_urls.add(result[1])
-                        simulation.state_message += f"{map_ip_to_alias_name[result[1].split(':')[1][2:]]} {time.time()}: {result[0]}\n"
-                        print(f"{result[1].split(':')[1][2:]} {time.time()}: {result[0]}\n")
-            db_session.add(simulation)
-            await db_session.commit()
-            await asyncio.sleep(5)
-        # ============================================================================================= #
-        # configure all client_node
-        async with lock:
-            simulation.state = "configuring client wifi"
-            db_session.add(simulation)
-            await db_session.commit()
-        have_temp_profile = False
-        target_ssid = ""
-        config_client_request_data = {}
-        for ssid in parsed_node_configs:
+            # sending request until all send the ok respond
+            outcomes = await keep_sending_post_request_until_all_ok(progress, "/configure/ap", config_ap_request_data, map_ip_to_alias_name, phase_deadline=CONFIGURE_AP_DEADLINE)
+            raise_if_not_all_ok(outcomes, f"{ssid}: configuring access point")
+            # start to poll the result after AP_SETTLE_DELAY to make sure that tx_packets count is being cleared (ตัวเก่าจะช้า 30 วินาที)
+            # ap that push ready_to_use is done right away
+            def on_ap_state(control_ip, result):
+                if result[0] == "ready_to_use":
+                    progress.log(map_ip_to_alias_name[control_ip], result[0])
+            outcomes = await fan_out(
+                config_ap_request_data,
+                lambda control_ip, timeout: get_request(agent_url(control_ip, "/configure/ap/state"), config_ap_request_data[control_ip], timeout),
+                is_done=lambda result: result[0] == "ready_to_use",
+                on_result=on_ap_state,
+                on_error=log_agent_error,
+                poll_interval=AP_STATE_POLL_INTERVAL,
+                pushed=listener.pushed("ap_state"),
+                initial_delay=AP_SETTLE_DELAY,
+                pushed_poll_interval=PUSHED_POLL_INTERVAL,
+                phase_deadline=AP_READY_DEADLINE,
+            )
+            raise_if_not_all_ok(outcomes, f"{ssid}: waiting access point ready_to_use")
+
+        async def configure_clients(ssid):
+            config_client_request_data = {}
             if parsed_node_configs[ssid]["is_target_ap"]:
-                target_ssid = ssid
-                have_temp_profile = True
                 for control_ip in parsed_node_configs[ssid]["clients"]:
                     config_client_request_data[control_ip] = {
                         "ssid": ssid,
@@ -124,47 +307,30 @@ async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request
                         "radio": parsed_node_configs[ssid]["aps"][control_ap_ip]["radio"],
                         "connect_to_target_ap": False,
                     }
-        # keep sending request until all connected (this url wll wait for configured to apply because connected wifi is way more faster than config ap)
-        config_map_url_data = {f"http://{control_ip}:8000/configure/client": config_client_request_data[control_ip] for control_ip in config_client_request_data}    
-        print(config_map_url_data)
-        await keep_sending_post_request_until_all_ok(db_session, simulation, config_map_url_data, map_ip_to_alias_name)
-        # polling until this device successfully connected to target ap
-        if have_temp_profile:
+            # keep sending request until all connected (this url wll wait for configured to apply because connected wifi is way more faster than config ap)
+            outcomes = await keep_sending_post_request_until_all_ok(progress, "/configure/client", config_client_request_data, map_ip_to_alias_name, phase_deadline=CONFIGURE_CLIENT_DEADLINE)
+            raise_if_not_all_ok(outcomes, f"{ssid}: configuring client wifi")
+
+        async def connect_this_device(ssid):
+            # polling until this device successfully connected to target ap
             this_device_connected = False
-            # print(target_ssid)
             while not this_device_connected:
                 try :
                     this_device_connected = await _configure_server_connection(ssid, target_ssid_password)
                 except RUN_SUBPROCESS_EXCEPTION as e:
-                    # print(str(e))
-                    simulation.state_message += f"this_device {time.time()}: {str(e)}"
-                # print(this_device_connected)
+                    progress.log("this_device", str(e), level="error")
                 await asyncio.sleep(2)
-                db_session.add(simulation)
-                await db_session.commit()
             this_device_connected_ip = _get_ip_address()
-            # print(this_device_connected_ip)
-            simulation.state_message += f"this_device {time.time()}: connected to {target_ssid} with ip_address {this_device_connected_ip}\n"
-            db_session.add(simulation)
-            await db_session.commit()
-        # ============================================================================================== #
-        # running simulation
-        async with lock:
-            simulation.state = "running simulation"
-            db_session.add(simulation)
-            await db_session.commit()
-        this_device_simulation_modes = set()
-        this_device_server_timeout = 0
-        running_request_data = {}
-        for ssid in parsed_node_configs:
+            progress.log("this_device", f"connected to {ssid} with ip_address {this_device_connected_ip}")
+            return this_device_connected_ip
+
+        def build_running_request_data(ssid, this_device_connected_ip):
+            network_running_request_data = {}
             if parsed_node_configs[ssid]["is_target_ap"]:
                 for control_ip in parsed_node_configs[ssid]["clients"]:
-                    this_device_simulation_modes.add(parsed_node_configs[ssid]["clients"][control_ip]["simulation_type"])
-                    this_device_server_timeout = max(this_device_server_timeout, parsed_node_configs[ssid]["clients"][control_ip]["timeout"])
                     simulation_scenario = parsed_node_configs[ssid]["clients"][control_ip].copy()
                     simulation_scenario.pop("alias_name")
-                    # print(parsed_node_configs[ssid]["clients"][control_ip].copy())
-                    running_request_data[control_ip] = {
+                    network_running_request_data[control_ip] = {
                         "alias_name": parsed_node_configs[ssid]["clients"][control_ip]["alias_name"],
                         "simulation_mode": "client",
                         "server_ip": this_device_connected_ip,
@@ -172,9 +338,9 @@ async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request
                             simulation_scenario
                         ],
                     }
-                continue
+                return network_running_request_data
             for control_ip in parsed_node_configs[ssid]["aps"]:
-                running_request_data[control_ip] = {
+                network_running_request_data[control_ip] = {
                     "alias_name": parsed_node_configs[ssid]["aps"][control_ip]["alias_name"],
                     "simulation_mode": "server",
                     "simulation_scenarios": [
@@ -184,129 +350,91 @@ async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request
             for control_ip in parsed_node_configs[ssid]["clients"]:
                 simulation_detail = parsed_node_configs[ssid]["clients"][control_ip].copy()
                 simulation_detail.pop("alias_name")
-                running_request_data[control_ip] = {
+                network_running_request_data[control_ip] = {
                     "alias_name": parsed_node_configs[ssid]["clients"][control_ip]["alias_name"],
                     "simulation_mode": "client",
                     "simulation_scenarios": [
                         simulation_detail
                     ],
                 }
-        # open server at this device
-        # print(running_request_data)
-        print("\n\n\n\nksdjfdolsdj\n")
-        running_processes = []
-        if have_temp_profile and this_device_server_timeout > 0 and len(this_device_simulation_modes) > 0:
-            run_scripts, transfer_file = generate_scripts_for_run_simulation(this_device_simulation_modes, this_device_server_timeout+5)
-            print(run_scripts, transfer_file)
-            if len(run_scripts) > 0:
+            return network_running_request_data
+
+        async def start_this_device_server(ssid):
+            # open server at this device for clients of target ap
+            nonlocal transfer_file
+            this_device_simulation_modes = {parsed_node_configs[ssid]["clients"][control_ip]["simulation_type"] for control_ip in parsed_node_configs[ssid]["clients"]}
+            this_device_server_timeout = max([parsed_node_configs[ssid]["clients"][control_ip]["timeout"] for control_ip in parsed_node_configs[ssid]["clients"]], default=0)
+            if this_device_server_timeout > 0 and len(this_device_simulation_modes) > 0:
+                run_scripts, transfer_file = generate_scripts_for_run_simulation(this_device_simulation_modes, this_device_server_timeout+5)
                 for script in run_scripts:
-                    process = await asyncio.create_subprocess_shell(script, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+                    # own session => cancel can signal the whole process tree (stop_local_process)
+                    process = await asyncio.create_subprocess_shell(script, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, start_new_session=sys.platform != "win32")
                     running_processes.append(process)
-                print(running_processes)
-        else:
-            transfer_file = []
-        # keep sending request until task scheduled on all client
-        running_map_url_data = {f"http://{control_ip}:8000/simulation/run": running_request_data[control_ip] for control_ip in running_request_data}    
-        print("\n\n\n\nksdjfdolsdj\n")
-        print(running_map_url_data)
-        await keep_sending_post_request_until_all_ok(db_session, simulation, running_map_url_data, map_ip_to_alias_name)
+                    await wait_local_server_ready(progress, process)
+
+        async def run_network(ssid):
+            nonlocal have_temp_profile, have_monitor_data
+            this_device_connected_ip = None
+            if not parsed_node_configs[ssid]["is_target_ap"]:
+                await configure_access_point(ssid)
+            await pipeline.enter(ssid, "configuring client wifi")
+            await configure_clients(ssid)
+            if parsed_node_configs[ssid]["is_target_ap"]:
+                have_temp_profile = True
+                this_device_connected_ip = await connect_this_device(ssid)
+            # synchronized_start => wait here for every other network
+            await pipeline.enter(ssid, "running simulation")
+            if parsed_node_configs[ssid]["is_target_ap"]:
+                await start_this_device_server(ssid)
+            network_running_request_data = build_running_request_data(ssid, this_device_connected_ip)
+            # some agent may already running => monitor data have to be collected (or cancel sent) even this phase fail
+            running_request_data.update(network_running_request_data)
+            have_monitor_data = True
+            # keep sending request until task scheduled on all node of this network
+            run_outcomes.update(await keep_sending_post_request_until_all_ok(progress, "/simulation/run", network_running_request_data, map_ip_to_alias_name, phase_deadline=RUN_DEADLINE))
+
+        await pipeline.run(run_network)
+        longest_timeout = max([parsed_node_configs[ssid]["clients"][control_ip]["timeout"] for ssid in parsed_node_configs for control_ip in parsed_node_configs[ssid]["clients"]], default=0)
+        # from here agents run by themselves, enough to finish the run after restart
+        progress.set_checkpoint(
+            {
+                "running_request_data": running_request_data,
+                "map_ip_to_alias_name": map_ip_to_alias_name,
+                "transfer_file": transfer_file,
+                "have_local_server": len(running_processes) > 0,
+                "run_deadline": time.time() + longest_timeout + RUN_STATE_GRACE,
+            },
+            {control_ip: "running" for control_ip in running_request_data}
+        )
+        checkpointed = True
+        await progress.flush()
+        raise_if_not_all_ok(run_outcomes, "starting simulation")
         # polling until all completed
-        have_monitor_data = True
-        polling_urls = {f"http://{control_ip}:8000/simulation/state": None for control_ip in running_request_data}
-        finish_urls = set()
+        state_polling = asyncio.ensure_future(poll_agent_states(running_request_data, on_agent_state, log_agent_error, longest_timeout + RUN_STATE_GRACE, listener.pushed("simulation_state")))
         finish_process = []
-        while True:
-            if len(polling_urls) != len(finish_urls):
-                polling_results = await send_multiple_get_request(polling_urls, finish_urls)
-                for result in polling_results:
-                    # print(result)
-                    if issubclass(type(result), Exception):
-                        if result is asyncio.CancelledError:
-                            raise result
-                        if type(result.args[0]) is aiohttp.client_reqrep.ConnectionKey:
-                            simulation.state_message += f"{map_ip_to_alias_name[result.args[0].host]} {time.time()}: {str(result)}\n"
-                        else:
-                            simulation.state_message += str(result)+"\n"
-                    else:
-                        if result[0]["state"] == "finish":
-                            finish_urls.add(result[1])
-                            # alias_name or control_ip
-                            # print("\n\n\n", result[0])
-                        simulation.state_message += result[0]["new_state_message"]
-            if len(running_processes) != len(finish_process):
-                for process in running_processes:
-                    print(process)
-                    try:
-                        print("AB")
-                        stdout = await asyncio.wait_for(process.stdout.read(1024), timeout=0.01)
-                        if not stdout:
-                            finish_process.append(process)
-                            # process is finish writing (write eof to buffer)
-                            continue
-                        print("aaaa", stdout.decode())
-                        simulation.state_message += f"this_device {time.time()}: {stdout.decode()}"
-                    except asyncio.TimeoutError:
-                        print("A")
-                        pass
-            db_session.add(simulation)
-            await db_session.commit()
-            if len(running_processes) == len(finish_process) and len(polling_urls) == len(finish_urls):
-                break
-            await asyncio.sleep(2)
+        try:
+            while True:
+                if len(running_processes) != len(finish_process):
+                    await read_local_process_output(progress, running_processes, finish_process)
+                if len(running_processes) == len(finish_process) and state_polling.done():
+                    break
+                if state_polling.done():
+                    await asyncio.sleep(2)
+                else:
+                    await asyncio.wait({state_polling}, timeout=2)
+        finally:
+            state_polling.cancel()
+        raise_if_not_all_ok(state_polling.result(), "running simulation")
         
     except asyncio.CancelledError:
-        async with lock:
-            simulation.state = "cancelling"
-            db_session.add(simulation)
-            await db_session.commit()
-        # retry 3 time
+        # once agents are running the checkpoint is written, shutdown leave them running and the next startup resume it
+        if scheduler.shutting_down and checkpointed:
+            detached = True
+            progress.log(None, "control server is shutting down, simulation is left running on agents")
+            raise
+        await progress.set_state("cancelling")
         if have_monitor_data:
-            map_url_data = {f"http://{control_ip}:8000/simulation/cancel": {} for control_ip in running_request_data}   
-            polling_urls = {f"http://{control_ip}:8000/simulation/state": None for control_ip in running_request_data}
-            finish_urls = set()
-            polled_urls = set()
-            cnt = 0
-            while cnt < 3:
-                print("cnt", cnt, map_url_data)
-                tasks = [post_request(url, map_url_data[url]) for url in map_url_data if url not in finish_urls]
-                results = await asyncio.gather(*tasks, return_exceptions=True)
-                print(results)
-                for result in results:
-                    if issubclass(type(result), Exception):
-                        if result is asyncio.CancelledError:
-                            raise result
-                        print(str(result), result.args)
-                        if result.args and len(result.args) >= 1 and type(result.args[0]) is aiohttp.client_reqrep.ConnectionKey:
-                            simulation.state_message += f"{map_ip_to_alias_name[result.args[0].host]} {time.time()}: {str(result)}\n"
-                        else:
-                            simulation.state_message += str(result)+"\n"
-                        # commit()
-                    else:
-                        finish_urls.add(result[1])
-                        simulation.state_message += f"{map_ip_to_alias_name[result[1].split(':')[1][2:]]} {time.time()} : {result[0]}\n"
-                        # commit
-                polling_results = await send_multiple_get_request(polling_urls, polled_urls)
-                for result in polling_results:
-                    # print(result)
-                    if issubclass(type(result), Exception):
-                        if result is asyncio.CancelledError:
-                            raise result
-                        if type(result.args[0]) is aiohttp.client_reqrep.ConnectionKey:
-                            simulation.state_message += f"{map_ip_to_alias_name[result.args[0].host]} {time.time()}: {str(result)}\n"
-                        else:
-                            simulation.state_message += str(result)+"\n"
-                    else:
-                        if result[0]["state"] == "finish":
-                            polled_urls.add(result[1])
-                            # alias_name or control_ip
-                            # print("\n\n\n", result[0])
-                        simulation.state_message += result[0]["new_state_message"]
-                db_session.add(simulation)
-                await db_session.commit()
-                if len(map_url_data) == len(finish_urls):
-                    break
-                await asyncio.sleep(2)
-                cnt += 1
+            all_cancelled = await cancel_agents(progress, running_request_data, map_ip_to_alias_name, on_agent_state, log_agent_error, listener.pushed("simulation_state"))
             if have_temp_profile:
                 print(time.time())
                 for process in running_processes:
@@ -317,70 +445,91 @@ async def simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, request
                         # process.terminate()
                         # os.kill(process.pid, signal.SIGTERM)
                         print(process.pid)
-                        result = subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], stdout=subprocess.PIPE)
-                        simulation.state_message += f"this_device {time.time()}: {result.stdout.decode()}"
+                        progress.log("this_device", stop_local_process(process))
                         print("is this task death")
                         print(process.returncode)
                         stdout, stderr = await process.communicate()
                         print(process.returncode)
-                        simulation.state_message += f"this_device {time.time()}: {stdout.decode()}"
-                db_session.add(simulation)
-                await db_session.commit()
+                        progress.log("this_device", stdout.decode())
                 print(time.time())
             
-            async with lock:
-                if len(map_url_data) == len(finish_urls):
-                    simulation.state = "cancelled [terminate with success]"
-                else:
-                    simulation.state = "cancelled [terminate with error]"
-                db_session.add(simulation)
-                await db_session.commit()
+            if all_cancelled:
+                await progress.set_state("cancelled [terminate with success]")
+            else:
+                await progress.set_state("cancelled [terminate with error]")
         else:
             print("hello")
-            async with lock:
-                simulation.state = "cancelled [terminate with success]"
-                db_session.add(simulation)
-                await db_session.commit()
+            await progress.set_state("cancelled [terminate with success]")
         print("cancel")
     except Exception as e:
         print("????????\n")
-        async with lock:
-            simulation.state = "failed"
-            simulation.state_message += f"failed with unexpected exception: {str(e)}"
-            db_session.add(simulation)
-            await db_session.commit()
+        progress.log(None, f"failed with unexpected exception: {str(e)}", level="error")
+        if have_monitor_data and not detached:
+            # started agents keep sending otherwise (failed configure, start or state polling)
+            await cancel_agents(progress, running_request_data, map_ip_to_alias_name, on_agent_state, log_agent_error, listener.pushed("simulation_state"))
+        await progress.set_state("failed")
         print(str(e))
     finally:
-        async with lock:
-            if simulation.state == "running simulation":
-                simulation.state = "terminating"
-                db_session.add(simulation)
-                await db_session.commit()
-        if have_monitor_data:
-            simulation_data = {control_ip: {"Tx_power": None, "Signal": None, "Noise": None, "BitRate": None, "ping_RTT": None} for control_ip in running_request_data}
-            polling_urls = {f"http://{control_ip}:8000/simulation/monitor": None for control_ip in running_request_data}
-            polling_results = await send_multiple_get_request(polling_urls, {})
-            for result in polling_results:
-                # print(result)
-                if issubclass(type(result), Exception):
-                    if result is asyncio.CancelledError:
-                        raise result
-                else:
-                    ip = str(result[1]).split(":")[1][2:]
-                    print(result[0])
-                    simulation_data[ip] = result[0]
-                    print(simulation_data[ip])
-            for file_path in transfer_file:
-                data = read_json_file_and_delete_file(file_path)
-                if data:
-                    simulation_data.update({"this_device": data})
-            simulation.simulation_data = simulation_data
-            db_session.add(simulation)
-            await db_session.commit()
-        async with lock:
-            if simulation.state == "terminating":
-                simulation.state = "finished"
-                db_session.add(simulation)
-                await db_session.commit()
-        request.app.running_task = None
-        print(simulation.state_message, simulation.state)
\ No newline at end of file
+        # no more background flush from here, db_session is used directly
+        await progress.close()
+        if listener is not None:
+            listener.close()
+        if not detached:
+            await finish_simulation(progress, db_session, simulation, have_monitor_data, running_request_data, transfer_file, log_agent_error)
+        scheduler.finish(simulation.id)
+
+async def run_scheduled_simulation(lock: asyncio.Lock, simulation_id: int, parsed_node_configs: dict, target_ssid_password: str, target_ssid_radio: RadioModeEnum):
+    # started by utils.scheduler, maybe long after the run request => own db session instead of the request one
+    async with sessionmanager.session() as db_session:
+        simulation = await db_session.get(Simulation, simulation_id)
+        await simulation_tasks(lock, db_session, simulation, parsed_node_configs, target_ssid_password, target_ssid_radio)
+
+async def resume_simulation_tasks(lock: asyncio.Lock, db_session: AsyncSession, simulation: Simulation, run_context: dict, agent_progress: dict):
+    # continue a run that was in "running simulation", "cancelling" or "terminating" when control server stopped
+    # agents kept running by themselves, only polling/cancel/monitor collection is left (see utils.recovery)
+    progress = ProgressWriter(db_session, simulation, lock)
+    progress.start()
+    progress.set_checkpoint(run_context, agent_progress)
+    running_request_data = run_context["running_request_data"]
+    map_ip_to_alias_name = run_context["map_ip_to_alias_name"]
+    log_agent_error, on_agent_state = agent_callbacks(progress, map_ip_to_alias_name)
+    listener = listen_agent_events(progress, map_ip_to_alias_name)
+    detached = False
+    try:
+        progress.log(None, f"control server restarted, resuming simulation that was {simulation.state}")
+        if simulation.state == "running simulation":
+            if run_context["have_local_server"]:
+                progress.log("this_device", "simulation server of this device was stopped with control server, its data is lost", level="error")
+            not_finished = {control_ip: data for control_ip, data in running_request_data.items() if agent_progress.get(control_ip) != "finish"}
+            outcomes = await poll_agent_states(not_finished, on_agent_state, log_agent_error, max(RESUME_MIN_DEADLINE, run_context["run_deadline"] - time.time()), listener.pushed("simulation_state"))
+            raise_if_not_all_ok(outcomes, "running simulation")
+        elif simulation.state == "cancelling":
+            if await cancel_agents(progress, running_request_data, map_ip_to_alias_name, on_agent_state, log_agent_error, listener.pushed("simulation_state")):
+                await progress.set_state("cancelled [terminate with success]")
+            else:
+                await progress.set_state("cancelled [terminate with error]")
+    except asyncio.CancelledError:
+        if scheduler.shutting_down:
+            detached = True
+            progress.log(None, "control server is shutting down, simulation is left running on agents")
+            raise
+        await progress.set_state("cancelling")
+        if await cancel_agents(progress, running_request_data, map_ip_to_alias_name, on_agent_state, log_agent_error, listener.pushed("simulation_state")):
+            await progress.set_state("cancelled [terminate with success]")
+        else:
+            await progress.set_state("cancelled [terminate with error]")
+    except Exception as e:
+        progress.log(None, f"failed with unexpected exception: {str(e)}", level="error")
+        await progress.set_state("failed")
+    finally:
+        await progress.close()
+        listener.close()
+        if not detached:
+            await finish_simulation(progress, db_session, simulation, True, running_request_data, run_context["transfer_file"], log_agent_error)
+        scheduler.finish(simulation.id)
+
+async def run_resumed_simulation(lock: asyncio.Lock, simulation_id: int):
+    async with sessionmanager.session() as db_session:
+        simulation = await db_session.get(Simulation, simulation_id)
+        checkpoint = await db_session.get(SimulationCheckpoint, simulation_id)
+        await resume_simulation_tasks(lock, db_session, simulation, checkpoint.run_context, checkpoint.agent_progress)
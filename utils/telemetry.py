@@ -0,0 +1,194 @@
+import json, os, zlib
+import numpy as np
+from utils.sample_store import SAMPLE_SERIES, NO_PEER, to_records
+from simulation.telemetry_format import (
+    TELEMETRY_MAGIC, TELEMETRY_VERSION, TELEMETRY_HEADER, SECTION_HEADER, CODEC_NONE, CODEC_ZLIB, SECTION_SAMPLES, SECTION_FIELD,
+    telemetry_header, section_header,
+)
+
+# telemetry (raw samples + small fields of one node) from agents and local simulation server
+#   binary   => TELEMETRY_CONTENT_TYPE / file starting with TELEMETRY_MAGIC
+#   ndjson   => one json per line, {"series", "peer", "samples"} / {"field", "value"} (utils.tasks.fetch_monitor_data)
+#   json     => the whole monitor data at once, kept as fallback for agent that support neither
+# both stream formats are decoded chunk by chunk into the same items:
+#   ("field", name, value) / ("samples", series, peer, samples)
+# binary format is defined in simulation/telemetry_format.py (numpy free, shared with the local simulation server)
+
+TELEMETRY_CONTENT_TYPE = "application/vnd.wifi-monitor.telemetry"
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+# preferred first, any other response is parsed as whole json
+STREAM_CONTENT_TYPES = [TELEMETRY_CONTENT_TYPE, NDJSON_CONTENT_TYPE]
+
+def _section(kind: int, name: str, peer: str, record_size: int, count: int) -> bytes:
+    return section_header(kind, name.encode(), b"" if peer == NO_PEER else peer.encode(), record_size, count)
+
+def encode_telemetry(node_data: dict, codec: int = CODEC_ZLIB, chunk_records: int = 65536):
+    # monitor data of one node (as in json) => iterator of binary chunks
+    compressor = zlib.compressobj(1) if codec == CODEC_ZLIB else None
+    def output(data):
+        return compressor.compress(data) if compressor is not None else data
+    yield telemetry_header(codec)
+    for field, value in node_data.items():
+        if field in SAMPLE_SERIES:
+            continue
+        payload = json.dumps(value).encode()
+        yield output(_section(SECTION_FIELD, field, NO_PEER, 0, len(payload)) + payload)
+    for series, (dtype, is_map_by_peer) in SAMPLE_SERIES.items():
+        if node_data.get(series) is None:
+            continue
+        by_peer = node_data[series] if is_map_by_peer else {NO_PEER: node_data[series]}
+        for peer, samples in by_peer.items():
+            for i in range(0, max(len(samples), 1), chunk_records):
+                records = to_records(series, samples[i:i+chunk_records])
+                yield output(_section(SECTION_SAMPLES, series, peer, dtype.itemsize, len(records)) + records.tobytes())
+    if compressor is not None:
+        yield compressor.flush()
+
+class TelemetryDecoder:
+    # binary format, section payload is given out as soon as whole records arrive (big section is not buffered whole)
+    def __init__(self):
+        self._head = bytearray()
+        self._codec = None
+        self._decompressor = None
+        self._buffer = bytearray()
+        # samples section being read => [series, peer, record size, records left, dtype or None (unknown series, skipped)]
+        self._section = None
+
+    def feed(self, data: bytes) -> list:
+        if self._codec is None:
+            self._head += data
+            if len(self._head) < TELEMETRY_HEADER.size:
+                return []
+            magic, version, codec, _ = TELEMETRY_HEADER.unpack_from(self._head)
+            if magic != TELEMETRY_MAGIC:
+                raise ValueError("not a telemetry stream")
+            if version > TELEMETRY_VERSION:
+                raise ValueError(f"telemetry version {version} is not supported (up to {TELEMETRY_VERSION})")
+            if codec not in (CODEC_NONE, CODEC_ZLIB):
+                raise ValueError(f"telemetry codec {codec} is not supported")
+            self._codec = codec
+            self._decompressor = zlib.decompressobj() if codec == CODEC_ZLIB else None
+            data = bytes(self._head[TELEMETRY_HEADER.size:])
+            self._head = None
+        if self._decompressor is not None:
+            data = self._decompressor.decompress(data)
+        self._buffer += data
+        return self._parse()
+
+    def _parse(self) -> list:
+        items = []
+        offset = 0
+        buffer = self._buffer
+        while True:
+            if self._section is not None:
+                series, peer, record_size, left, dtype = self._section
+                count = min(left, (len(buffer) - offset) // record_size) if record_size else left
+                if count > 0 or left == 0:
+                    if dtype is not None:
+                        items.append(("samples", series, peer, np.frombuffer(bytes(buffer[offset:offset+count*record_size]), dtype=dtype)))
+                    offset += count * record_size
+                    left -= count
+                if left > 0:
+                    self._section[3] = left
+                    break
+                self._section = None
+            if len(buffer) - offset < SECTION_HEADER.size:
+                break
+            kind, name_length, peer_length, record_size, count = SECTION_HEADER.unpack_from(buffer, offset)
+            start = offset + SECTION_HEADER.size
+            payload_start = start + name_length + peer_length
+            if kind == SECTION_FIELD:
+                if len(buffer) < payload_start + count:
+                    break
+                name = bytes(buffer[start:start+name_length]).decode()
+                items.append(("field", name, json.loads(bytes(buffer[payload_start:payload_start+count]))))
+                offset = payload_start + count
+                continue
+            if kind != SECTION_SAMPLES:
+                raise ValueError(f"unknown telemetry section {kind}")
+            if len(buffer) < payload_start:
+                break
+            name = bytes(buffer[start:start+name_length]).decode()
+            peer = bytes(buffer[start+name_length:payload_start]).decode() or NO_PEER
+            # series this version doesn't know is skipped
+            dtype = SAMPLE_SERIES[name][0] if name in SAMPLE_SERIES else None
+            if dtype is not None and dtype.itemsize != record_size:
+                raise ValueError(f"{name}: record size {record_size} != {dtype.itemsize}")
+            self._section = [name, peer, record_size, count, dtype]
+            offset = payload_start
+        del buffer[:offset]
+        return items
+
+    def close(self) -> list:
+        if self._codec is None or self._section is not None or self._buffer or (self._decompressor is not None and not self._decompressor.eof):
+            raise ValueError("telemetry stream is truncated")
+        return []
+
+class NdjsonDecoder:
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def _items(self, lines: bytes) -> list:
+        items = []
+        for line in lines.split(b"\n"):
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if "field" in message:
+                items.append(("field", message["field"], message["value"]))
+            else:
+                items.append(("samples", message["series"], message.get("peer", NO_PEER), message["samples"]))
+        return items
+
+    def feed(self, data: bytes) -> list:
+        self._buffer += data
+        end = self._buffer.rfind(b"\n")
+        if end == -1:
+            return []
+        lines = bytes(self._buffer[:end])
+        del self._buffer[:end+1]
+        return self._items(lines)
+
+    def close(self) -> list:
+        lines = bytes(self._buffer)
+        self._buffer = bytearray()
+        return self._items(lines)
+
+def telemetry_decoder(content_type: str):
+    return TelemetryDecoder() if content_type == TELEMETRY_CONTENT_TYPE else NdjsonDecoder()
+
+def write_telemetry(items: list, sample_writer, metadata: dict):
+    # sample_writer => utils.sample_store.NodeSampleWriter, small fields are collected in metadata
+    for item in items:
+        if item[0] == "field":
+            metadata[item[1]] = item[2]
+        elif item[1] in SAMPLE_SERIES:
+            sample_writer.write(item[1], item[3], item[2])
+        else:
+            metadata.setdefault(item[1], []).extend(item[3])
+
+def read_telemetry_file_and_delete_file(file_path: str, sample_writer, chunk_size: int = 1 << 20):
+    # result file of local simulation server (binary or json) => metadata, samples go to sample_writer
+    try:
+        with open(file_path, "rb") as file:
+            is_binary = file.read(len(TELEMETRY_MAGIC)) == TELEMETRY_MAGIC
+            file.seek(0)
+            if is_binary:
+                decoder = TelemetryDecoder()
+                metadata = {}
+                while True:
+                    chunk = file.read(chunk_size)
+                    if not chunk:
+                        break
+                    write_telemetry(decoder.feed(chunk), sample_writer, metadata)
+                write_telemetry(decoder.close(), sample_writer, metadata)
+            else:
+                metadata = sample_writer.write_node_data(json.load(file))
+        os.remove(file_path)
+        return metadata
+    except FileNotFoundError:
+        print(f"The file {file_path} does not exist.")
+        return None
+    except (json.JSONDecodeError, ValueError) as e:
+        print(f"Error decoding {file_path}: {str(e)}")
+        return None
@@ -1,10 +1,11 @@
-from models.models import Scenario, Simulation, NodeConfiguration, NetworkModeEnum
+from models.models import Scenario, NodeConfiguration, NetworkModeEnum
 from models.schemas import NodeConfigRequest
 from typing import List
 from fastapi import HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, update, and_
-import asyncio, psutil, aiohttp, subprocess, time, json, os
+from utils.agent_client import agent_client
+from utils.fanout import fan_out
+import asyncio, psutil, subprocess, time
     
 
 def parse_network_from_node_config(node_configs: List[NodeConfiguration], target_ap_ssid: str) -> dict:
@@ -93,10 +94,21 @@ async def run_subprocess(command: str):
         raise RUN_SUBPROCESS_EXCEPTION(stderr.decode())
     return stdout, stderr
 
+# "aggregate" => server keep only per-second rollup of every client, "raw" => also every packet
+LOCAL_SERVER_CAPTURE = "aggregate"
+# late send slot "catch-up" | "skip", socket io "asyncio" | "batch" (for high packet rate)
+#   batch => linux: recvmmsg / sendmmsg, macos / bsd: batched recvfrom / sendto loop,
+#            windows: not supported by the default proactor event loop, server fall back to asyncio io
+LOCAL_SERVER_LATE_POLICY = "catch-up"
+LOCAL_SERVER_IO = "asyncio"
+# > 1 => that many server processes sharing port 8888 (SO_REUSEPORT, linux only), for many clients on the target ap
+LOCAL_SERVER_WORKERS = 1
+
 def _generate_script_for_run_ap_simulation(alias_name: str, mode, timeout):
     if mode == "deterministic":
-        tmp_file = f"udp_server_{str(time.time()).replace('.', '_')}.json"
-        return f"python -u ./simulation/server/udp_window_deterministic.py {alias_name} {timeout} {tmp_file}", tmp_file
+        # binary telemetry (utils.telemetry), a .json file name make the server write json instead
+        tmp_file = f"udp_server_{str(time.time()).replace('.', '_')}.wmt"
+        return f"python -u ./simulation/server/udp_window_deterministic.py {alias_name} {timeout} {tmp_file} {LOCAL_SERVER_CAPTURE} {LOCAL_SERVER_LATE_POLICY} {LOCAL_SERVER_IO} {LOCAL_SERVER_WORKERS}", tmp_file
     return None, None
 def generate_scripts_for_run_simulation(scenario_mode, timeout):
     scripts = []; tmp_files = []
@@ -183,73 +195,38 @@ async def _configure_server_connection(ssid, password):
         return True
     return False
 
-async def post_request(url: str, data: dict):
-    # print(data)
-    async with aiohttp.ClientSession() as session:
-        response = await session.post(
-            url=url,
-            json=data,
-            headers={"Content-Type": "application/json"}
-        )
-        response.raise_for_status()
-        return (await response.json(content_type=None)), str(response.url)
+async def post_request(url: str, data: dict, timeout: float = None):
+    return (await agent_client.post(url, data, timeout))
     
-async def get_request(url: str, params: dict = {}):
-    async with aiohttp.ClientSession() as session:
-        response = await session.get(
-            url=url,
-            params=params
-        )
-        # print(str(response.url))
-        return (await response.json(content_type=None)), str(response.url)
+async def get_request(url: str, params: dict = {}, timeout: float = None):
+    return (await agent_client.get(url, params, timeout))
     
-async def keep_sending_post_request_until_all_ok(db_session: AsyncSession, simulation: Simulation, map_url_data: dict,  map_ip_to_alias_name: dict, update_exception_to_state: bool = True):
-    ok_url = set() # set of url that already recieve 200 status response
-    while True:
-        tasks = [post_request(url, map_url_data[url]) for url in map_url_data if url not in ok_url]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        for result in results:
-            if issubclass(type(result), Exception):
-                if result is asyncio.CancelledError:
-                    raise result
-                # print(result, type(result.args), type(result.args[0]), (result.args[0]).host)
-                # aiohttp.client_reqrep.ConnectionKey
-                if update_exception_to_state:
-                    if type(result.args[0]) is aiohttp.client_reqrep.ConnectionKey:
-                        simulation.state_message += f"{map_ip_to_alias_name[result.args[0].host]} {time.time()}: {str(result)}\n"
-                    else:
-                        print(result, type(result.args), result.args)
-                        print(type(result.args[0]), result.args[0])
-                        simulation.state_message += str(result)+"\n"
-            else:
-                ok_url.add(result[1])
-                simulation.state_message += f"{map_ip_to_alias_name[result[1].split(':')[1][2:]]} {time.time()}: {result[0]}\n"
-        # commit (once per loop)
-        db_session.add(simulation)
-        await db_session.commit()
-        if len(map_url_data) == len(ok_url):
-            break
-        await asyncio.sleep(2)
-
-                
-async def send_multiple_get_request(urls: dict, except_urls: set):
-   tasks = [get_request(url, urls[url]) for url in urls if url not in except_urls]
-   results = await asyncio.gather(*tasks, return_exceptions=True)
-   return results
-
-def read_json_file_and_delete_file(file_path):
-    try:
-        with open(file_path, 'r') as file:
-            data = json.load(file)
-        os.remove(file_path)
-        return data
-    except FileNotFoundError:
-        print(f"The file {file_path} does not exist.")
-        return None
-    except json.JSONDecodeError:
-        print(f"Error decoding JSON in {file_path}. Please check the file format.")
-        return None
-
+async def get_stream_request(url: str, params: dict, timeout: float, stream_types: list, on_chunk):
+    return (await agent_client.get_stream(url, params, timeout, stream_types, on_chunk))
+
+def agent_url(control_ip: str, path: str) -> str:
+    return f"http://{control_ip}:8000{path}"
+
+def describe_request_exception(e: Exception) -> str:
+    # timeout error has empty str()
+    return str(e) or type(e).__name__
+
+async def keep_sending_post_request_until_all_ok(progress, path: str, map_ip_data: dict, map_ip_to_alias_name: dict, update_exception_to_state: bool = True, phase_deadline: float = None, max_attempts: int = None):
+    # POST map_ip_data[control_ip] to every agent, retry (with backoff) until 2xx, phase_deadline or max_attempts
+    # progress => utils.progress.ProgressWriter of the simulation
+    def on_result(control_ip, result):
+        progress.log(map_ip_to_alias_name[control_ip], result[0])
+    def on_error(control_ip, e):
+        if update_exception_to_state:
+            progress.log(map_ip_to_alias_name[control_ip], describe_request_exception(e), level="error")
+    return (await fan_out(
+        map_ip_data,
+        lambda control_ip, timeout: post_request(agent_url(control_ip, path), map_ip_data[control_ip], timeout),
+        on_result=on_result,
+        on_error=on_error,
+        phase_deadline=phase_deadline,
+        max_attempts=max_attempts,
+    ))
 
 # (RequestInfo(
 #     url=URL('http://192.168.1.1:8000/configure/client'), 